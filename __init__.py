@@ -0,0 +1,7 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+from .api import Build, BuildResult, FailureMode, GetProject, Project, StepResult, StepStatus
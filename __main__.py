@@ -4,7 +4,21 @@ Licensed under the MIT license.
 See LICENSE file in the project root for full license information.
 '''
 
-from app import Application
+import importlib.util
+import os
+import sys
+
+if __package__ in (None, ""):
+    # Run as a directory or file rather than with -m. Modules import each other relative to the package, so it is loaded
+    # as one under its own name first, nothing is added to the search path
+    packageDir = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location("zbuild", os.path.join(packageDir, "__init__.py"), submodule_search_locations = [packageDir])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = package
+    spec.loader.exec_module(package)
+    from zbuild.app import Application
+else:
+    from .app import Application
 
 if __name__ == "__main__":
     Application().Run()
@@ -0,0 +1,162 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import copy
+import os
+from pathlib import Path
+import threading
+from typing import Optional
+
+from .constants import ResultCode
+from .core.resources import ResourceUsage
+from .core.scheduler import FailureMode, Job
+from .services.compiler import BuildCache, CompilerService, StepStatus
+from .services.configuration import ConfigurationService, PathType
+from .services.output import OutputService
+
+class StepResult:
+    def __init__(self, name: str, targetPath: Path, status: str, compileTime: float, linkTime: float, usage: Optional[ResourceUsage] = None):
+        # usage is only known for steps that ran, on platforms with wait4
+        self.name = name
+        self.targetPath = targetPath
+        self.status = status
+        self.compileTime = compileTime
+        self.linkTime = linkTime
+        self.usage = usage
+
+class BuildResult:
+    def __init__(self, buildName: str, resultCode: int):
+        self.buildName = buildName
+        self.resultCode = resultCode
+        self.steps: list[StepResult] = []
+        self.diagnostics: list[dict] = []
+        self.errorCount = 0
+        self.warningCount = 0
+        self.wallTime = 0.0
+
+    @property
+    def isSuccess(self):
+        return self.resultCode == ResultCode.SUCCESS
+
+class Project:
+    def __init__(self, projectRoot: Path, configRoot: Optional[Path] = None, isPrinting: bool = False):
+        # Without a config root the configuration directory next to zbuild itself is used, as on the command line
+        self.projectRoot = Path(projectRoot)
+        self.config = ConfigurationService(Path(__file__).parent.absolute() if configRoot is None else configRoot)
+        self.isPrinting = isPrinting
+        self.output: Optional[OutputService] = None
+        self.cache: Optional[BuildCache] = None
+        self.lastResultCode = ResultCode.SUCCESS
+        self.__rootConfigStamp: Optional[tuple[int, int]] = None
+
+        # Builds of one project share output directories and state files, so they take turns
+        self.__lock = threading.Lock()
+
+    def Load(self):
+        with self.__lock:
+            return self.__Load()
+
+    def Close(self):
+        with self.__lock:
+            if self.output is not None:
+                self.output.Close()
+                self.output = None
+
+    def Build(self, buildName: str, jobCount: Optional[int] = None, maxLoad: Optional[float] = None, isIncremental: bool = True, failureMode: str = FailureMode.STOP):
+        # Incremental builds only rebuild stale steps, otherwise the configuration is wiped and rebuilt as with --build
+        with self.__lock:
+            self.lastResultCode = self.__Load()
+            if not self.lastResultCode == ResultCode.SUCCESS:
+                return BuildResult(buildName, self.lastResultCode)
+
+            config = copy.copy(self.config)
+            self.lastResultCode = config.LoadBuildConfig(buildName)
+            if not self.lastResultCode == ResultCode.SUCCESS:
+                self.output.SendError(f"Could not load the build configuration for '{buildName}'")
+                return BuildResult(buildName, self.lastResultCode)
+
+            self.output.SendInfoLogOnly(f"Build of '{buildName}' requested through the API")
+            compiler = CompilerService([config], self.output, jobCount, maxLoad, self.cache, failureMode = failureMode)
+            self.lastResultCode = compiler.Update() if isIncremental else compiler.Compile()
+            return self.__GetBuildResult(compiler, buildName)
+
+    def __Load(self):
+        # The root configuration is read again once it changed on disk, along with the log and caches that depend on it
+        rootConfigStamp = self.__GetRootConfigStamp()
+        if self.output is not None:
+            if rootConfigStamp == self.__rootConfigStamp:
+                return ResultCode.SUCCESS
+
+            self.output.SendInfoLogOnly("Root configuration changed on disk, loading it again")
+            self.output.Close()
+            self.output = None
+            self.cache = None
+
+        self.lastResultCode = self.config.CheckConfigDir()
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        self.lastResultCode = self.config.LoadRootConfig()
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        self.lastResultCode = self.config.SetProjectRoot(self.projectRoot)
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        self.output = OutputService(self.config.GetLogPath(PathType.ABSOLUTE), self.isPrinting)
+        self.cache = BuildCache(self.config.GetProjectRoot())
+        self.__rootConfigStamp = rootConfigStamp
+        return ResultCode.SUCCESS
+
+    def __GetRootConfigStamp(self):
+        try:
+            stat = os.stat(self.config.GetConfigDir() / self.config.GetRootConfigFilename())
+        except OSError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def __GetBuildResult(self, compiler: CompilerService, buildName: str):
+        result = BuildResult(buildName, self.lastResultCode)
+        for step in compiler.GetBuildSteps(buildName):
+            result.steps.append(StepResult(
+                step.name,
+                self.config.GetProjectRoot() / step.targetPath,
+                compiler.GetStepStatus(step),
+                sum(self.__GetDuration(j) for j in step.compileJobs),
+                self.__GetDuration(step.linkJob),
+                step.usage
+            ))
+
+        diagnostics = compiler.GetDiagnostics(buildName)
+        if diagnostics is not None:
+            result.diagnostics = [d.ToDict() for d in diagnostics.diagnostics.values()]
+            result.errorCount = diagnostics.errorCount
+            result.warningCount = diagnostics.warningCount
+
+        result.wallTime = compiler.wallTime
+        return result
+
+    def __GetDuration(self, job: Optional[Job]):
+        return 0.0 if job is None or job.duration is None else job.duration
+
+_projects: dict[tuple[Path, Optional[Path]], Project] = {}
+_projectsLock = threading.Lock()
+
+def GetProject(projectRoot: Path, configRoot: Optional[Path] = None):
+    # Projects are kept for the life of the process so repeated builds reuse loaded configuration and warm caches
+    key = (Path(projectRoot).resolve(), None if configRoot is None else Path(configRoot).resolve())
+    with _projectsLock:
+        project = _projects.get(key)
+        if project is None:
+            project = Project(key[0], key[1])
+            _projects[key] = project
+
+    return project
+
+def Build(projectRoot: Path, buildName: str, jobCount: Optional[int] = None, maxLoad: Optional[float] = None, isIncremental: bool = True, configRoot: Optional[Path] = None, failureMode: str = FailureMode.STOP):
+    return GetProject(projectRoot, configRoot).Build(buildName, jobCount, maxLoad, isIncremental, failureMode)
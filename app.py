@@ -4,30 +4,43 @@ Licensed under the MIT license.
 See LICENSE file in the project root for full license information.
 '''
 
+import copy
 import os
 from pathlib import Path
+import subprocess
 import sys
 from typing import Any, Callable
 
-from argsd import ArgHelper
-from constants import ResultCode
-from services.compiler import CompilerService
-from services.configuration import ConfigurationService, PathType
-from services.output import OutputService
+from .argsd import ArgHelper
+from .constants import ReservedValues, ResultCode
+from .core.profiling import SelfProfiler
+from .core.scheduler import FailureMode
+from .services.compiler import CompilerService
+from .services.configuration import ConfigurationService, PathType
+from .services.output import OutputService
+from .services.query import QueryService
 
 class Application():
+    PROFILE_REPORT_SIZE = 15
+
     def __init__(self):
         self.lastResultCode = ResultCode.SUCCESS
         self.config = None
         self.output = None
         self.argHelper = ArgHelper()
         self.actions: list[tuple[Callable, Any]] = []
+        self.invocationDir = Path(os.getcwd())
+        self.jobCount = None
+        self.maxLoad = None
+        self.isReportingUsage = False
+        self.isExplainingMisses = False
+        self.failureMode = FailureMode.STOP
+        self.profiler = SelfProfiler()
 
         self.InitArgs()
 
     def Run(self):
-        os.chdir(Path(__file__).parent.absolute())
-        self.config = ConfigurationService()
+        self.config = ConfigurationService(Path(__file__).parent.absolute())
         self.lastResultCode = self.RunStartupChecks()
         if not self.lastResultCode == ResultCode.SUCCESS:
             self.Quit(self.lastResultCode)
@@ -38,8 +51,12 @@ class Application():
         if not self.lastResultCode == ResultCode.SUCCESS:
             self.Quit(self.lastResultCode)
         
+        # Query results are consumed by scripts, everything else printed along with them goes to stderr
+        queryActions = (self.ActionQueryAffected, self.ActionQueryWhy, self.ActionQueryDeps, self.ActionQueryRDeps, self.ActionQueryHistory)
+        isQuery = any(action in queryActions for action, _ in self.actions)
+
         os.chdir(self.config.GetProjectRoot())
-        self.output = OutputService(self.config.GetLogPath(PathType.ABSOLUTE))
+        self.output = OutputService(self.config.GetLogPath(PathType.ABSOLUTE), isResultOnly = isQuery)
         self.output.SendInfoPrintOnly(f"Logging to file '{self.config.GetLogPath(PathType.ABSOLUTE)}'")
         self.output.SendInfoLogOnly(f"New zbuild instance started")
         self.output.SendInfo(f"Running on Python {sys.version}")
@@ -52,6 +69,7 @@ class Application():
         if self.output is None:
             exit(0 if code == ResultCode.SUCCESS else 1)
 
+        self.__StopProfiler()
         exitCode = None
         msg = f"Operation exited with code 0x{code:04x}"
         if code == ResultCode.SUCCESS:
@@ -141,8 +159,9 @@ class Application():
         self.argHelper.AddArg(
             shortName = "b",
             longName  = "build",
-            helpInfo  = "build given configuration",
+            helpInfo  = "build given configurations together, sharing one scan of the source tree and one job pool",
             group     = 1,
+            isMulti   = True,
             varName   = "build_name",
             action    = self.ActionBuild
         )
@@ -150,10 +169,21 @@ class Application():
         self.argHelper.AddArg(
             shortName = "r",
             longName  = "run",
-            helpInfo  = "run given configuration, will build first if executable not found",
+            helpInfo  = "run the executable of given configuration with args, rebuilding only the steps that changed since the last build. Everything after the build name is passed to it, a '--' right after the name is dropped",
             group     = 1,
-            varName   = "build_name",
-            action    = self.ActionInitWorkspace
+            isRemainder = True,
+            varName   = "build_name args",
+            action    = self.ActionRun
+        )
+
+        self.argHelper.AddArg(
+            shortName = "g",
+            longName  = "generate",
+            helpInfo  = "write build files for another build tool from given configurations, supported generators are: ninja",
+            group     = 1,
+            isMulti   = True,
+            varName   = "generator build_name",
+            action    = self.ActionGenerate
         )
 
         self.argHelper.AddArg(
@@ -165,6 +195,125 @@ class Application():
             action    = self.ActionInitWorkspace
         )
 
+        self.argHelper.AddArg(
+            shortName = "j",
+            longName  = "jobs",
+            helpInfo  = "number of compile and link jobs to run at once, defaults to the number of processors",
+            varName   = "count",
+            isOption  = True,
+            action    = self.ActionSetJobCount
+        )
+
+        self.argHelper.AddArg(
+            shortName = "l",
+            longName  = "max-load",
+            helpInfo  = "hold back new jobs while the system load average is above load, defaults to 1.5 times the number of processors",
+            varName   = "load",
+            isOption  = True,
+            action    = self.ActionSetMaxLoad
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "fail-fast",
+            helpInfo  = "stop running jobs as soon as one fails, by default they are allowed to finish",
+            group     = 3,
+            isSwitch  = True,
+            action    = self.ActionEnableFailFast
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "keep-going",
+            helpInfo  = "keep building everything that does not depend on a failed job",
+            group     = 3,
+            isSwitch  = True,
+            action    = self.ActionEnableKeepGoing
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "usage",
+            helpInfo  = "print the CPU time, memory and I/O used by each step and the most expensive units, and save them with the build state",
+            isSwitch  = True,
+            action    = self.ActionEnableUsageReport
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "explain-cache-miss",
+            helpInfo  = "print which recorded inputs differ for every build step that is rebuilt rather than reused",
+            isSwitch  = True,
+            action    = self.ActionEnableMissExplanation
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "profile-self",
+            helpInfo  = "run zbuild under cProfile, save the stats to file and print where its own time went apart from waiting on children",
+            varName   = "file",
+            isOption  = True,
+            action    = self.ActionProfileSelf
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "trace-allocations",
+            helpInfo  = "with --profile-self, also trace memory allocations and print the lines holding the most",
+            isSwitch  = True,
+            action    = self.ActionTraceAllocations
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "affected",
+            helpInfo  = "list the translation units, steps and targets a change to file would rebuild",
+            group     = 2,
+            isMulti   = True,
+            varName   = "build_name file",
+            action    = self.ActionQueryAffected
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "why",
+            helpInfo  = "show the chains of inputs that made object stale",
+            group     = 2,
+            isMulti   = True,
+            varName   = "build_name object",
+            action    = self.ActionQueryWhy
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "deps",
+            helpInfo  = "list what file depends on, optionally limited to depth levels",
+            group     = 2,
+            isMulti   = True,
+            varName   = "build_name file depth",
+            action    = self.ActionQueryDeps
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "rdeps",
+            helpInfo  = "list what depends on file, optionally limited to depth levels",
+            group     = 2,
+            isMulti   = True,
+            varName   = "build_name file depth",
+            action    = self.ActionQueryRDeps
+        )
+
+        self.argHelper.AddArg(
+            shortName = None,
+            longName  = "history",
+            helpInfo  = "show the last count recorded builds of given configuration and what compiles slower than it used to",
+            group     = 2,
+            isMulti   = True,
+            varName   = "build_name count",
+            action    = self.ActionQueryHistory
+        )
+
     def ExecuteActions(self):
         for action, param in self.actions:
             if param is None:
@@ -189,15 +338,225 @@ class Application():
         self.output.SendInfo("Update requested")
         return ResultCode.ERR_NOT_IMPLEMENTED
         
-    def ActionBuild(self, buildName: str):
-        self.output.SendInfo(f"Build requested for configuration '{buildName}'")
+    def ActionBuild(self, buildNames: list[str]):
+        if len(buildNames) == 0:
+            self.argHelper.ShowInvalidUsageMessage("Argument '--build' expects at least one build name")
+            return ResultCode.ERR_ARG_INVALID
+
+        configs = []
+        for buildName in dict.fromkeys(buildNames):
+            self.output.SendInfo(f"Build requested for configuration '{buildName}'")
+
+            self.lastResultCode, config = self.__LoadBuildConfig(buildName)
+            if not self.lastResultCode == ResultCode.SUCCESS:
+                return self.lastResultCode
+
+            configs.append(config)
+
+        return CompilerService(configs, self.output, self.jobCount, self.maxLoad, isReportingUsage = self.isReportingUsage, failureMode = self.failureMode, isExplainingMisses = self.isExplainingMisses).Compile()
 
-        self.lastResultCode = self.config.LoadBuildConfig(buildName)
+    def ActionRun(self, params: list[str]):
+        if len(params) == 0:
+            self.argHelper.ShowInvalidUsageMessage("Argument '--run' expects a build name")
+            return ResultCode.ERR_ARG_INVALID
+
+        buildName = params[0]
+        self.output.SendInfo(f"Run requested for configuration '{buildName}'")
+        self.lastResultCode, config = self.__LoadBuildConfig(buildName)
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        compiler = CompilerService([config], self.output, self.jobCount, self.maxLoad, isReportingUsage = self.isReportingUsage, failureMode = self.failureMode, isExplainingMisses = self.isExplainingMisses)
+        self.lastResultCode = compiler.Update()
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        # The last standalone target is the one to run, earlier steps usually build what it links against
+        standaloneSteps = [s for s in compiler.GetBuildSteps(buildName) if s.targetType == ReservedValues.Configuration.Build.Target.Type.STANDALONE]
+        if len(standaloneSteps) == 0:
+            self.output.SendError(f"Configuration '{buildName}' has no standalone target to run")
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        targetPath = Path(config.GetProjectRoot()) / standaloneSteps[-1].targetPath
+        if not targetPath.exists() and targetPath.with_suffix(".exe").exists():
+            targetPath = targetPath.with_suffix(".exe")
+
+        cmd = [str(targetPath)] + params[1:]
+        self.output.SendInfoLogOnly(f"Running '{targetPath}' with arguments {' '.join(params[1:])}")
+
+        # The executable takes over this process so its exit code and signals reach the caller unchanged,
+        # Windows has no real exec and only emulates it with a new process, so it is waited on there instead
+        if sys.platform == "win32":
+            self.__StopProfiler()
+            self.output.Close()
+            exit(subprocess.call(cmd))
+
+        self.__StopProfiler()
+        self.output.Close()
+        sys.stdout.flush()
+        os.execv(cmd[0], cmd)
+
+    def ActionGenerate(self, params: list[str]):
+        if len(params) < 2:
+            self.argHelper.ShowInvalidUsageMessage("Argument '--generate' expects a generator and at least one build name")
+            return ResultCode.ERR_ARG_INVALID
+
+        generator = params[0]
+        if not generator == ReservedValues.Arguments.Generator.NINJA:
+            self.argHelper.ShowInvalidUsageMessage(f"Generator '{generator}' is not supported")
+            return ResultCode.ERR_ARG_INVALID
+
+        configs = []
+        for buildName in dict.fromkeys(params[1:]):
+            self.output.SendInfo(f"Generating {generator} files for configuration '{buildName}'")
+
+            self.lastResultCode, config = self.__LoadBuildConfig(buildName)
+            if not self.lastResultCode == ResultCode.SUCCESS:
+                return self.lastResultCode
+
+            configs.append(config)
+
+        # Ninja runs this again with a single build name when the inputs of that configuration change
+        appCommand = [sys.executable, str(Path(__file__).parent.absolute()), "--generate", generator]
+        compiler = CompilerService(configs, self.output, self.jobCount, self.maxLoad)
+        return compiler.GenerateNinja(appCommand)
+
+    def ActionSetJobCount(self, count: str):
+        if count is None or not count.isdigit() or int(count) == 0:
+            self.argHelper.ShowInvalidUsageMessage(f"Job count '{count}' is not a positive number")
+            return ResultCode.ERR_ARG_INVALID
+
+        self.jobCount = int(count)
+        return ResultCode.SUCCESS
+
+    def ActionSetMaxLoad(self, load: str):
+        try:
+            self.maxLoad = float(load)
+        except (TypeError, ValueError):
+            self.argHelper.ShowInvalidUsageMessage(f"Load '{load}' is not a number")
+            return ResultCode.ERR_ARG_INVALID
+
+        return ResultCode.SUCCESS
+
+    def ActionEnableFailFast(self):
+        self.failureMode = FailureMode.FAIL_FAST
+        return ResultCode.SUCCESS
+
+    def ActionEnableKeepGoing(self):
+        self.failureMode = FailureMode.KEEP_GOING
+        return ResultCode.SUCCESS
+
+    def ActionEnableUsageReport(self):
+        self.isReportingUsage = True
+        return ResultCode.SUCCESS
+
+    def ActionEnableMissExplanation(self):
+        self.isExplainingMisses = True
+        return ResultCode.SUCCESS
+
+    def ActionProfileSelf(self, filePath: str):
+        if filePath is None:
+            self.argHelper.ShowInvalidUsageMessage("Argument '--profile-self' expects a file to save the profile to")
+            return ResultCode.ERR_ARG_INVALID
+
+        # Relative to where zbuild was invoked, the working directory is the project root by now
+        self.profiler.Start(self.invocationDir / filePath)
+        return ResultCode.SUCCESS
+
+    def ActionTraceAllocations(self):
+        self.profiler.StartTracingAllocations()
+        return ResultCode.SUCCESS
+
+    def ActionQueryAffected(self, params: list[str]):
+        self.lastResultCode, query = self.__PrepareQuery("--affected", params, 2)
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        return query.Affected(params[1])
+
+    def ActionQueryWhy(self, params: list[str]):
+        self.lastResultCode, query = self.__PrepareQuery("--why", params, 2)
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        return query.Why(params[1])
+
+    def ActionQueryDeps(self, params: list[str]):
+        self.lastResultCode, query = self.__PrepareQuery("--deps", params, 3)
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        return query.Dependencies(params[1], self.__GetQueryDepth(params))
+
+    def ActionQueryRDeps(self, params: list[str]):
+        self.lastResultCode, query = self.__PrepareQuery("--rdeps", params, 3)
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return self.lastResultCode
+
+        return query.Dependents(params[1], self.__GetQueryDepth(params))
+
+    def ActionQueryHistory(self, params: list[str]):
+        if len(params) < 1 or len(params) > 2:
+            self.argHelper.ShowInvalidUsageMessage("Argument '--history' expects a build name and optionally a count")
+            return ResultCode.ERR_ARG_INVALID
+
+        if len(params) == 2 and (not params[1].isdigit() or int(params[1]) == 0):
+            self.argHelper.ShowInvalidUsageMessage(f"Count '{params[1]}' given to '--history' is not a positive number")
+            return ResultCode.ERR_ARG_INVALID
+
+        query = QueryService(self.config, self.output, self.invocationDir)
+        return query.History(params[0], int(params[1]) if len(params) == 2 else None)
+
+    def __StopProfiler(self):
+        # Allocations are only summarized alongside a profile, tracing on its own has nowhere to report to
+        if not self.profiler.isRunning:
+            if self.profiler.isTracingAllocations:
+                self.output.SendWarning("Ignoring '--trace-allocations' without '--profile-self'")
+            return
+
+        if not self.profiler.Stop() == ResultCode.SUCCESS:
+            self.output.SendError(f"Could not save the profile to '{self.profiler.outputPath}'")
+            return
+
+        self.output.SendInfo(f"Saved profile of zbuild to '{self.profiler.outputPath}', load it with pstats or snakeviz")
+        self.output.SendInfo(f"zbuild took {self.profiler.GetTimeSummary()}")
+        self.output.SendInfo("Functions taking the most time of their own:")
+        for name, callCount, ownTime, cumulativeTime in self.profiler.GetTopFunctions(self.PROFILE_REPORT_SIZE):
+            self.output.SendInfo(f"    {ownTime:8.3f}s own {cumulativeTime:8.3f}s total {callCount:9} calls  {name}")
+
+        allocations = self.profiler.GetTopAllocations(self.PROFILE_REPORT_SIZE)
+        if allocations is None:
+            return
+
+        lines, peakSize = allocations
+        self.output.SendInfo(f"Traced allocations peaked at {peakSize / (1024 * 1024):.1f} MiB, lines still holding the most at exit:")
+        for location, size, count in lines:
+            self.output.SendInfo(f"    {size / 1024:10.1f} KiB in {count:7} blocks  {location}")
+
+    def __LoadBuildConfig(self, buildName: str):
+        # Each configuration gets its own copy of the configuration service, they only differ in build values
+        config = copy.copy(self.config)
+        self.lastResultCode = config.LoadBuildConfig(buildName)
         if not self.lastResultCode == ResultCode.SUCCESS:
             if self.lastResultCode == ResultCode.ERR_CONFIG_INVALID:
                 self.output.SendError(f"The build configuration for '{buildName}' is not valid")
             else:
                 self.output.SendError(f"Could not find the build configuration file for '{buildName}'")
-            return self.lastResultCode
+            return (self.lastResultCode, None)
+
+        return (ResultCode.SUCCESS, config)
+
+    def __PrepareQuery(self, argName: str, params: list[str], maxParamCount: int):
+        if len(params) < 2 or len(params) > maxParamCount:
+            self.argHelper.ShowInvalidUsageMessage(f"Argument '{argName}' expects a build name and a file path")
+            return (ResultCode.ERR_ARG_INVALID, None)
+
+        if len(params) == 3 and (not params[2].isdigit() or int(params[2]) == 0):
+            self.argHelper.ShowInvalidUsageMessage(f"Depth '{params[2]}' given to '{argName}' is not a positive number")
+            return (ResultCode.ERR_ARG_INVALID, None)
+
+        query = QueryService(self.config, self.output, self.invocationDir)
+        return (query.Load(params[0]), query)
 
-        return CompilerService(self.config, self.output).Compile()
+    def __GetQueryDepth(self, params: list[str]):
+        return int(params[2]) if len(params) == 3 else None
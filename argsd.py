@@ -8,7 +8,7 @@ import sys
 from pathlib import Path
 from typing import Any, Callable, Optional
 
-from constants import ResultCode
+from .constants import ResultCode
 
 class ArgHelper():
     def __init__(self, shortNameIndicator: str = "-", longNameIndicator: str = "--"):
@@ -30,11 +30,11 @@ class ArgHelper():
             self.helpArgDescriptor
         ]
 
-    def AddArg(self, shortName: str, longName: str, helpInfo: str,isSwitch: bool = False, isMulti: bool = False, group: Optional[int] = None, varName: Optional[str] = None, action: Optional[Callable] = None):
+    def AddArg(self, shortName: str, longName: str, helpInfo: str,isSwitch: bool = False, isMulti: bool = False, group: Optional[int] = None, varName: Optional[str] = None, action: Optional[Callable] = None, isOption: bool = False, isRemainder: bool = False):
         if shortName is not None:
             shortName = f"{self.shortNameIndicator}{shortName}"
         longName = f"{self.longNameIndicator}{longName}"
-        argd = _ArgDescriptor(shortName, longName, helpInfo, isSwitch, isMulti, group, varName, action)
+        argd = _ArgDescriptor(shortName, longName, helpInfo, isSwitch, isMulti, group, varName, action, isOption, isRemainder)
         self.descriptors.append(argd)
 
     def AppendToHelpMessage(self, msg: str):
@@ -59,6 +59,19 @@ class ArgHelper():
         # Remove invoked script name from args
         args = sys.argv[1:]
 
+        # Everything after the value of a remainder argument is handed over verbatim, even text that looks like an argument.
+        # A '--' right after the value only separates the two and is dropped
+        remainder = []
+        for i in range(len(args)):
+            argd = next((a for a in self.descriptors if args[i] in (a.shortName, a.longName)), None)
+            if argd is not None and argd.isRemainder:
+                remainder = args[i + 2:]
+                if len(remainder) > 0 and remainder[0] == self.longNameIndicator:
+                    remainder = remainder[1:]
+
+                args = args[:i + 2]
+                break
+
         if len(args) == 0 or self.helpArgDescriptor.shortName in args or self.helpArgDescriptor.longName in args:
             self.ShowHelp()
             exit()
@@ -78,6 +91,9 @@ class ArgHelper():
                 else:
                     for argd in self.descriptors:
                         if arg in (argd.shortName, argd.longName):
+                            if argd.group is None:
+                                break
+
                             if argd.group not in requestedArgGroups:
                                 requestedArgGroups.append(argd.group)
                             else:
@@ -99,6 +115,9 @@ class ArgHelper():
                 if arg in (argd.shortName, argd.longName):
                     if argd.isSwitch:
                         actions.insert(0, (argd.action, None))
+                    elif argd.isRemainder:
+                        i += 1
+                        actions.append((argd.action, args[i:i + 1] + remainder))
                     elif argd.isMulti:
                         i += 1
                         argValueList = []
@@ -106,6 +125,13 @@ class ArgHelper():
                             argValueList.append(args[i])
                             i += 1
                         actions.append((argd.action, argValueList))
+
+                        # Step back so the argument that ended the value list is processed next
+                        i -= 1
+                    elif argd.isOption:
+                        # Options configure the other actions, so they are applied before any of them run
+                        i += 1
+                        actions.insert(0, (argd.action, args[i] if i < len(args) else None))
                     else:
                         i += 1
                         actions.append((argd.action, args[i]))
@@ -120,7 +146,7 @@ class ArgHelper():
         return (ResultCode.SUCCESS, actions)
 
 class _ArgDescriptor():
-    def __init__(self, shortName: str, longName: str, helpInfo: str,isSwitch: bool = False, isMulti: bool = False, group: Optional[int] = None, varName: Optional[str] = None, action: Optional[Callable] = None):
+    def __init__(self, shortName: str, longName: str, helpInfo: str,isSwitch: bool = False, isMulti: bool = False, group: Optional[int] = None, varName: Optional[str] = None, action: Optional[Callable] = None, isOption: bool = False, isRemainder: bool = False):
         self.shortName = shortName
         self.longName = longName
         self.helpInfo = helpInfo
@@ -129,8 +155,11 @@ class _ArgDescriptor():
         self.group = group
         self.varName = longName if varName is None else varName
         self.action = action
+        self.isOption = isOption
+        self.isRemainder = isRemainder
 
-        self.varName = self.__SanitizeVariableName(self.varName)
+        # Arguments taking several values name each of them, separated by spaces
+        self.varName = ' '.join(self.__SanitizeVariableName(n) for n in self.varName.split())
 
     def __SanitizeVariableName(self, varName: str):
         nameStartIndex = 0
@@ -178,7 +207,8 @@ class _ArgHelpFormatter():
                     usageMsg += f"{arg.longName}"
 
                 if not arg.isSwitch:
-                    usageMsg += f" <{arg.varName}>"
+                    for varName in arg.varName.split():
+                        usageMsg += f" <{varName}>"
 
                 if not i + 1 == argGroupLength:
                     usageMsg += " | "
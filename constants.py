@@ -27,10 +27,32 @@ class Configuration():
         class Files():
             EXTENSION = None
 
+    class State():
+        DIR_NAME = None
+
+        class Files():
+            DEPENDENCY_GRAPH = "depgraph.json"
+            DIAGNOSTICS      = "diagnostics.json"
+            JOB_STATS        = "jobstats.json"
+            DIRECTORY_CACHE  = "dircache.json"
+            HASH_CACHE       = "hashcache.json"
+            TREE_CACHE       = "treecache.json"
+            MANIFEST         = "manifest.json"
+            TOOLCHAIN_PROBES = "toolchain.json"
+            NINJA_BUILD      = "build.ninja"
+            BUILD_LOCK       = "build.lock"
+            CACHE_LOCK       = "cache.lock"
+            RESOURCE_USAGE   = "usage.json"
+            BUILD_HISTORY    = "history.db"
+            OBJECT_MAP       = "objects.json"
+            ARCHIVE_MEMBERS  = "archives.json"
+            STEP_INPUTS      = "inputs.json"
+
 Configuration.App.RootLocator.NAME  = f"{Configuration.App.NAME}.root"
 Configuration.Root.FILE_NAME        = f"root.{Configuration.Files.EXTENSION}"
 Configuration.Build.Files.EXTENSION = f"b.{Configuration.Files.EXTENSION}"
 Configuration.Run.Files.EXTENSION   = f"r.{Configuration.Files.EXTENSION}"
+Configuration.State.DIR_NAME        = f".{Configuration.App.NAME}"
 
 # Configuration key names as they should appear in json config files
 class KeyNames():
@@ -50,8 +72,12 @@ class KeyNames():
                 HEADER_FILE_EXTENSTION = "headerExtension"
                 INCLUDE_DIRECTORIES    = "includeDirectories"
                 SOURCE_DIRECTORIES     = "sourceDirectories"
+                SOURCE_PATTERNS        = "sourcePatterns"
+                EXCLUDE_PATTERNS       = "excludePatterns"
                 DEFINES                = "defines"
                 ADDITIONAL_ARGUMENTS   = "additionalArguments"
+                LINK_TIME_OPTIMIZATION = "lto"
+                THIN_ARCHIVE           = "thinArchive"
 
                 class SharedLibraries():
                     ROOT    = "sharedLibraries"
@@ -65,6 +91,7 @@ class KeyNames():
             TARGET        = "target"
             LOG           = "log"
             OBJECT        = "object"
+            STATE         = "state"
 
         class Platform():
             ROOT = "platform"
@@ -72,7 +99,29 @@ class KeyNames():
         class Toolchain():
             ROOT = "toolchain"
 
+        class Linker():
+            ROOT    = "linker"
+            TYPE    = "type"
+            THREADS = "threads"
+
+        class DebugInfo():
+            ROOT  = "debugInfo"
+            SPLIT = "split"
+
+        class LinkTimeOptimization():
+            ROOT       = "lto"
+            CACHE_SIZE = "cacheSize"
+
+        class History():
+            ROOT                 = "history"
+            REGRESSION_THRESHOLD = "regressionThreshold"
+            BASELINE_SIZE        = "baselineSize"
+
 class ReservedValues():
+    class Arguments():
+        class Generator():
+            NINJA = "ninja"
+
     class Configuration():
         class Build():
             class SharedResource():
@@ -87,6 +136,7 @@ class ReservedValues():
                     WINDOWS = "windows"
 
                 class Type():
+                    ARCHIVE    = "archive"
                     LIBRARY    = "library"
                     STANDALONE = "standalone"
 
@@ -96,6 +146,12 @@ class ReservedValues():
                 GCC   = "gcc"
                 MSVC  = "msvc"
 
+            class Linker():
+                BFD  = "bfd"
+                GOLD = "gold"
+                LLD  = "lld"
+                MOLD = "mold"
+
 # Result codes returned from operations
 class ResultCode():
     SUCCESS = 0x0
@@ -107,6 +163,8 @@ class ResultCode():
     ERR_FILE_NOT_FOUND  = 0x0104
     ERR_KEY_NOT_FOUND   = 0x0105
     ERR_CONFIG_INVALID  = 0x0106
+    ERR_STATE_INVALID   = 0x0107
 
     WRN_NO_VALUE          = 0x0200
     WRN_PROC_NONZERO_EXIT = 0x0201
+    WRN_JOB_CANCELLED     = 0x0202
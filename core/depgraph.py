@@ -4,16 +4,30 @@ Licensed under the MIT license.
 See LICENSE file in the project root for full license information.
 '''
 
+from collections import deque
+import json
+import os
 from pathlib import Path
 import random
 import sys
+from typing import Callable, Optional
+
+from ..constants import ResultCode
+
+class NodeType():
+    TARGET = 0
+    OBJECT = 1
+    SOURCE = 2
+    HEADER = 3
 
 class DependencyGraphNode:
-    def __init__(self, id: int, fileHash: str, filePath: Path):
+    def __init__(self, id: int, fileHash: str, filePath: Path, nodeType: int = NodeType.HEADER, label: Optional[str] = None):
         self.__id: int = id
         self.__childNodeIDs: list[int] = []
         self.fileHash: str = fileHash
         self.filePath: Path = filePath
+        self.nodeType: int = nodeType
+        self.label: Optional[str] = label
 
     @property
     def id(self):
@@ -37,8 +51,12 @@ class DependencyGraphNode:
             self.__childNodeIDs.remove(childID)
 
 class DependencyGraph:
+    FORMAT_VERSION = 1
+
     def __init__(self):
         self.__nodes: dict[int, DependencyGraphNode] = {}
+        self.__pathIndex: dict[Path, int] = {}
+        self.__parentIndex: Optional[dict[int, list[int]]] = None
 
     def __getitem__(self, nodeID):
         return self.__nodes[nodeID]
@@ -50,40 +68,172 @@ class DependencyGraph:
         return len(self.__nodes)
 
     def SaveOrSerialize(self, filePath: Path):
-        pass
+        os.makedirs(Path(filePath).parent, exist_ok = True)
+
+        nodeData = []
+        for node in self.__nodes.values():
+            nodeData.append({
+                "id": node.id,
+                "type": node.nodeType,
+                "path": str(node.filePath),
+                "hash": node.fileHash,
+                "label": node.label,
+                "children": node.GetChildren()
+            })
+
+        # Write next to the destination first so readers never observe a partial graph
+        tempPath = Path(f"{filePath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.FORMAT_VERSION, "nodes": nodeData }, f)
+        os.replace(tempPath, filePath)
+
+        return ResultCode.SUCCESS
 
     def Load(self, filePath: Path):
-        pass
+        if not Path(filePath).exists():
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        try:
+            with open(filePath, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return ResultCode.ERR_STATE_INVALID
+
+        if not data.get("version") == self.FORMAT_VERSION:
+            return ResultCode.ERR_STATE_INVALID
+
+        self.__nodes = {}
+        self.__pathIndex = {}
+        self.__parentIndex = None
+        for n in data["nodes"]:
+            node = DependencyGraphNode(n["id"], n["hash"], Path(n["path"]), n["type"], n["label"])
+            for childID in n["children"]:
+                node.AddChild(childID)
+
+            self.__nodes[node.id] = node
+            self.__pathIndex[node.filePath] = node.id
+
+        return ResultCode.SUCCESS
 
     def HasNode(self, nodeID: int):
         return nodeID in self.__nodes.keys()
 
-    def AddNode(self, fileHash: str, filePath: Path):
-        newNode = DependencyGraphNode(self.__GenerateNodeID(), fileHash, filePath)
+    def FindNode(self, filePath: Path):
+        return self.__pathIndex.get(Path(filePath))
+
+    def AddNode(self, fileHash: str, filePath: Path, nodeType: int = NodeType.HEADER, label: Optional[str] = None):
+        newNode = DependencyGraphNode(self.__GenerateNodeID(), fileHash, Path(filePath), nodeType, label)
         self.__nodes[newNode.id] = newNode
+        self.__pathIndex[newNode.filePath] = newNode.id
         return newNode.id
 
     def RemoveNode(self, nodeID: int):
         if self.HasNode(nodeID):
-            self.__nodes.pop(nodeID)
+            node = self.__nodes.pop(nodeID)
+            self.__pathIndex.pop(node.filePath, None)
 
         for node in self.__nodes.values():
             node.RemoveChild(nodeID)
 
-    def AddChild(self, nodeID: int, fileHash: str, filePath: Path):
+        self.__parentIndex = None
+
+    def AddChild(self, nodeID: int, fileHash: str, filePath: Path, nodeType: int = NodeType.HEADER, label: Optional[str] = None):
         if self.HasNode(nodeID):
-            newNodeID = self.AddNode(fileHash, filePath)
-            self.__nodes[nodeID].AddChild(newNodeID)
+            newNodeID = self.AddNode(fileHash, filePath, nodeType, label)
+            self.LinkChild(nodeID, newNodeID)
+            return newNodeID
+
+        return None
+
+    def LinkChild(self, nodeID: int, childID: int):
+        if self.HasNode(nodeID) and self.HasNode(childID):
+            self.__nodes[nodeID].AddChild(childID)
+            self.__parentIndex = None
 
     def RemoveChild(self, nodeID: int, childID: int):
         if self.HasNode(nodeID):
             self.__nodes[nodeID].RemoveChild(childID)
+            self.__parentIndex = None
+
+    def RemoveChildren(self, nodeID: int):
+        if self.HasNode(nodeID):
+            for childID in self.__nodes[nodeID].GetChildren():
+                self.__nodes[nodeID].RemoveChild(childID)
+            self.__parentIndex = None
+
+    def PruneOrphans(self, keepTypes: tuple[int, ...] = (NodeType.TARGET,)):
+        # Removes nodes nothing depends on anymore, except roots of the given types
+        isPruning = True
+        while isPruning:
+            orphanIDs = [id for id, node in self.__nodes.items() if node.nodeType not in keepTypes and len(self.GetParents(id)) == 0]
+            for id in orphanIDs:
+                node = self.__nodes.pop(id)
+                self.__pathIndex.pop(node.filePath, None)
+
+            self.__parentIndex = None
+            isPruning = len(orphanIDs) > 0
+
+    def GetParents(self, nodeID: int):
+        if self.__parentIndex is None:
+            self.__parentIndex = {}
+            for node in self.__nodes.values():
+                for childID in node.GetChildren():
+                    self.__parentIndex.setdefault(childID, []).append(node.id)
+
+        return self.__parentIndex.get(nodeID, []).copy()
+
+    def GetDependencies(self, nodeID: int, maxDepth: Optional[int] = None):
+        return self.__Walk(nodeID, lambda id: self.__nodes[id].GetChildren(), maxDepth)
+
+    def GetDependents(self, nodeID: int, maxDepth: Optional[int] = None):
+        return self.__Walk(nodeID, self.GetParents, maxDepth)
+
+    def FindChainsTo(self, nodeID: int, isMatch: Callable[[DependencyGraphNode], bool]):
+        # Breadth first so every reported chain is the shortest route to a matching node
+        chains: list[list[int]] = []
+        previous: dict[int, Optional[int]] = { nodeID: None }
+        pending = deque([nodeID])
+        while len(pending) > 0:
+            currentID = pending.popleft()
+            if not currentID == nodeID and isMatch(self.__nodes[currentID]):
+                chain = []
+                walkID = currentID
+                while walkID is not None:
+                    chain.insert(0, walkID)
+                    walkID = previous[walkID]
+                chains.append(chain)
+
+            for childID in self.__nodes[currentID].GetChildren():
+                if childID not in previous and self.HasNode(childID):
+                    previous[childID] = currentID
+                    pending.append(childID)
+
+        return chains
+
+    def __Walk(self, nodeID: int, getNext: Callable[[int], list[int]], maxDepth: Optional[int]):
+        visited: list[tuple[int, int]] = []
+        seen = { nodeID }
+        pending = deque([(nodeID, 0)])
+        while len(pending) > 0:
+            currentID, depth = pending.popleft()
+            if maxDepth is not None and depth >= maxDepth:
+                continue
+
+            for nextID in getNext(currentID):
+                if nextID in seen or not self.HasNode(nextID):
+                    continue
+
+                seen.add(nextID)
+                visited.append((nextID, depth + 1))
+                pending.append((nextID, depth + 1))
+
+        return visited
 
     def __GenerateNodeID(self):
         newNodeID = -1
         isGenerated = False
-        while not isGenerated and self.HasNode(newNodeID):
+        while not isGenerated:
             newNodeID = random.randint(1, sys.maxsize)
-            isGenerated = True
+            isGenerated = not self.HasNode(newNodeID)
 
         return newNodeID
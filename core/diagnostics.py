@@ -0,0 +1,167 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import json
+import os
+from pathlib import Path
+import re
+import threading
+from typing import Optional
+
+from ..constants import ReservedValues, ResultCode
+
+class Severity():
+    ERROR   = "error"
+    WARNING = "warning"
+    NOTE    = "note"
+
+class Diagnostic:
+    def __init__(self, filePath: str, line: Optional[int], column: Optional[int], severity: str, code: Optional[str], message: str):
+        self.filePath = filePath
+        self.line = line
+        self.column = column
+        self.severity = severity
+        self.code = code
+        self.message = message
+        self.count = 1
+
+    def GetKey(self):
+        return (self.filePath, self.line, self.column, self.severity, self.code, self.message)
+
+    def ToDict(self):
+        return {
+            "file": self.filePath,
+            "line": self.line,
+            "column": self.column,
+            "severity": self.severity,
+            "code": self.code,
+            "message": self.message,
+            "count": self.count
+        }
+
+class DiagnosticParser:
+    MAX_RECORDED_DIAGNOSTICS = 2000
+    MAX_MESSAGE_LENGTH       = 512
+
+    MSVC_PATTERNS = [
+        # main.c(12,5): warning C4996: 'strcpy': This function or variable may be unsafe
+        re.compile(r'^(?P<file>.+?)\((?P<line>\d+)(?:,(?P<column>\d+))?\)\s*: (?P<severity>fatal error|error|warning|note)(?: (?P<code>[A-Z]+\d+))?\s*: (?P<message>.*)$'),
+        # LINK : fatal error LNK1104: cannot open file 'foo.lib'
+        re.compile(r'^(?P<file>[^:(]+?) : (?:Command line )?(?P<severity>fatal error|error|warning)(?: (?P<code>[A-Z]+\d+))?\s*: (?P<message>.*)$')
+    ]
+
+    GNU_PATTERNS = [
+        # main.c:12:5: warning: unused variable 'x' [-Wunused-variable]
+        # collect2: error: ld returned 1 exit status
+        re.compile(r'^(?P<file>.+?):(?:(?P<line>\d+):(?:(?P<column>\d+):)?)? (?P<severity>fatal error|error|warning|note): (?P<message>.*?)(?: \[(?P<code>-W[^\]]+)\])?$')
+    ]
+
+    def __init__(self, toolchain: str):
+        self.patterns = self.GNU_PATTERNS
+        if toolchain == ReservedValues.Configuration.Root.Toolchain.MSVC:
+            self.patterns = self.MSVC_PATTERNS
+
+        self.diagnostics: dict[tuple, Diagnostic] = {}
+        self.errorCount = 0
+        self.warningCount = 0
+        self.suppressedCount = 0
+        self.droppedCount = 0
+        self.__lock = threading.Lock()
+
+    def BeginUnit(self):
+        return DiagnosticUnit(self)
+
+    def Match(self, line: str):
+        for pattern in self.patterns:
+            match = pattern.match(line)
+            if match is None:
+                continue
+
+            groups = match.groupdict()
+            severity = groups["severity"]
+            if severity == "fatal error":
+                severity = Severity.ERROR
+
+            lineNumber = groups.get("line")
+            column = groups.get("column")
+            return Diagnostic(
+                groups["file"].strip(),
+                None if lineNumber is None else int(lineNumber),
+                None if column is None else int(column),
+                severity,
+                groups.get("code"),
+                groups["message"].strip()[:self.MAX_MESSAGE_LENGTH]
+            )
+
+        return None
+
+    def Record(self, diagnostic: Diagnostic):
+        # Returns the recorded diagnostic and whether it was seen for the first time
+        with self.__lock:
+            key = diagnostic.GetKey()
+            recorded = self.diagnostics.get(key)
+            if recorded is not None:
+                recorded.count += 1
+                self.suppressedCount += 1
+                return (recorded, False)
+
+            if diagnostic.severity == Severity.ERROR:
+                self.errorCount += 1
+            else:
+                self.warningCount += 1
+
+            if len(self.diagnostics) < self.MAX_RECORDED_DIAGNOSTICS:
+                self.diagnostics[key] = diagnostic
+            else:
+                self.droppedCount += 1
+
+            return (diagnostic, True)
+
+    def GetSummary(self):
+        summary = f"{self.errorCount} error(s), {self.warningCount} warning(s)"
+        if self.suppressedCount > 0:
+            summary += f", {self.suppressedCount} repeated diagnostic(s) suppressed"
+        if self.droppedCount > 0:
+            summary += f", {self.droppedCount} not recorded after reaching the limit of {self.MAX_RECORDED_DIAGNOSTICS}"
+
+        return summary
+
+    def Save(self, filePath: Path):
+        os.makedirs(Path(filePath).parent, exist_ok = True)
+
+        data = {
+            "errors": self.errorCount,
+            "warnings": self.warningCount,
+            "suppressed": self.suppressedCount,
+            "dropped": self.droppedCount,
+            "diagnostics": [d.ToDict() for d in self.diagnostics.values()]
+        }
+
+        tempPath = Path(f"{filePath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump(data, f, indent = 4)
+        os.replace(tempPath, filePath)
+
+        return ResultCode.SUCCESS
+
+class DiagnosticUnit:
+    def __init__(self, parser: DiagnosticParser):
+        self.parser = parser
+        self.__isSuppressing = False
+
+    def Feed(self, line: str):
+        # Returns the parsed diagnostic, if any, and whether the line should be shown
+        diagnostic = self.parser.Match(line)
+        if diagnostic is None:
+            return (None, not self.__isSuppressing)
+
+        # Notes and context lines belong to the diagnostic before them and share its visibility
+        if diagnostic.severity == Severity.NOTE:
+            return (diagnostic, not self.__isSuppressing)
+
+        diagnostic, isNew = self.parser.Record(diagnostic)
+        self.__isSuppressing = not isNew
+        return (diagnostic, isNew)
@@ -0,0 +1,182 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import re
+import threading
+from typing import Optional
+
+from ..constants import ResultCode
+
+class GlobPattern:
+    def __init__(self, pattern: str):
+        self.pattern = pattern.replace('\\', '/')
+        self.isRecursive = '/' in self.pattern
+        self.regex = re.compile(self.__Translate(self.pattern))
+
+    def Match(self, relativePath: str):
+        return self.regex.fullmatch(relativePath) is not None
+
+    def __Translate(self, pattern: str):
+        # Unlike fnmatch, '*' and '?' stop at directory separators and only '**' crosses them
+        regex = ""
+        i = 0
+        while i < len(pattern):
+            c = pattern[i]
+            if pattern.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+                continue
+            elif pattern.startswith("**", i):
+                regex += ".*"
+                i += 2
+                continue
+            elif c == '*':
+                regex += "[^/]*"
+            elif c == '?':
+                regex += "[^/]"
+            elif c == '[':
+                end = pattern.find(']', i + 1)
+                if end == -1:
+                    regex += re.escape(c)
+                else:
+                    content = pattern[i + 1:end]
+                    if content.startswith('!'):
+                        content = '^' + content[1:]
+                    regex += f"[{content}]"
+                    i = end
+            else:
+                regex += re.escape(c)
+            i += 1
+
+        return regex
+
+class SourceDiscovery:
+    FORMAT_VERSION = 1
+    MAX_WORKERS = 8
+
+    def __init__(self, baseDir: Optional[Path] = None):
+        # Relative directories are resolved against baseDir rather than the working directory, but cached as given
+        self.baseDir = baseDir
+        self.__listings: dict[str, dict] = {}
+        self.__visited: set[str] = set()
+        self.__lock = threading.Lock()
+        self.listedCount = 0
+        self.cachedCount = 0
+
+    def Load(self, filePath: Path, isMerging: bool = False):
+        if not Path(filePath).exists():
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        try:
+            with open(filePath, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return ResultCode.ERR_STATE_INVALID
+
+        if not data.get("version") == self.FORMAT_VERSION:
+            return ResultCode.ERR_STATE_INVALID
+
+        # Merging keeps what is in memory and only adds listings another process saved meanwhile
+        if isMerging:
+            with self.__lock:
+                for dir, listing in data["listings"].items():
+                    self.__listings.setdefault(dir, listing)
+        else:
+            self.__listings = data["listings"]
+
+        return ResultCode.SUCCESS
+
+    def Save(self, filePath: Path):
+        # Listings of directories not visited by this run are kept for other configurations, unless they are gone
+        listings = {}
+        for dir, listing in self.__listings.items():
+            if dir in self.__visited or os.path.isdir(self.__Resolve(dir)):
+                listings[dir] = listing
+
+        os.makedirs(Path(filePath).parent, exist_ok = True)
+        tempPath = Path(f"{filePath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.FORMAT_VERSION, "listings": listings }, f)
+        os.replace(tempPath, filePath)
+
+        return ResultCode.SUCCESS
+
+    def GetVisitedDirectories(self):
+        with self.__lock:
+            return sorted(self.__visited)
+
+    def Discover(self, rootDir: Path, includePatterns: list[str], excludePatterns: list[str]):
+        return [f for sourceFiles in self.IterDiscover(rootDir, includePatterns, excludePatterns) for f in sourceFiles]
+
+    def IterDiscover(self, rootDir: Path, includePatterns: list[str], excludePatterns: list[str]):
+        # Yields the matches of each directory level as soon as it is listed, callers can start on them before the walk ends
+        includes = [GlobPattern(p) for p in includePatterns]
+        excludes = [GlobPattern(p) for p in excludePatterns]
+        isRecursive = any(p.isRecursive for p in includes)
+
+        # Directories of one level are listed in parallel, scandir releases the GIL while it waits on the disk
+        frontier = [""]
+        with ThreadPoolExecutor(max_workers = self.MAX_WORKERS) as pool:
+            while len(frontier) > 0:
+                listings = pool.map(lambda d: self.GetListing(os.path.join(rootDir, d)), frontier)
+                sourceFiles: list[Path] = []
+                nextFrontier = []
+                for relativeDir, (fileNames, dirNames) in zip(frontier, listings):
+                    for name in fileNames:
+                        relativePath = f"{relativeDir}{name}"
+                        if any(p.Match(relativePath) for p in includes) and not any(p.Match(relativePath) for p in excludes):
+                            sourceFiles.append(Path(rootDir) / relativePath)
+
+                    if not isRecursive:
+                        continue
+
+                    for name in dirNames:
+                        relativePath = f"{relativeDir}{name}/"
+                        if not any(p.Match(relativePath) or p.Match(relativePath[:-1]) for p in excludes):
+                            nextFrontier.append(relativePath)
+
+                frontier = nextFrontier
+                if len(sourceFiles) > 0:
+                    yield sourceFiles
+
+    def GetListing(self, dir: str):
+        dir = os.path.normpath(dir)
+        try:
+            mtime = os.stat(self.__Resolve(dir)).st_mtime_ns
+        except OSError:
+            return ([], [])
+
+        # A directory's mtime changes whenever an entry is added, removed or renamed, which is all a listing depends on
+        with self.__lock:
+            self.__visited.add(dir)
+            listing = self.__listings.get(dir)
+            if listing is not None and listing["mtime"] == mtime:
+                self.cachedCount += 1
+                return (listing["files"], listing["dirs"])
+
+        fileNames = []
+        dirNames = []
+        with os.scandir(self.__Resolve(dir)) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    fileNames.append(entry.name)
+                elif entry.is_dir(follow_symlinks = False):
+                    dirNames.append(entry.name)
+
+        fileNames.sort()
+        dirNames.sort()
+        with self.__lock:
+            self.listedCount += 1
+            self.__listings[dir] = { "mtime": mtime, "files": fileNames, "dirs": dirNames }
+
+        return (fileNames, dirNames)
+
+    def __Resolve(self, dir: str):
+        return dir if self.baseDir is None else os.path.join(self.baseDir, dir)
@@ -0,0 +1,105 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import threading
+from typing import Optional
+
+from ..constants import ResultCode
+
+class FileHasher:
+    FORMAT_VERSION = 1
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self, baseDir: Optional[Path] = None):
+        # Relative paths are resolved against baseDir rather than the working directory, but cached as given
+        self.baseDir = baseDir
+        self.__cache: dict[Path, tuple[int, int, str]] = {}
+        self.__used: set[Path] = set()
+        self.__lock = threading.Lock()
+
+    def Load(self, filePath: Path, isMerging: bool = False):
+        if not Path(filePath).exists():
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        try:
+            with open(filePath, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return ResultCode.ERR_STATE_INVALID
+
+        if not data.get("version") == self.FORMAT_VERSION:
+            return ResultCode.ERR_STATE_INVALID
+
+        # Merging keeps what is in memory and only adds hashes another process saved meanwhile
+        with self.__lock:
+            for path, (mtime, size, fileHash) in data["hashes"].items():
+                if not isMerging or Path(path) not in self.__cache:
+                    self.__cache[Path(path)] = (mtime, size, fileHash)
+
+        return ResultCode.SUCCESS
+
+    def Save(self, filePath: Path):
+        # Entries not used by this run are kept for other configurations, unless their file is gone
+        hashes = {}
+        for path, entry in self.__cache.items():
+            if path in self.__used or os.path.exists(self.__Resolve(path)):
+                hashes[str(path)] = entry
+
+        os.makedirs(Path(filePath).parent, exist_ok = True)
+        tempPath = Path(f"{filePath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.FORMAT_VERSION, "hashes": hashes }, f)
+        os.replace(tempPath, filePath)
+
+        return ResultCode.SUCCESS
+
+    def Hash(self, filePath: Path):
+        filePath = Path(filePath)
+        try:
+            stat = os.stat(self.__Resolve(filePath))
+        except OSError:
+            return None
+
+        # Only read the file again when its size or modified time changed
+        with self.__lock:
+            self.__used.add(filePath)
+            cached = self.__cache.get(filePath)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+        digest = hashlib.blake2b(digest_size = 16)
+        with open(self.__Resolve(filePath), "rb") as f:
+            block = f.read(self.BLOCK_SIZE)
+            while block:
+                digest.update(block)
+                block = f.read(self.BLOCK_SIZE)
+
+        fileHash = digest.hexdigest()
+        with self.__lock:
+            self.__cache[filePath] = (stat.st_mtime_ns, stat.st_size, fileHash)
+        return fileHash
+
+    def __Resolve(self, filePath: Path):
+        return filePath if self.baseDir is None else os.path.join(self.baseDir, filePath)
+
+class CommandHasher:
+    # Stands in for the base directory in a hashed command, so a checkout elsewhere hashes the same
+    PLACEHOLDER = "$ROOT"
+
+    def __init__(self, baseDir: Path):
+        # The base directory is only replaced where a path component ends, a sibling sharing its prefix is left as it is.
+        # A path also ends where an option gives it as the first half of a pair, as in -ffile-prefix-map=old=new
+        self.baseDir = Path(baseDir)
+        self.__pattern = re.compile(re.escape(str(self.baseDir)) + r"(?=[\\/=]|$)")
+
+    def Hash(self, command: list[str]):
+        portableCommand = [self.__pattern.sub(lambda _: self.PLACEHOLDER, arg) for arg in command]
+        return hashlib.blake2b('\0'.join(portableCommand).encode(), digest_size = 16).hexdigest()
@@ -0,0 +1,176 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import sqlite3
+import statistics
+from typing import Optional
+
+from ..constants import ResultCode
+
+class BuildRecord:
+    def __init__(self, buildName: str, startTime: float, wallTime: float, jobCount: int, resultCode: int):
+        # startTime is a wall clock timestamp, wallTime covers the whole invocation even when it built several configurations
+        self.buildName = buildName
+        self.startTime = startTime
+        self.wallTime = wallTime
+        self.jobCount = jobCount
+        self.resultCode = resultCode
+        self.unitCount = 0
+        self.compiledCount = 0
+        self.steps: list[tuple[str, str, float, float]] = []
+        self.units: list[tuple[str, str, str, float, Optional[float], Optional[int], int]] = []
+
+    def AddStep(self, name: str, status: str, compileTime: float, linkTime: float):
+        self.steps.append((name, status, compileTime, linkTime))
+
+    def AddUnit(self, stepName: str, jobType: str, outputPath: str, duration: float, cpuTime: Optional[float], peakMemory: Optional[int], resultCode: int):
+        self.units.append((stepName, jobType, outputPath, duration, cpuTime, peakMemory, resultCode))
+
+class Regression:
+    def __init__(self, kind: str, name: str, duration: float, baseline: float):
+        self.kind = kind
+        self.name = name
+        self.duration = duration
+        self.baseline = baseline
+
+    @property
+    def increase(self):
+        return (self.duration - self.baseline) / self.baseline
+
+class BuildHistory:
+    FORMAT_VERSION = 1
+    LOCK_TIMEOUT = 30
+
+    # Older builds of a configuration are dropped, a baseline only ever looks at the most recent ones
+    MAX_BUILDS = 500
+
+    # A baseline needs a few runs before it means anything, and changes below this many seconds are noise
+    MIN_BASELINE_SIZE = 3
+    MIN_INCREASE = 0.05
+
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS builds (
+            id INTEGER PRIMARY KEY, buildName TEXT NOT NULL, startTime REAL NOT NULL, wallTime REAL NOT NULL,
+            jobCount INTEGER NOT NULL, resultCode INTEGER NOT NULL, unitCount INTEGER NOT NULL, compiledCount INTEGER NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS steps (
+            buildID INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE, name TEXT NOT NULL, status TEXT NOT NULL,
+            compileTime REAL NOT NULL, linkTime REAL NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS units (
+            buildID INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE, stepName TEXT NOT NULL, jobType TEXT NOT NULL,
+            outputPath TEXT NOT NULL, duration REAL NOT NULL, cpuTime REAL, peakMemory INTEGER, resultCode INTEGER NOT NULL)''',
+        "CREATE INDEX IF NOT EXISTS buildsByName ON builds (buildName, id)",
+        "CREATE INDEX IF NOT EXISTS stepsByBuild ON steps (buildID)",
+        "CREATE INDEX IF NOT EXISTS unitsByOutput ON units (outputPath, jobType, buildID)"
+    ]
+
+    def __init__(self):
+        self.__connection: Optional[sqlite3.Connection] = None
+
+    def Open(self, filePath: Path, isCreating: bool = True):
+        # Several zbuild processes may record at once, SQLite serializes their writes and waits up to the timeout
+        if not isCreating and not Path(filePath).exists():
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        try:
+            os.makedirs(Path(filePath).parent, exist_ok = True)
+            self.__connection = sqlite3.connect(filePath, timeout = self.LOCK_TIMEOUT)
+            self.__connection.execute("PRAGMA foreign_keys = ON")
+            version = self.__connection.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                with self.__connection:
+                    for statement in self.SCHEMA:
+                        self.__connection.execute(statement)
+                    self.__connection.execute(f"PRAGMA user_version = {self.FORMAT_VERSION}")
+            elif not version == self.FORMAT_VERSION:
+                self.Close()
+                return ResultCode.ERR_STATE_INVALID
+        except sqlite3.Error:
+            self.Close()
+            return ResultCode.ERR_STATE_INVALID
+
+        return ResultCode.SUCCESS
+
+    def Close(self):
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def Record(self, record: BuildRecord):
+        try:
+            with self.__connection:
+                cursor = self.__connection.execute(
+                    "INSERT INTO builds (buildName, startTime, wallTime, jobCount, resultCode, unitCount, compiledCount) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (record.buildName, record.startTime, record.wallTime, record.jobCount, record.resultCode, record.unitCount, record.compiledCount)
+                )
+                buildID = cursor.lastrowid
+                self.__connection.executemany("INSERT INTO steps VALUES (?, ?, ?, ?, ?)", [(buildID,) + s for s in record.steps])
+                self.__connection.executemany("INSERT INTO units VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(buildID,) + u for u in record.units])
+                self.__connection.execute(
+                    "DELETE FROM builds WHERE buildName = ? AND id NOT IN (SELECT id FROM builds WHERE buildName = ? ORDER BY id DESC LIMIT ?)",
+                    (record.buildName, record.buildName, self.MAX_BUILDS)
+                )
+        except sqlite3.Error:
+            return ResultCode.ERR_STATE_INVALID
+
+        return ResultCode.SUCCESS
+
+    def GetBuilds(self, buildName: str, count: int):
+        # Newest first, as (id, startTime, wallTime, jobCount, resultCode, unitCount, compiledCount)
+        return self.__connection.execute(
+            "SELECT id, startTime, wallTime, jobCount, resultCode, unitCount, compiledCount FROM builds WHERE buildName = ? ORDER BY id DESC LIMIT ?",
+            (buildName, count)
+        ).fetchall()
+
+    def GetStepTrends(self, buildName: str, baselineSize: int):
+        # Compile time of every step the latest build rebuilt, next to the median of its earlier complete rebuilds
+        latestID = self.__GetLatestBuildID(buildName)
+        if latestID is None:
+            return []
+
+        trends = []
+        for name, compileTime in self.__connection.execute("SELECT name, compileTime FROM steps WHERE buildID = ? AND status = 'built'", (latestID,)).fetchall():
+            previous = [row[0] for row in self.__connection.execute(
+                "SELECT s.compileTime FROM steps s JOIN builds b ON b.id = s.buildID WHERE b.buildName = ? AND s.name = ? AND s.status = 'built' AND s.buildID < ? "
+                "ORDER BY s.buildID DESC LIMIT ?",
+                (buildName, name, latestID, baselineSize)
+            )]
+            trends.append((name, compileTime, None if len(previous) < self.MIN_BASELINE_SIZE else statistics.median(previous)))
+
+        return trends
+
+    def FindRegressions(self, buildName: str, threshold: float, baselineSize: int):
+        # Steps and compile units of the latest build that took more than threshold times longer than the median of their
+        # last baselineSize successful runs. A header that grew shows up in every unit including it
+        latestID = self.__GetLatestBuildID(buildName)
+        if latestID is None:
+            return []
+
+        regressions = []
+        for name, compileTime, baseline in self.GetStepTrends(buildName, baselineSize):
+            if self.__IsRegression(compileTime, baseline, threshold):
+                regressions.append(Regression("step", name, compileTime, baseline))
+
+        units = self.__connection.execute("SELECT outputPath, duration FROM units WHERE buildID = ? AND jobType = 'compile' AND resultCode = 0", (latestID,)).fetchall()
+        for outputPath, duration in units:
+            previous = [row[0] for row in self.__connection.execute(
+                "SELECT u.duration FROM units u JOIN builds b ON b.id = u.buildID WHERE u.outputPath = ? AND u.jobType = 'compile' AND u.resultCode = 0 "
+                "AND b.buildName = ? AND u.buildID < ? ORDER BY u.buildID DESC LIMIT ?",
+                (outputPath, buildName, latestID, baselineSize)
+            )]
+            baseline = None if len(previous) < self.MIN_BASELINE_SIZE else statistics.median(previous)
+            if self.__IsRegression(duration, baseline, threshold):
+                regressions.append(Regression("unit", outputPath, duration, baseline))
+
+        return sorted(regressions, key = lambda r: r.duration - r.baseline, reverse = True)
+
+    def __IsRegression(self, duration: float, baseline: Optional[float], threshold: float):
+        return baseline is not None and baseline > 0 and duration - baseline >= self.MIN_INCREASE and duration > baseline * (1 + threshold)
+
+    def __GetLatestBuildID(self, buildName: str):
+        row = self.__connection.execute("SELECT MAX(id) FROM builds WHERE buildName = ?", (buildName,)).fetchone()
+        return row[0]
@@ -0,0 +1,91 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from ..constants import ResultCode
+
+class JobStat():
+    DURATION    = "duration"
+    PEAK_MEMORY = "peakMemory"
+
+class JobStatsDatabase:
+    FORMAT_VERSION = 2
+    DEFAULT_ESTIMATES = {
+        JobStat.DURATION: 1.0,
+        JobStat.PEAK_MEMORY: 0
+    }
+
+    # Weight given to the newest measurement, older runs fade out instead of being discarded outright
+    SMOOTHING = 0.5
+
+    def __init__(self):
+        self.__stats: dict[str, dict[str, float]] = {}
+        self.__measured: dict[str, dict[str, float]] = {}
+
+    def Load(self, filePath: Path):
+        if not Path(filePath).exists():
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        try:
+            with open(filePath, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return ResultCode.ERR_STATE_INVALID
+
+        if not data.get("version") == self.FORMAT_VERSION:
+            return ResultCode.ERR_STATE_INVALID
+
+        # Several build configurations may be loaded into one database, their job keys never overlap
+        self.__stats.update(data["jobs"])
+        return ResultCode.SUCCESS
+
+    def Save(self, filePath: Path, keys: list[str]):
+        # Only jobs that are still part of the build are kept, so removed sources do not linger
+        jobs = {}
+        for key in keys:
+            stats = {}
+            for stat in self.DEFAULT_ESTIMATES.keys():
+                value = self.Get(key, stat)
+                if value is not None:
+                    stats[stat] = value
+
+            if len(stats) > 0:
+                jobs[key] = stats
+
+        os.makedirs(Path(filePath).parent, exist_ok = True)
+        tempPath = Path(f"{filePath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.FORMAT_VERSION, "jobs": jobs }, f)
+        os.replace(tempPath, filePath)
+
+        return ResultCode.SUCCESS
+
+    def Get(self, key: str, stat: str) -> Optional[float]:
+        previous = self.__stats.get(key, {}).get(stat)
+        measured = self.__measured.get(key, {}).get(stat)
+        if measured is None:
+            return previous
+        if previous is None:
+            return measured
+        return (self.SMOOTHING * measured) + ((1 - self.SMOOTHING) * previous)
+
+    def Estimate(self, key: str, stat: str, similarKeyPrefix: str):
+        value = self.Get(key, stat)
+        if value is not None:
+            return value
+
+        # Unknown jobs are assumed to be as expensive as an average job of the same kind
+        similar = [s[stat] for k, s in self.__stats.items() if k.startswith(similarKeyPrefix) and stat in s]
+        if len(similar) > 0:
+            return sum(similar) / len(similar)
+        return self.DEFAULT_ESTIMATES[stat]
+
+    def Record(self, key: str, stat: str, value: float):
+        self.__measured.setdefault(key, {})[stat] = value
@@ -0,0 +1,76 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+class FileLock:
+    # msvcrt has no blocking lock that waits indefinitely, so Windows polls
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, filePath: Path):
+        self.filePath = Path(filePath)
+        self.__file = None
+
+    def __enter__(self):
+        self.Acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.Release()
+
+    def IsHeld(self):
+        return self.__file is not None
+
+    def Acquire(self, isBlocking: bool = True):
+        # Advisory only, every zbuild process takes the same lock before touching what it guards.
+        # The lock belongs to the open file, so it is released even if the process dies
+        if self.__file is not None:
+            return True
+
+        os.makedirs(self.filePath.parent, exist_ok = True)
+        f = open(self.filePath, "a+")
+        try:
+            if os.name == "nt":
+                self.__AcquireWindows(f, isBlocking)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if isBlocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+
+        self.__file = f
+        return True
+
+    def Release(self):
+        if self.__file is None:
+            return
+
+        if os.name == "nt":
+            self.__file.seek(0)
+            msvcrt.locking(self.__file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.__file.fileno(), fcntl.LOCK_UN)
+
+        self.__file.close()
+        self.__file = None
+
+    def __AcquireWindows(self, f, isBlocking: bool):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if not isBlocking:
+                    raise
+                time.sleep(self.POLL_INTERVAL)
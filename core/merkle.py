@@ -0,0 +1,162 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from ..constants import ResultCode
+from .discovery import SourceDiscovery
+from .hashing import FileHasher
+
+class MerkleTree:
+    FORMAT_VERSION = 1
+    MAX_WORKERS = 8
+
+    def __init__(self, discovery: SourceDiscovery, hasher: FileHasher, ignoredDirs: Optional[list[Path]] = None):
+        self.discovery = discovery
+        self.hasher = hasher
+        self.baseDir = os.getcwd() if discovery.baseDir is None else discovery.baseDir
+        self.ignoredDirs = set() if ignoredDirs is None else { os.path.normcase(os.path.normpath(os.path.join(self.baseDir, d))) for d in ignoredDirs }
+        self.__records: dict[str, dict] = {}
+        self.__dirHashes: dict[str, Optional[str]] = {}
+        self.dirCount = 0
+        self.fileCount = 0
+        self.reusedCount = 0
+
+    def Load(self, filePath: Path, isMerging: bool = False):
+        if not Path(filePath).exists():
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        try:
+            with open(filePath, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return ResultCode.ERR_STATE_INVALID
+
+        if not data.get("version") == self.FORMAT_VERSION:
+            return ResultCode.ERR_STATE_INVALID
+
+        # Merging keeps what is in memory and only adds directories another process saved meanwhile
+        if isMerging:
+            for dir, record in data["directories"].items():
+                self.__records.setdefault(dir, record)
+        else:
+            self.__records = data["directories"]
+
+        return ResultCode.SUCCESS
+
+    def Save(self, filePath: Path):
+        # Directories not hashed by this run are kept for other configurations, unless they are gone
+        records = {}
+        for dir, record in self.__records.items():
+            if dir in self.__dirHashes or os.path.isdir(os.path.join(self.baseDir, dir)):
+                records[dir] = record
+
+        os.makedirs(Path(filePath).parent, exist_ok = True)
+        tempPath = Path(f"{filePath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.FORMAT_VERSION, "directories": records }, f)
+        os.replace(tempPath, filePath)
+
+        return ResultCode.SUCCESS
+
+    def GetDirectoryHash(self, dir: Path):
+        # A directory whose mtime, file stats and child hashes match its saved record keeps the saved hash. Editing a
+        # file in place leaves the directory mtime alone, so the stat per file is the one cost an unchanged tree still has
+        rootDir = os.path.normpath(dir)
+        if rootDir in self.__dirHashes:
+            return self.__dirHashes[rootDir]
+
+        if not os.path.isdir(os.path.join(self.baseDir, rootDir)):
+            return None
+
+        levels: list[list[str]] = []
+        listings: dict[str, tuple[Optional[int], list[str], list[str]]] = {}
+        frontier = [rootDir]
+        with ThreadPoolExecutor(max_workers = self.MAX_WORKERS) as pool:
+            while len(frontier) > 0:
+                levels.append(frontier)
+                nextFrontier = []
+                for d, listing in zip(frontier, pool.map(self.__GetListing, frontier)):
+                    listings[d] = listing
+                    nextFrontier.extend(os.path.join(d, n) for n in listing[2] if os.path.join(d, n) not in self.__dirHashes)
+
+                frontier = nextFrontier
+
+            filePaths = [os.path.join(d, n) for level in levels for d in level for n in listings[d][1]]
+            fileStats = dict(zip(filePaths, pool.map(self.__Stat, filePaths)))
+
+            # Only files whose size or mtime differ from the record are passed on to the hasher
+            changedPaths = [p for p in filePaths if self.__GetRecordedFile(p, fileStats[p]) is None]
+            fileHashes = dict(zip(changedPaths, pool.map(self.hasher.Hash, changedPaths)))
+
+        # Children are hashed before their parents, so each directory is derived from hashes already known
+        for level in reversed(levels):
+            for d in level:
+                mtime, fileNames, dirNames = listings[d]
+                files = {}
+                for name in fileNames:
+                    filePath = os.path.join(d, name)
+                    stat = fileStats[filePath]
+                    recorded = self.__GetRecordedFile(filePath, stat)
+                    files[name] = recorded if recorded is not None else (None if stat is None else [stat[0], stat[1], fileHashes[filePath]])
+                dirs = { name: self.__dirHashes[os.path.join(d, name)] for name in dirNames }
+
+                record = self.__records.get(d)
+                if record is not None and record["mtime"] == mtime and record["files"] == files and record["dirs"] == dirs:
+                    self.__dirHashes[d] = record["hash"]
+                    self.reusedCount += 1
+                    continue
+
+                digest = hashlib.blake2b(digest_size = 16)
+                for name in fileNames:
+                    digest.update(f"f\0{name}\0{None if files[name] is None else files[name][2]}\0".encode())
+                for name in dirNames:
+                    digest.update(f"d\0{name}\0{dirs[name]}\0".encode())
+
+                self.__dirHashes[d] = digest.hexdigest()
+                self.__records[d] = { "mtime": mtime, "hash": self.__dirHashes[d], "files": files, "dirs": dirs }
+
+        self.dirCount += len(listings)
+        self.fileCount += len(filePaths)
+        return self.__dirHashes[rootDir]
+
+    def __GetListing(self, dir: str):
+        # Names are taken from the record while the directory mtime matches, no entry was added, removed or renamed since
+        try:
+            mtime = os.stat(os.path.join(self.baseDir, dir)).st_mtime_ns
+        except OSError:
+            return (None, [], [])
+
+        record = self.__records.get(dir)
+        if record is not None and record["mtime"] == mtime:
+            return (mtime, list(record["files"].keys()), list(record["dirs"].keys()))
+
+        fileNames, dirNames = self.discovery.GetListing(dir)
+        return (mtime, fileNames, [n for n in dirNames if not self.__IsIgnored(os.path.join(dir, n))])
+
+    def __GetRecordedFile(self, filePath: str, stat: Optional[tuple[int, int]]):
+        record = self.__records.get(os.path.dirname(filePath))
+        recorded = None if record is None else record["files"].get(os.path.basename(filePath))
+        if stat is None or recorded is None or not (recorded[0] == stat[0] and recorded[1] == stat[1]):
+            return None
+
+        return recorded
+
+    def __Stat(self, filePath: str):
+        try:
+            stat = os.stat(os.path.join(self.baseDir, filePath))
+        except OSError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def __IsIgnored(self, dir: str):
+        return os.path.normcase(os.path.normpath(os.path.join(self.baseDir, dir))) in self.ignoredDirs
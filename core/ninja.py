@@ -0,0 +1,81 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import shlex
+import subprocess
+from typing import Optional
+
+class NinjaWriter:
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def Comment(self, text: str):
+        self.lines.append(f"# {text}")
+
+    def Newline(self):
+        self.lines.append("")
+
+    def Variable(self, name: str, value: str, indent: int = 0):
+        self.lines.append(f"{'  ' * indent}{name} = {value}")
+
+    def Rule(self, name: str, variables: dict[str, str]):
+        self.lines.append(f"rule {name}")
+        for key, value in variables.items():
+            self.Variable(key, value, 1)
+        self.Newline()
+
+    def Build(self, outputs: list[str], rule: str, inputs: list[str], implicit: Optional[list[str]] = None, variables: Optional[dict[str, str]] = None, implicitOutputs: Optional[list[str]] = None):
+        line = f"build {' '.join(self.EscapePath(o) for o in outputs)}"
+        if implicitOutputs is not None and len(implicitOutputs) > 0:
+            line += f" | {' '.join(self.EscapePath(o) for o in implicitOutputs)}"
+        line += f": {rule}"
+        if len(inputs) > 0:
+            line += f" {' '.join(self.EscapePath(i) for i in inputs)}"
+        if implicit is not None and len(implicit) > 0:
+            line += f" | {' '.join(self.EscapePath(i) for i in implicit)}"
+
+        self.lines.append(line)
+        if variables is not None:
+            for key, value in variables.items():
+                self.Variable(key, value, 1)
+        self.Newline()
+
+    def Default(self, targets: list[str]):
+        self.lines.append(f"default {' '.join(self.EscapePath(t) for t in targets)}")
+
+    def GetContent(self):
+        return '\n'.join(self.lines) + '\n'
+
+    def EscapePath(self, path: str):
+        return str(path).replace('$', '$$').replace(' ', '$ ').replace(':', '$:')
+
+    def Escape(self, value: str):
+        return str(value).replace('$', '$$')
+
+    def JoinCommand(self, cmd: list[str]):
+        # Ninja hands commands to /bin/sh on POSIX systems and straight to CreateProcess on Windows
+        if os.name == "nt":
+            return self.Escape(subprocess.list2cmdline(cmd))
+        return self.Escape(shlex.join(cmd))
+
+    def Write(self, filePath: Path):
+        # Returns whether the file changed, an unchanged file is only touched so ninja sees it as regenerated
+        content = self.GetContent()
+        filePath = Path(filePath)
+        if filePath.exists():
+            with open(filePath, "r") as f:
+                if f.read() == content:
+                    os.utime(filePath)
+                    return False
+
+        os.makedirs(filePath.parent, exist_ok = True)
+        tempPath = Path(f"{filePath}.tmp")
+        with open(tempPath, "w") as f:
+            f.write(content)
+        os.replace(tempPath, filePath)
+        return True
@@ -0,0 +1,133 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import cProfile
+import os
+from pathlib import Path
+import profile
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Optional
+
+from ..constants import ResultCode
+
+class SelfProfiler:
+    # Frames kept per allocation, enough to tell which caller a helper allocated for
+    ALLOCATION_FRAMES = 4
+
+    # Calls that block until a child writes output or exits, time in them belongs to the child rather than to zbuild
+    CHILD_WAIT_FUNCTIONS = {
+        "<method 'readline' of '_io.BufferedReader' objects>",
+        "<built-in method posix.wait4>",
+        "<built-in method posix.waitpid>",
+        "<built-in method _winapi.WaitForSingleObject>"
+    }
+
+    # Calls in which a thread waits for another one, e.g. the scheduler for a finished job or an idle worker for work
+    THREAD_WAIT_FUNCTIONS = {
+        "<method 'acquire' of '_thread.lock' objects>",
+        "<method 'get' of '_queue.SimpleQueue' objects>",
+        "<built-in method time.sleep>"
+    }
+
+    def __init__(self):
+        self.outputPath: Optional[Path] = None
+        self.isTracingAllocations = False
+        self.__profiles: list[cProfile.Profile] = []
+        self.__lock = threading.Lock()
+        self.__startTime = 0.0
+        self.__startTimes: Optional[os.times_result] = None
+        self.__stats: Optional[pstats.Stats] = None
+        self.__allocations: Optional[tuple[tracemalloc.Snapshot, int]] = None
+
+    @property
+    def isRunning(self):
+        return self.outputPath is not None
+
+    def Start(self, outputPath: Path):
+        # Before 3.12 cProfile only sees the thread that enabled it, threads started from here on get a profile of their own
+        self.outputPath = Path(outputPath)
+        self.__startTime = time.perf_counter()
+        self.__startTimes = os.times()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self.__ProfileThread)
+        self.__AddProfile().enable()
+
+    def StartTracingAllocations(self):
+        self.isTracingAllocations = True
+        tracemalloc.start(self.ALLOCATION_FRAMES)
+
+    def Stop(self):
+        # Profiles of threads still running stop with the main one, every worker has finished by the time zbuild quits
+        threading.setprofile(None)
+        for threadProfile in self.__profiles:
+            threadProfile.disable()
+
+        # Allocations are taken before the report is built, it would otherwise hold the most memory itself
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            _, peakSize = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.__allocations = (snapshot, peakSize)
+
+        with self.__lock:
+            self.__stats = pstats.Stats(self.__profiles[0])
+            for threadProfile in self.__profiles[1:]:
+                self.__stats.add(threadProfile)
+
+        try:
+            os.makedirs(self.outputPath.parent, exist_ok = True)
+            self.__stats.dump_stats(self.outputPath)
+        except OSError:
+            return ResultCode.ERR_GENERIC
+
+        return ResultCode.SUCCESS
+
+    def GetTimeSummary(self):
+        # Process CPU time leaves out children, the profiled time spent blocked on them says how long zbuild waited.
+        # Both counts add up the time of every thread, so they can exceed the wall time
+        wallTime = time.perf_counter() - self.__startTime
+        times = os.times()
+        ownCpuTime = (times.user - self.__startTimes.user) + (times.system - self.__startTimes.system)
+        childCpuTime = (times.children_user - self.__startTimes.children_user) + (times.children_system - self.__startTimes.children_system)
+        childWaitTime = sum(stat[2] for function, stat in self.__stats.stats.items() if function[2] in self.CHILD_WAIT_FUNCTIONS)
+        threadWaitTime = sum(stat[2] for function, stat in self.__stats.stats.items() if function[2] in self.THREAD_WAIT_FUNCTIONS)
+        profiledTime = sum(stat[2] for stat in self.__stats.stats.values())
+        return (
+            f"{wallTime:.2f}s wall, {ownCpuTime:.2f}s CPU in zbuild itself and {childCpuTime:.2f}s in children. Profiled threads spent "
+            f"{profiledTime - childWaitTime - threadWaitTime:.2f}s in zbuild code, {childWaitTime:.2f}s waiting on children and {threadWaitTime:.2f}s waiting on each other"
+        )
+
+    def GetTopFunctions(self, count: int):
+        # By own time, waits are left out since the time summary already accounts for them
+        waitFunctions = self.CHILD_WAIT_FUNCTIONS | self.THREAD_WAIT_FUNCTIONS
+        functions = [(function, stat) for function, stat in self.__stats.stats.items() if function[2] not in waitFunctions]
+        functions.sort(key = lambda f: f[1][2], reverse = True)
+        return [(f"{fileName}:{line}({name})" if line > 0 else name, stat[1], stat[2], stat[3]) for (fileName, line, name), stat in functions[:count]]
+
+    def GetTopAllocations(self, count: int):
+        # Returns the lines still holding the most memory and the peak traced size, or None when allocations were not traced.
+        # Memory held by the profiler and by tracing itself is left out
+        if self.__allocations is None:
+            return None
+
+        snapshot, peakSize = self.__allocations
+        ownFiles = [tracemalloc.__file__, cProfile.__file__, profile.__file__, pstats.__file__, __file__]
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, f) for f in ownFiles])
+        return ([(str(s.traceback[0]), s.size, s.count) for s in snapshot.statistics("lineno")[:count]], peakSize)
+
+    def __AddProfile(self):
+        threadProfile = cProfile.Profile()
+        with self.__lock:
+            self.__profiles.append(threadProfile)
+        return threadProfile
+
+    def __ProfileThread(self, frame, event, arg):
+        # Called once on the first event of a new thread, enabling a profile replaces this hook for the thread
+        self.__AddProfile().enable()
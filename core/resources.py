@@ -0,0 +1,126 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Optional
+
+class ResourceMonitor:
+    MEMINFO_PATH = Path("/proc/meminfo")
+
+    # Kept free for everything that is not a compile job, the larger of the two applies
+    MIN_RESERVED_MEMORY      = 256 * 1024 * 1024
+    RESERVED_MEMORY_FRACTION = 0.05
+
+    def __init__(self, maxLoad: Optional[float] = None):
+        cpuCount = os.cpu_count() or 1
+        self.maxLoad = (cpuCount * 1.5) if maxLoad is None else maxLoad
+
+        totalMemory = self.__ReadMeminfo("MemTotal")
+        self.reservedMemory = self.MIN_RESERVED_MEMORY
+        if totalMemory is not None:
+            self.reservedMemory = max(self.MIN_RESERVED_MEMORY, int(totalMemory * self.RESERVED_MEMORY_FRACTION))
+
+    def GetAvailableMemory(self):
+        return self.__ReadMeminfo("MemAvailable")
+
+    def GetLoadAverage(self):
+        try:
+            return os.getloadavg()[0]
+        except (AttributeError, OSError):
+            return None
+
+    def IsOverloaded(self):
+        loadAverage = self.GetLoadAverage()
+        return loadAverage is not None and loadAverage > self.maxLoad
+
+    def HasMemoryFor(self, estimatedPeakMemory: float, running: list[tuple[float, float, float]]):
+        # Running jobs are given as (start time, estimated duration, estimated peak memory)
+        availableMemory = self.GetAvailableMemory()
+        if availableMemory is None:
+            return True
+
+        # Jobs are assumed to grow towards their peak over their runtime, so memory a running job
+        # has not claimed yet is still spoken for even though it shows up as available
+        now = time.perf_counter()
+        pendingGrowth = 0.0
+        for startTime, estimatedDuration, estimatedPeak in running:
+            progress = 1.0 if estimatedDuration <= 0 else min(1.0, (now - startTime) / estimatedDuration)
+            pendingGrowth += estimatedPeak * (1.0 - progress)
+
+        return estimatedPeakMemory + pendingGrowth + self.reservedMemory <= availableMemory
+
+    def __ReadMeminfo(self, fieldName: str):
+        try:
+            with open(self.MEMINFO_PATH, "r") as f:
+                for line in f:
+                    if line.startswith(f"{fieldName}:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+
+        return None
+
+class ResourceUsage:
+    # What one or more child processes used, as reported by wait4. Peak memory is the largest of them, not a sum
+    def __init__(self):
+        self.processCount = 0
+        self.userTime = 0.0
+        self.systemTime = 0.0
+        self.peakMemory = 0
+        self.blockInputs = 0
+        self.blockOutputs = 0
+        self.voluntarySwitches = 0
+        self.involuntarySwitches = 0
+
+    @property
+    def cpuTime(self):
+        return self.userTime + self.systemTime
+
+    @staticmethod
+    def FromRusage(usage):
+        result = ResourceUsage()
+        result.processCount = 1
+        result.userTime = usage.ru_utime
+        result.systemTime = usage.ru_stime
+
+        # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+        result.peakMemory = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        result.blockInputs = usage.ru_inblock
+        result.blockOutputs = usage.ru_oublock
+        result.voluntarySwitches = usage.ru_nvcsw
+        result.involuntarySwitches = usage.ru_nivcsw
+        return result
+
+    def Add(self, other: "ResourceUsage"):
+        self.processCount += other.processCount
+        self.userTime += other.userTime
+        self.systemTime += other.systemTime
+        self.peakMemory = max(self.peakMemory, other.peakMemory)
+        self.blockInputs += other.blockInputs
+        self.blockOutputs += other.blockOutputs
+        self.voluntarySwitches += other.voluntarySwitches
+        self.involuntarySwitches += other.involuntarySwitches
+
+    def GetSummary(self):
+        return (
+            f"{self.userTime:.2f}s user, {self.systemTime:.2f}s system, peak RSS {self.peakMemory / (1024 * 1024):.1f} MiB, "
+            f"{self.blockInputs}/{self.blockOutputs} blocks in/out, {self.voluntarySwitches}/{self.involuntarySwitches} voluntary/involuntary switches"
+        )
+
+    def ToDict(self):
+        return {
+            "processCount": self.processCount,
+            "userTime": self.userTime,
+            "systemTime": self.systemTime,
+            "peakMemory": self.peakMemory,
+            "blockInputs": self.blockInputs,
+            "blockOutputs": self.blockOutputs,
+            "voluntarySwitches": self.voluntarySwitches,
+            "involuntarySwitches": self.involuntarySwitches
+        }
@@ -0,0 +1,59 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import re
+from typing import Optional
+
+class IncludeScanner:
+    INCLUDE_PATTERN = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"]+)[>"]', re.MULTILINE)
+
+    def __init__(self, includeDirectories: list[Path], directiveCache: Optional[dict[Path, list]] = None, baseDir: Optional[Path] = None):
+        # The directive cache only depends on file contents, so scanners with different include paths can share it
+        self.baseDir = Path(os.getcwd()) if baseDir is None else Path(baseDir)
+        self.includeDirectories = [Path(d) for d in includeDirectories]
+        self.directiveCache = {} if directiveCache is None else directiveCache
+        self.__cache: dict[Path, list[Path]] = {}
+
+    def Scan(self, filePath: Path):
+        # Returns the project headers directly included by the given file, system headers are skipped
+        filePath = Path(filePath)
+        if filePath in self.__cache:
+            return self.__cache[filePath]
+
+        includes = []
+        for isQuoted, name in self.__GetDirectives(filePath):
+            searchDirs = self.includeDirectories
+            if isQuoted:
+                searchDirs = [filePath.parent] + searchDirs
+
+            for dir in searchDirs:
+                candidate = dir / name
+                if (self.baseDir / candidate).is_file():
+                    includes.append(Path(os.path.normpath(candidate)))
+                    break
+
+        self.__cache[filePath] = includes
+        return includes
+
+    def __GetDirectives(self, filePath: Path):
+        directives = self.directiveCache.get(filePath)
+        if directives is not None:
+            return directives
+
+        directives = []
+        try:
+            with open(self.baseDir / filePath, "rb") as f:
+                content = f.read()
+        except OSError:
+            content = b""
+
+        for match in self.INCLUDE_PATTERN.finditer(content):
+            directives.append((match.group(1) == b'"', match.group(2).decode(errors = "replace")))
+
+        self.directiveCache[filePath] = directives
+        return directives
@@ -0,0 +1,312 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import heapq
+import queue
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+from ..constants import ResultCode
+from .jobstats import JobStat, JobStatsDatabase
+from .resources import ResourceMonitor, ResourceUsage
+
+class FailureMode():
+    # What happens to other jobs once one fails
+    STOP       = "stop"
+    FAIL_FAST  = "failFast"
+    KEEP_GOING = "keepGoing"
+
+class JobType():
+    ARCHIVE = "archive"
+    COMPILE = "compile"
+    LINK    = "link"
+
+class Job:
+    def __init__(self, jobType: str, command: list[str], outputPath: str, stepName: str, dependencies: Optional[list["Job"]] = None, buildName: Optional[str] = None):
+        self.jobType = jobType
+        self.command = command
+        self.outputPath = outputPath
+        self.stagingPath: Optional[str] = None
+
+        # Directories the job writes to besides the one of its output, created right before it runs
+        self.outputDirs: list[str] = []
+        self.slots = 1
+        self.stepName = stepName
+        self.buildName = buildName
+        self.dependencies: list[Job] = [] if dependencies is None else dependencies
+        self.dependents: list[Job] = []
+        self.estimate = 0.0
+        self.estimatedMemory = 0.0
+        self.priority = 0.0
+        self.startTime: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.peakMemory: Optional[int] = None
+        self.usage: Optional[ResourceUsage] = None
+        self.resultCode: Optional[int] = None
+        self.isSkipped = False
+
+        for dependency in self.dependencies:
+            dependency.dependents.append(self)
+
+    @property
+    def key(self):
+        return f"{self.jobType}:{self.outputPath}"
+
+class JobScheduler:
+    # How often a held back job is reconsidered while nothing finishes
+    ADMISSION_POLL_INTERVAL = 0.25
+
+    # How far down the ready queue to look for a job that fits when the first one does not
+    MAX_ADMISSION_CANDIDATES = 32
+
+    def __init__(self, jobCount: int, stats: JobStatsDatabase, execute: Callable[[Job], int], monitor: Optional[ResourceMonitor] = None, progress: Optional[Callable[[int, int, list[Job], float], None]] = None, failureMode: str = FailureMode.STOP, cancel: Optional[Callable[[], None]] = None):
+        # progress is called from the scheduling thread with finished and total job counts, running jobs and the estimated time left.
+        # After a failure nothing new starts and running jobs finish, unless failureMode says otherwise. cancel stops the jobs
+        # still running, the scheduler itself cannot interrupt them. It is called on a failure with FailureMode.FAIL_FAST
+        # and when the build is interrupted
+        self.jobCount = max(1, jobCount)
+        self.stats = stats
+        self.execute = execute
+        self.monitor = monitor
+        self.progress = progress
+        self.failureMode = failureMode
+        self.cancel = cancel
+        self.wallTime = 0.0
+        self.heldForLoadCount = 0
+        self.heldForMemoryCount = 0
+        self.skippedCount = 0
+
+    def Run(self, jobs: list[Job]):
+        return self.RunStreaming(iter([jobs]))
+
+    def RunStreaming(self, batches: Iterator[list[Job]]):
+        # Batches are pulled on a separate thread and scheduled as they arrive, so jobs start while later ones are still
+        # being planned. A job may depend on jobs of its own or an earlier batch, never on a later one
+        incoming = queue.Queue()
+        feeder = threading.Thread(target = self.__Feed, args = (batches, incoming), daemon = True)
+        feeder.start()
+
+        pendingCounts: dict[int, int] = {}
+        ready = []
+        order = 0
+        totalCount = 0
+        finishedCount = 0
+        remainingWork = 0.0
+        isFeeding = True
+        feedError = None
+        isStarting = True
+        resultCode = ResultCode.SUCCESS
+        running: dict[Future, Job] = {}
+        startTime = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = self.jobCount) as pool:
+            # Jobs may run children that never see a Ctrl+C meant for zbuild, so they are stopped here.
+            # The pool waits for every worker on the way out, which only returns once their children are gone
+            try:
+                while isFeeding or len(running) > 0 or (len(ready) > 0 and isStarting):
+                    # With nothing to run or wait on, the next batch is waited for instead of polling
+                    while isFeeding:
+                        isIdle = len(running) == 0 and (len(ready) == 0 or not isStarting)
+                        try:
+                            batch = incoming.get(block = isIdle)
+                        except queue.Empty:
+                            break
+
+                        if batch is None or isinstance(batch, BaseException):
+                            isFeeding = False
+                            feedError = batch
+                            break
+
+                        # Dependencies from earlier batches that already finished no longer hold a job back. Queued ones may
+                        # now start a longer path, the queue is ordered again with their new priority
+                        if self.__Prioritize(batch):
+                            ready = [self.__GetReadyEntry(entry[-1], entry[2]) for entry in ready]
+                            heapq.heapify(ready)
+                        totalCount += len(batch)
+                        for job in batch:
+                            remainingWork += job.estimate
+                            pendingCounts[id(job)] = sum(1 for d in job.dependencies if d.resultCode is None)
+                            if any(d.isSkipped or d.resultCode not in (None, ResultCode.SUCCESS) for d in job.dependencies):
+                                for skippedJob in self.__SkipDownstream([job], pendingCounts):
+                                    finishedCount += 1
+                                    remainingWork -= skippedJob.estimate
+                            elif pendingCounts[id(job)] == 0:
+                                heapq.heappush(ready, self.__GetReadyEntry(job, order))
+                            order += 1
+
+                    # Jobs depending on a failed one never become ready, so keeping going only runs what the failure does not affect
+                    while len(ready) > 0 and isStarting and self.__HasSlotsFor(ready[0][-1], running.values()):
+                        job = self.__PopAdmissible(ready, list(running.values()))
+                        if job is None:
+                            break
+
+                        job.startTime = time.perf_counter()
+                        running[pool.submit(self.__Execute, job)] = job
+
+                    if len(running) == 0:
+                        continue
+
+                    finished, _ = wait(running.keys(), timeout = self.ADMISSION_POLL_INTERVAL, return_when = FIRST_COMPLETED)
+                    for future in finished:
+                        job = running.pop(future)
+                        job.resultCode = future.result()
+                        finishedCount += 1
+                        remainingWork -= job.estimate
+                        if not job.resultCode == ResultCode.SUCCESS:
+                            if resultCode == ResultCode.SUCCESS:
+                                resultCode = job.resultCode
+                                isStarting = self.failureMode == FailureMode.KEEP_GOING
+                                if self.failureMode == FailureMode.FAIL_FAST and self.cancel is not None:
+                                    self.cancel()
+
+                            for skippedJob in self.__SkipDownstream(job.dependents, pendingCounts):
+                                finishedCount += 1
+                                remainingWork -= skippedJob.estimate
+                            continue
+
+                        self.stats.Record(job.key, JobStat.DURATION, job.duration)
+                        if job.peakMemory is not None:
+                            self.stats.Record(job.key, JobStat.PEAK_MEMORY, job.peakMemory)
+
+                        # Dependents from batches not taken in yet are passed over, they see this job as finished when they arrive.
+                        # A dependent skipped for another failed dependency never becomes ready
+                        for dependent in list(job.dependents):
+                            if id(dependent) not in pendingCounts or dependent.isSkipped:
+                                continue
+
+                            pendingCounts[id(dependent)] -= 1
+                            if pendingCounts[id(dependent)] == 0:
+                                heapq.heappush(ready, self.__GetReadyEntry(dependent, order))
+                                order += 1
+
+                    if self.progress is not None:
+                        self.progress(finishedCount, totalCount, list(running.values()), self.__GetRemainingTime(remainingWork, running.values()))
+            except KeyboardInterrupt:
+                if self.cancel is not None:
+                    self.cancel()
+                raise
+
+        self.wallTime = time.perf_counter() - startTime
+        if feedError is not None:
+            raise feedError
+
+        return resultCode
+
+    def GetLowerBound(self, jobs: list[Job]):
+        # The build can finish no sooner than its longest dependency chain or its total work spread over every slot
+        finishTimes: dict[int, float] = {}
+        totalWork = 0.0
+        for job in jobs:
+            duration = job.duration if job.duration is not None else 0.0
+            totalWork += duration
+            start = max((finishTimes[id(d)] for d in job.dependencies), default = 0.0)
+            finishTimes[id(job)] = start + duration
+
+        criticalPath = max(finishTimes.values(), default = 0.0)
+        return (max(criticalPath, totalWork / self.jobCount), criticalPath, totalWork)
+
+    def __SkipDownstream(self, jobs: list[Job], pendingCounts: dict[int, int]):
+        # Marks the jobs and everything already taken in that depends on them as never to run. Jobs of batches not taken
+        # in yet are marked when they arrive, since one of their dependencies is then failed or skipped
+        skipped = []
+        pending = list(jobs)
+        while len(pending) > 0:
+            job = pending.pop()
+            if job.isSkipped or id(job) not in pendingCounts:
+                continue
+
+            job.isSkipped = True
+            skipped.append(job)
+            pending.extend(job.dependents)
+
+        self.skippedCount += len(skipped)
+        return skipped
+
+    def __HasSlotsFor(self, job: Job, running):
+        # A job wider than the pool still runs once everything else is done. Narrower jobs behind it wait their turn
+        # rather than starve it, so it starts as soon as enough slots are free
+        usedSlots = sum(j.slots for j in running)
+        return usedSlots == 0 or usedSlots + min(job.slots, self.jobCount) <= self.jobCount
+
+    def __GetRemainingTime(self, remainingWork: float, running):
+        # Work already done by running jobs is taken off their estimate, what is left is spread over every slot
+        now = time.perf_counter()
+        doneWork = sum(min(now - job.startTime, job.estimate) for job in running)
+        return max(0.0, remainingWork - doneWork) / self.jobCount
+
+    def __Prioritize(self, jobs: list[Job]):
+        # Jobs are given in dependency order, walking backwards lets each job see its dependents' priority
+        for job in jobs:
+            job.estimate = self.stats.Estimate(job.key, JobStat.DURATION, f"{job.jobType}:")
+            job.estimatedMemory = self.stats.Estimate(job.key, JobStat.PEAK_MEMORY, f"{job.jobType}:")
+
+        for job in reversed(jobs):
+            job.priority = job.estimate + max((d.priority for d in job.dependents), default = 0.0)
+
+        # Jobs of earlier batches were prioritized before these dependents existed, the longer paths are carried back to them.
+        # Returns whether any of them changed
+        batchIDs = { id(job) for job in jobs }
+        pending = list(jobs)
+        isChanged = False
+        while len(pending) > 0:
+            job = pending.pop()
+            for dependency in job.dependencies:
+                if id(dependency) in batchIDs or dependency.estimate + job.priority <= dependency.priority:
+                    continue
+
+                dependency.priority = dependency.estimate + job.priority
+                isChanged = True
+                pending.append(dependency)
+
+        return isChanged
+
+    def __GetReadyEntry(self, job: Job, order: int):
+        # Highest remaining path first, longest job breaks ties, then original order keeps it stable
+        return (-job.priority, -job.estimate, order, job)
+
+    def __PopAdmissible(self, ready: list, running: list[Job]):
+        # With nothing running a job is always started, holding back would never free anything up
+        if self.monitor is None or len(running) == 0:
+            return heapq.heappop(ready)[-1]
+
+        if self.monitor.IsOverloaded():
+            self.heldForLoadCount += 1
+            return None
+
+        # Heavy jobs wait for headroom, but smaller ones further down the queue may still start meanwhile
+        runningEstimates = [(j.startTime, j.estimate, j.estimatedMemory) for j in running]
+        skipped = []
+        admitted = None
+        while len(ready) > 0 and len(skipped) < self.MAX_ADMISSION_CANDIDATES:
+            entry = heapq.heappop(ready)
+            if self.monitor.HasMemoryFor(entry[-1].estimatedMemory, runningEstimates):
+                admitted = entry[-1]
+                break
+            skipped.append(entry)
+
+        for entry in skipped:
+            heapq.heappush(ready, entry)
+
+        if admitted is None:
+            self.heldForMemoryCount += 1
+
+        return admitted
+
+    def __Feed(self, batches: Iterator[list[Job]], incoming: queue.Queue):
+        # Errors raised while producing batches are handed over and raised again on the scheduling thread
+        try:
+            for batch in batches:
+                if len(batch) > 0:
+                    incoming.put(batch)
+            incoming.put(None)
+        except BaseException as e:
+            incoming.put(e)
+
+    def __Execute(self, job: Job):
+        resultCode = self.execute(job)
+        job.duration = time.perf_counter() - job.startTime
+        return resultCode
@@ -0,0 +1,183 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import shutil
+import subprocess
+from typing import Optional
+
+from ..constants import ResultCode
+
+class ToolchainInfo:
+    def __init__(self, compilerPath: str, version: str, target: str, systemIncludeDirectories: list[str]):
+        self.compilerPath = compilerPath
+        self.version = version
+        self.target = target
+        self.systemIncludeDirectories = systemIncludeDirectories
+
+    def GetIdentity(self):
+        # Anything that could make the same command produce different output belongs in here. Where the compiler is
+        # installed does not, machines with the same compiler elsewhere then agree on it. Its own include directories
+        # are hashed relative to its install prefix for that reason
+        installPrefix = self.GetInstallPrefix()
+        digest = hashlib.blake2b(digest_size = 16)
+        for value in [self.version, self.target] + [self.__GetPrefixRelativePath(d, installPrefix) for d in self.systemIncludeDirectories]:
+            digest.update(f"{value}\0".encode())
+
+        return digest.hexdigest()
+
+    def GetInstallPrefix(self):
+        # Compilers are installed under <prefix>/bin, cl further down under <prefix>/bin/<host>/<target>
+        compilerPath = Path(self.compilerPath)
+        for dir in compilerPath.parents:
+            if dir.name.lower() == "bin":
+                return dir.parent
+
+        return compilerPath.parent
+
+    def __GetPrefixRelativePath(self, dir: str, installPrefix: Path):
+        try:
+            return f"<prefix>/{Path(dir).relative_to(installPrefix).as_posix()}"
+        except ValueError:
+            return dir
+
+    def ToDict(self):
+        return {
+            "compilerPath": self.compilerPath,
+            "version": self.version,
+            "target": self.target,
+            "systemIncludeDirectories": self.systemIncludeDirectories
+        }
+
+class ToolchainProbe:
+    FORMAT_VERSION = 1
+    PROBE_TIMEOUT = 30
+
+    # Environment variables that change which headers or tools a compiler picks up
+    GNU_ENVIRONMENT  = ["CPATH", "C_INCLUDE_PATH", "CPLUS_INCLUDE_PATH", "GCC_EXEC_PREFIX", "COMPILER_PATH", "SDKROOT"]
+    MSVC_ENVIRONMENT = ["INCLUDE", "EXTERNAL_INCLUDE", "VCToolsVersion", "VSCMD_ARG_TGT_ARCH"]
+
+    GNU_VERSION_PATTERN  = re.compile(r'^(?:gcc|clang|Apple clang|.*clang) version .*$', re.MULTILINE)
+    GNU_TARGET_PATTERN   = re.compile(r'^Target: (\S+)$', re.MULTILINE)
+    MSVC_BANNER_PATTERN  = re.compile(r'Compiler Version (\S+) for (\S+)')
+
+    def __init__(self):
+        self.__probes: dict[str, dict] = {}
+        self.probedCount = 0
+
+    def Load(self, filePath: Path, isMerging: bool = False):
+        if not Path(filePath).exists():
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        try:
+            with open(filePath, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return ResultCode.ERR_STATE_INVALID
+
+        if not data.get("version") == self.FORMAT_VERSION:
+            return ResultCode.ERR_STATE_INVALID
+
+        # Merging keeps what is in memory and only adds compilers another process probed meanwhile
+        if isMerging:
+            for compilerName, probe in data["probes"].items():
+                self.__probes.setdefault(compilerName, probe)
+        else:
+            self.__probes = data["probes"]
+
+        return ResultCode.SUCCESS
+
+    def Save(self, filePath: Path):
+        os.makedirs(Path(filePath).parent, exist_ok = True)
+        tempPath = Path(f"{filePath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.FORMAT_VERSION, "probes": self.__probes }, f, indent = 4)
+        os.replace(tempPath, filePath)
+
+        return ResultCode.SUCCESS
+
+    def Probe(self, compilerName: str):
+        # Returns None when the compiler cannot be found or run
+        compilerPath = shutil.which(compilerName)
+        if compilerPath is None:
+            return None
+
+        # The driver is usually a symlink to a versioned binary, which is what actually changes on an upgrade
+        compilerPath = os.path.realpath(compilerPath)
+        try:
+            stat = os.stat(compilerPath)
+        except OSError:
+            return None
+
+        isMSVC = compilerName == "cl"
+        environment = { name: os.environ.get(name) for name in (self.MSVC_ENVIRONMENT if isMSVC else self.GNU_ENVIRONMENT) }
+        key = json.dumps([compilerPath, stat.st_mtime_ns, stat.st_size, environment])
+
+        probe = self.__probes.get(compilerName)
+        if probe is None or not probe["key"] == key:
+            info = self.__RunMSVCProbe(compilerPath) if isMSVC else self.__RunGNUProbe(compilerPath)
+            if info is None:
+                return None
+
+            self.probedCount += 1
+            probe = { "key": key, "info": info.ToDict() }
+            self.__probes[compilerName] = probe
+
+        info = probe["info"]
+        return ToolchainInfo(info["compilerPath"], info["version"], info["target"], info["systemIncludeDirectories"])
+
+    def __RunGNUProbe(self, compilerPath: str):
+        output = self.__RunProbe([compilerPath, "-v", "-E", "-x", "c", os.devnull])
+        if output is None:
+            return None
+
+        versionMatch = self.GNU_VERSION_PATTERN.search(output)
+        targetMatch = self.GNU_TARGET_PATTERN.search(output)
+
+        # Search directories are listed one per line with a leading space between these two markers
+        includeDirectories = []
+        isInSearchList = False
+        for line in output.splitlines():
+            if line.startswith("#include <...> search starts here:"):
+                isInSearchList = True
+            elif line.startswith("End of search list."):
+                isInSearchList = False
+            elif isInSearchList and line.startswith(" "):
+                includeDirectories.append(os.path.normpath(line.strip().removesuffix(" (framework directory)")))
+
+        return ToolchainInfo(
+            compilerPath,
+            "" if versionMatch is None else versionMatch.group(0).strip(),
+            "" if targetMatch is None else targetMatch.group(1),
+            includeDirectories
+        )
+
+    def __RunMSVCProbe(self, compilerPath: str):
+        # cl prints its banner when run without arguments, include paths come from the environment it was set up with
+        output = self.__RunProbe([compilerPath])
+        if output is None:
+            return None
+
+        bannerMatch = self.MSVC_BANNER_PATTERN.search(output)
+        includeDirectories = [os.path.normpath(d) for d in os.environ.get("INCLUDE", "").split(os.pathsep) if not d == ""]
+        return ToolchainInfo(
+            compilerPath,
+            "" if bannerMatch is None else bannerMatch.group(1),
+            "" if bannerMatch is None else bannerMatch.group(2),
+            includeDirectories
+        )
+
+    def __RunProbe(self, cmd: list[str]):
+        try:
+            result = subprocess.run(cmd, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, stdin = subprocess.DEVNULL, timeout = self.PROBE_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+
+        return result.stdout.decode(errors = "replace")
@@ -4,216 +4,1614 @@ Licensed under the MIT license.
 See LICENSE file in the project root for full license information.
 '''
 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import os
 from pathlib import Path
+import shutil
+import signal
 import subprocess
+import threading
+import time
+from typing import Optional
 
-from constants import ReservedValues, ResultCode
-from services.configuration import ConfigurationService, PathType
-from services.output import OutputService
+from ..constants import Configuration, ReservedValues, ResultCode
+from ..core.depgraph import DependencyGraph, NodeType
+from ..core.diagnostics import DiagnosticParser, Severity
+from ..core.discovery import SourceDiscovery
+from ..core.hashing import CommandHasher, FileHasher
+from ..core.history import BuildHistory, BuildRecord
+from ..core.jobstats import JobStatsDatabase
+from ..core.locking import FileLock
+from ..core.merkle import MerkleTree
+from ..core.ninja import NinjaWriter
+from ..core.resources import ResourceMonitor, ResourceUsage
+from ..core.scanner import IncludeScanner
+from ..core.scheduler import FailureMode, Job, JobScheduler, JobType
+from ..core.toolchain import ToolchainInfo, ToolchainProbe
+from .configuration import ConfigurationService, PathType
+from .output import MessageType, OutputService
+
+class StepStatus():
+    BUILT      = "built"
+    UP_TO_DATE = "upToDate"
+    FAILED     = "failed"
+    SKIPPED    = "skipped"
+
+class _BuildStep():
+    def __init__(self, name: str):
+        self.name = name
+        self.targetType = None
+        self.targetPath: Optional[Path] = None
+        self.objectDir: Optional[Path] = None
+        self.debugSymbolsDir: Optional[Path] = None
+        self.defines: dict = {}
+        self.includeDirectories: list[Path] = []
+        self.sourceDirectories: list[Path] = []
+        self.dynamicLibraries: list[str] = []
+        self.staticLibraries: list[str] = []
+        self.additionalArgs: list[str] = []
+        self.isLto = False
+        self.isThinArchive = False
+        self.sourcePatterns: list[str] = []
+        self.excludePatterns: list[str] = []
+        self.sourceFiles: list[Path] = []
+        self.objectFiles: dict[Path, Path] = {}
+        self.compileCommands: dict[Path, list[str]] = {}
+        self.linkCommand: list[str] = []
+        self.compileJobs: list[Job] = []
+        self.linkJob: Optional[Job] = None
+        self.usage: Optional[ResourceUsage] = None
+        self.digest: Optional[str] = None
+        self.treeHash: Optional[str] = None
+        self.closureDirectories: list[str] = []
+        self.scanner: Optional[IncludeScanner] = None
+
+class _BuildConfiguration():
+    def __init__(self, config: ConfigurationService):
+        self.config = config
+        self.buildName = config.GetBuildName()
+        self.steps: list[_BuildStep] = []
+        self.graph = DependencyGraph()
+        self.isGraphLoaded = False
+        self.diagnostics: Optional[DiagnosticParser] = None
+        self.manifest: dict[str, dict] = {}
+        self.objectCommands: dict[Path, list[str]] = {}
+        self.compileJobs: dict[Path, Job] = {}
+        self.archives: dict[str, dict] = {}
+        self.stepInputs: Optional[dict[str, dict]] = None
+        self.compileUnits: dict[str, tuple[Path, IncludeScanner]] = {}
+
+        # Hashes of the inputs as units read them, taken before each compile starts or when a unit is found up to date
+        self.readHashes: dict[Path, Optional[str]] = {}
+        self.readLock = threading.Lock()
+        self.lastResultCode = ResultCode.SUCCESS
+
+class BuildCache():
+    def __init__(self, projectRoot: Path):
+        # Kept by callers that build the same project many times, everything in here stays valid between builds
+        self.projectRoot = Path(projectRoot)
+        self.hasher = FileHasher(self.projectRoot)
+        self.discovery = SourceDiscovery(self.projectRoot)
+        self.probe = ToolchainProbe()
+        self.graphs: dict[str, DependencyGraph] = {}
+        self.isLoaded = False
 
 class CompilerService:
-    def __init__(self, config: ConfigurationService, output: OutputService):
+    MANIFEST_FORMAT_VERSION = 4
+    MAX_OUTPUT_LINE_LENGTH = 4096
+    MAX_BUFFERED_LINES     = 1000
+    MAX_PROGRESS_JOBS      = 3
+    USAGE_REPORT_SIZE      = 10
+    USAGE_FORMAT_VERSION   = 1
+    REGRESSION_REPORT_SIZE = 5
+    OBJECT_MAP_VERSION     = 1
+    ARCHIVE_FORMAT_VERSION = 1
+    INPUTS_FORMAT_VERSION  = 1
+    MAX_CLEANUP_WORKERS    = 8
+
+    # Outputs are written under this directory next to their final path and renamed into place once complete
+    STAGING_DIR_NAME = ".partial"
+
+    # Kept directly under the object output directory, a full build clears the directories of its configuration only
+    LTO_CACHE_DIR_NAME = "lto-cache"
+
+    # Recorded for a file read in two versions during one build, it never matches a real hash
+    CHANGED_HASH = "changed"
+
+    # Objects of a source compiled with other arguments than the first step compiling it go under a directory named after their command
+    VARIANT_DIR_PREFIX  = "variant-"
+    VARIANT_HASH_LENGTH = 12
+
+    def __init__(self, configs: list[ConfigurationService], output: OutputService, jobCount: Optional[int] = None, maxLoad: Optional[float] = None, cache: Optional[BuildCache] = None, isReportingUsage: bool = False, failureMode: str = FailureMode.STOP, isExplainingMisses: bool = False):
+        # Root configuration values are the same for every build configuration, the first one answers for all.
+        # Paths are kept relative to the project root and resolved against it, the working directory is never used
         self.output = output
-        self.config = config
-        self.buildName = self.config.GetBuildName()
-        self.errorIndicator = None
-        self.warningIndicator = None
+        self.config = configs[0]
+        self.projectRoot = Path(self.config.GetProjectRoot())
+        self.jobCount = os.cpu_count() if jobCount is None else jobCount
+        self.maxLoad = maxLoad
+        self.isReportingUsage = isReportingUsage
+        self.failureMode = failureMode
+        self.isExplainingMisses = isExplainingMisses
         self.lastResultCode = ResultCode.SUCCESS
 
+        # Everything below is shared between the build configurations, so the tree is scanned and hashed once
+        self.builds: dict[str, _BuildConfiguration] = { c.GetBuildName(): _BuildConfiguration(c) for c in configs }
+        self.cache = BuildCache(self.projectRoot) if cache is None else cache
+        self.hasher = self.cache.hasher
+
+        # Paths under the project root are relative in commands, except where one was given absolute and in the prefix map
+        self.commandHasher = CommandHasher(self.projectRoot)
+        self.jobStats = JobStatsDatabase()
+        self.discovery = self.cache.discovery
+        self.includeDirectives: dict[Path, list] = {}
+        self.tree: Optional[MerkleTree] = None
+        self.compilerName = None
+        self.objectExtension = None
+        self.toolchain: Optional[ToolchainInfo] = None
+        self.linker = None
+        self.linkerThreads = None
+        self.isSplitDebugInfo = False
+        self.toolchainIdentity = ""
+        self.jobs: list[Job] = []
+        self.sharedCompileCount = 0
+
+        # Children still running, so a failure can stop them with FailureMode.FAIL_FAST
+        self.processes: set[subprocess.Popen] = set()
+        self.processLock = threading.Lock()
+        self.isCancelled = False
+        self.wallTime = 0.0
+
     def Compile(self):
-        dir = self.config.GetTargetOutputDir(PathType.ABSOLUTE) / self.buildName
-        if dir.exists():
-            self.__ClearDirTree(dir)
+        return self.__Build(False)
+
+    def Update(self):
+        # Unlike Compile nothing is wiped, only steps whose manifest digest changed are rebuilt
+        return self.__Build(True)
+
+    def GetBuildSteps(self, buildName: str):
+        return self.builds[buildName].steps
+
+    def GetStepStatus(self, step: _BuildStep):
+        if step.linkJob is None:
+            return StepStatus.UP_TO_DATE
+
+        jobs = step.compileJobs + [step.linkJob]
+        if step.linkJob.resultCode == ResultCode.SUCCESS:
+            return StepStatus.BUILT
+        elif any(j.resultCode not in (None, ResultCode.SUCCESS, ResultCode.WRN_JOB_CANCELLED) for j in jobs):
+            return StepStatus.FAILED
+        return StepStatus.SKIPPED
+
+    def GetDiagnostics(self, buildName: str):
+        return self.builds[buildName].diagnostics
+
+    def GenerateNinja(self, appCommand: list[str]):
+        # Steps are planned exactly as for a build, ninja then runs the same commands with its own scheduler
+        self.__SelectToolchain()
+        self.__LoadCache()
+
+        for build in self.builds.values():
+            while build.config.LoadNextBuildStep() == ResultCode.SUCCESS and self.lastResultCode == ResultCode.SUCCESS:
+                self.lastResultCode = self.__PlanBuildStep(build)
+
+            if not self.lastResultCode == ResultCode.SUCCESS:
+                return self.lastResultCode
+
+        self.__SaveSharedCache(self.discovery, self.config.GetStatePath(Configuration.State.Files.DIRECTORY_CACHE, PathType.ABSOLUTE))
+
+        for build in self.builds.values():
+            ninjaPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.NINJA_BUILD, PathType.RELATIVE)
+            writer = self.__GetNinjaWriter(build, ninjaPath, appCommand)
+            if writer.Write(self.projectRoot / ninjaPath):
+                self.output.SendInfo(f"Generated '{ninjaPath}' for '{build.buildName}', build it with 'ninja -f {ninjaPath}' from '{build.config.GetProjectRoot()}'")
+            else:
+                self.output.SendInfo(f"'{ninjaPath}' for '{build.buildName}' is up to date")
+
+        return ResultCode.SUCCESS
+
+    def __GetNinjaWriter(self, build: _BuildConfiguration, ninjaPath: Path, appCommand: list[str]):
+        writer = NinjaWriter()
+        writer.Comment(f"Generated by zbuild for '{build.buildName}', changes are overwritten on the next generation")
+        writer.Variable("ninja_required_version", "1.7")
+        writer.Variable("builddir", writer.EscapePath(ninjaPath.parent))
+        writer.Newline()
+
+        # Header dependencies come from the compiler itself, in place of the include scanner used by zbuild
+        if self.compilerName == "cl":
+            writer.Rule("compile", { "command": "$cmd /showIncludes", "deps": "msvc", "description": "CC $out" })
         else:
-            os.makedirs(dir)
+            writer.Rule("compile", { "command": "$cmd -MD -MF $out.d", "depfile": "$out.d", "deps": "gcc", "description": "CC $out" })
+
+        writer.Rule("link", { "command": "$cmd", "description": "LINK $out" })
+
+        # ar only adds and replaces members, an archive is started over so members of removed sources do not linger
+        if self.compilerName == "cl":
+            writer.Rule("archive", { "command": "$cmd", "description": "AR $out" })
+        else:
+            writer.Rule("archive", { "command": "rm -f $out && $cmd", "description": "AR $out" })
+
+        # Adding or removing a source changes the mtime of its directory, which reruns discovery through this rule
+        writer.Rule("generate", { "command": writer.JoinCommand(appCommand + [build.buildName]), "generator": "1", "description": "Regenerating $out" })
+        generatorInputs = [str(self.config.GetConfigDir() / self.config.GetRootConfigFilename()), str(build.config.GetBuildConfigPath(build.buildName))]
+        generatorInputs.extend(self.discovery.GetVisitedDirectories())
+        writer.Build([str(ninjaPath)], "generate", [], generatorInputs)
+
+        previousTarget = None
+        writtenObjects = set()
+        for step in build.steps:
+            writer.Comment(f"Build step '{step.name}'")
+            for sourceFile, objectFile in step.objectFiles.items():
+                # Ninja allows one edge per output, objects shared with an earlier step are already written
+                if objectFile in writtenObjects:
+                    continue
 
-        os.makedirs(self.config.GetObjectOutputDir(PathType.ABSOLUTE) / self.buildName, exist_ok = True)
-        os.makedirs(self.config.GetDebugSymbolsOutputDir(PathType.ABSOLUTE) / self.buildName, exist_ok = True)
-        
+                # Ninja creates the directories of every output, split debug info is listed for that
+                writtenObjects.add(objectFile)
+                debugSymbolsDir = self.__GetSplitDebugInfoDir(step, sourceFile)
+                debugInfoFiles = [] if debugSymbolsDir is None else [str(debugSymbolsDir / f"{objectFile.stem}.dwo")]
+                writer.Build([str(objectFile)], "compile", [str(sourceFile)], variables = { "cmd": writer.JoinCommand(step.compileCommands[sourceFile]) }, implicitOutputs = debugInfoFiles)
+
+            # Later steps may link against earlier targets, so each link waits on the one before it as zbuild does
+            writer.Build(
+                [str(step.targetPath)],
+                "archive" if step.targetType == ReservedValues.Configuration.Build.Target.Type.ARCHIVE else "link",
+                [str(o) for o in step.objectFiles.values()],
+                None if previousTarget is None else [str(previousTarget)],
+                { "cmd": writer.JoinCommand(step.linkCommand) }
+            )
+            previousTarget = step.targetPath
+
+        writer.Build(["all"], "phony", [str(s.targetPath) for s in build.steps])
+        writer.Default(["all"])
+        return writer
+
+    def __SelectToolchain(self):
         toolchain = self.config.GetToolchain()
         self.output.SendInfo(f"Active toolchain is {toolchain}")
-        compileFunction = None
 
         if toolchain == ReservedValues.Configuration.Root.Toolchain.CLANG:
-            self.errorIndicator = None
-            self.warningIndicator = None
-            compileFunction = self.__CompileWithClang
+            self.compilerName = "clang"
+            self.objectExtension = "o"
         elif toolchain == ReservedValues.Configuration.Root.Toolchain.GCC:
-            self.errorIndicator = None
-            self.warningIndicator = None
-            compileFunction = self.__CompileWithGCC
+            self.compilerName = "gcc"
+            self.objectExtension = "o"
         elif toolchain == ReservedValues.Configuration.Root.Toolchain.MSVC:
-            self.errorIndicator = "error"
-            self.warningIndicator = "warning"
-            compileFunction = self.__CompileWithMSVC
+            self.compilerName = "cl"
+            self.objectExtension = "obj"
+
+        self.linker = self.config.GetLinker()
+        self.linkerThreads = self.config.GetLinkerThreads()
+        self.isSplitDebugInfo = self.config.IsSplitDebugInfoEnabled()
+        if self.compilerName == "cl" and (self.linker is not None or self.linkerThreads is not None):
+            self.output.SendWarning("Linker type and threads are ignored by the msvc toolchain, cl always links with link.exe")
+        elif self.linkerThreads is not None and self.linker in (None, ReservedValues.Configuration.Root.Linker.BFD):
+            self.output.SendWarning("Linker threads are ignored without a threaded linker, set the linker type to gold, lld or mold")
+
+        self.__ProbeToolchain()
+
+    def __Build(self, isIncremental: bool):
+        # Another zbuild building the same configuration would race on its objects and state files, so it is waited for.
+        # Locks are taken in name order so two processes building overlapping sets cannot deadlock
+        locks = []
+        try:
+            for buildName in sorted(self.builds.keys()):
+                lock = FileLock(self.builds[buildName].config.GetBuildStatePath(buildName, Configuration.State.Files.BUILD_LOCK, PathType.ABSOLUTE))
+                if not lock.Acquire(False):
+                    self.output.SendInfo(f"Waiting for another zbuild instance building '{buildName}'")
+                    lock.Acquire()
+
+                locks.append(lock)
+
+            return self.__RunBuild(isIncremental)
+        finally:
+            for lock in reversed(locks):
+                lock.Release()
+
+    def __RunBuild(self, isIncremental: bool):
+        startTime = time.perf_counter()
+        startedAt = time.time()
+        self.__SelectToolchain()
+        self.__LoadCache()
+        toolchain = self.config.GetToolchain()
+        directoryCachePath = self.config.GetStatePath(Configuration.State.Files.DIRECTORY_CACHE, PathType.ABSOLUTE)
+        hashCachePath = self.config.GetStatePath(Configuration.State.Files.HASH_CACHE, PathType.ABSOLUTE)
+        treeCachePath = self.config.GetStatePath(Configuration.State.Files.TREE_CACHE, PathType.ABSOLUTE)
 
-        while self.config.LoadNextBuildStep() == ResultCode.SUCCESS and self.lastResultCode == ResultCode.SUCCESS:
-            self.output.SendInfo(f"Starting build step '{self.config.GetBuildStepName()}'")
-            self.lastResultCode = compileFunction()
+        # Outputs are left out of the tree, a build writing them must not make its own inputs look changed
+        ignoredDirs = self.config.GetCompilerOutputDirs(PathType.ABSOLUTE) + [self.config.GetLogOutputDir(PathType.ABSOLUTE), self.config.GetStateOutputDir(PathType.ABSOLUTE)]
+        self.tree = MerkleTree(self.discovery, self.hasher, ignoredDirs)
+        if self.tree.Load(treeCachePath) == ResultCode.ERR_STATE_INVALID:
+            self.output.SendWarning(f"Ignoring directory hashes in '{treeCachePath}' because they are not valid")
 
+        # Planning runs while the jobs it produced are already running, a planning error wins over a failed job
+        jobsResultCode = self.__RunJobs(self.__PlanJobs(isIncremental, toolchain))
+        if self.lastResultCode == ResultCode.SUCCESS:
+            self.lastResultCode = jobsResultCode
+
+        self.__SaveSharedCache(self.discovery, directoryCachePath)
+        if self.sharedCompileCount > 0:
+            self.output.SendInfo(f"Skipped {self.sharedCompileCount} compile jobs whose objects are already built for another step")
+        self.output.SendInfoLogOnly(f"Listed {self.discovery.listedCount} source directories, reused {self.discovery.cachedCount} cached listings")
+        self.output.SendInfoLogOnly(f"Checked {self.tree.fileCount} files in {self.tree.dirCount} directories for changes, reused {self.tree.reusedCount} directory hashes")
+
+        if self.lastResultCode == ResultCode.SUCCESS and len(self.jobs) == 0:
+            self.output.SendInfo("Every build step is up to date")
+
+        for build in self.builds.values():
+            if any(step.linkJob is not None for step in build.steps):
+                self.__ReportUsage(build)
+                self.__SaveBuildState(build)
+            elif self.lastResultCode == ResultCode.SUCCESS and any(not build.manifest[s.name]["tree"] == s.treeHash for s in build.steps):
+                self.__SaveManifest(build)
+
+            if self.lastResultCode == ResultCode.SUCCESS:
+                self.__UpdateObjectMap(build)
+
+        self.__SaveSharedCache(self.hasher, hashCachePath)
+        self.__SaveSharedCache(self.tree, treeCachePath)
+        self.wallTime = time.perf_counter() - startTime
+        self.__RecordHistory(startedAt)
         return self.lastResultCode
 
-    def __CompileWithClang(self):
-        compileCommand = ["clang"]
-        return ResultCode.ERR_NOT_IMPLEMENTED
+    def __PlanJobs(self, isIncremental: bool, toolchain: str):
+        # Yields jobs as soon as they are known. A step already known to be stale has its units compiled while its
+        # directories are still being searched, any other step is checked once its sources are known. An incremental
+        # build only compiles the units of a stale step whose own inputs changed
+        for build in self.builds.values():
+            build.diagnostics = DiagnosticParser(toolchain)
+            if isIncremental:
+                self.__LoadBuildState(build)
+            else:
+                build.isGraphLoaded = True
+                self.cache.graphs[build.buildName] = build.graph
+                self.__PrepareOutputDirs(build)
+                if self.isExplainingMisses:
+                    self.output.SendInfo(f"Every build step of '{build.buildName}' is rebuilt, a full build reuses nothing")
 
-    def __CompileWithGCC(self):
-        compileCommand = ["gcc"]
-        return ResultCode.ERR_NOT_IMPLEMENTED
+            # Once a step is stale every later one is linked again too, they may link against its target
+            isStale = not isIncremental
+            while build.config.LoadNextBuildStep() == ResultCode.SUCCESS:
+                self.output.SendInfo(f"Planning build step '{build.config.GetBuildStepName()}' of '{build.buildName}'")
+                self.lastResultCode, step = self.__ReadBuildStep(build)
+                if not self.lastResultCode == ResultCode.SUCCESS:
+                    return
 
-    def __CompileWithMSVC(self):
-        compileCommand = ["cl", "/nologo"]
+                wasStale = isStale
+                for sourceFiles in self.__DiscoverStepSources(build, step):
+                    if wasStale:
+                        yield self.__AddCompileJobs(build, step, self.__GetStaleSources(build, step, sourceFiles))
 
-        # Append defines
-        self.lastResultCode, defines = self.config.GetBuildStepDefines()
-        if not self.lastResultCode == ResultCode.SUCCESS:
-            return self.lastResultCode
+                self.__FinishBuildStep(build, step)
+                step.closureDirectories = build.manifest.get(step.name, {}).get("dirs", [])
+                step.treeHash = self.__GetStepTreeHash(step)
+                if not isStale and not self.__IsStepUpToDate(build, step):
+                    isStale = True
+                    if self.isExplainingMisses:
+                        self.__ExplainMiss(build, step)
+                elif wasStale and isIncremental and self.isExplainingMisses:
+                    self.output.SendInfo(f"Build step '{step.name}' of '{build.buildName}' is linked again because an earlier step is rebuilt, it may link against its target")
 
-        for name, value in defines.items():
-            defineArg = name
-            if value is not None:
-                if type(value) is str:
-                    defineArg += f"=\"{value}\""
+                if wasStale:
+                    yield [self.__AddLinkJob(build, step)]
+                elif isStale:
+                    yield self.__AddCompileJobs(build, step, self.__GetStaleSources(build, step, step.sourceFiles)) + [self.__AddLinkJob(build, step)]
                 else:
-                    defineArg += f"={value}"
+                    self.output.SendInfoLogOnly(f"Build step '{step.name}' of '{build.buildName}' is up to date")
 
-            compileCommand.append(f"/D{defineArg}")
+    def __LoadCache(self):
+        # A warm cache already holds everything these files would add
+        self.discovery.listedCount = 0
+        self.discovery.cachedCount = 0
+        if self.cache.isLoaded:
+            return
 
-        # Append target type
-        self.lastResultCode, targetType = self.config.GetBuildStepTargetType()
-        if not self.lastResultCode == ResultCode.SUCCESS:
-            return self.lastResultCode
+        self.cache.isLoaded = True
+        directoryCachePath = self.config.GetStatePath(Configuration.State.Files.DIRECTORY_CACHE, PathType.ABSOLUTE)
+        if self.discovery.Load(directoryCachePath) == ResultCode.ERR_STATE_INVALID:
+            self.output.SendWarning(f"Ignoring directory listings in '{directoryCachePath}' because they are not valid")
+
+        hashCachePath = self.config.GetStatePath(Configuration.State.Files.HASH_CACHE, PathType.ABSOLUTE)
+        if self.hasher.Load(hashCachePath) == ResultCode.ERR_STATE_INVALID:
+            self.output.SendWarning(f"Ignoring file hashes in '{hashCachePath}' because they are not valid")
+
+    def __ProbeToolchain(self):
+        # Probing costs a compiler start, so results are reused until the binary or its environment changes
+        probe = self.cache.probe
+        probe.probedCount = 0
+        probeCachePath = self.config.GetStatePath(Configuration.State.Files.TOOLCHAIN_PROBES, PathType.ABSOLUTE)
+        if not self.cache.isLoaded and probe.Load(probeCachePath) == ResultCode.ERR_STATE_INVALID:
+            self.output.SendWarning(f"Ignoring toolchain probes in '{probeCachePath}' because they are not valid")
+
+        self.toolchain = probe.Probe(self.compilerName)
+        if self.toolchain is None:
+            self.output.SendWarning(f"Could not probe compiler '{self.compilerName}', its version will not be part of cache keys")
+            return
+
+        if probe.probedCount > 0:
+            self.__SaveSharedCache(probe, probeCachePath)
+
+        self.toolchainIdentity = self.toolchain.GetIdentity()
+        self.output.SendInfoLogOnly(f"Compiler '{self.toolchain.compilerPath}' is {self.toolchain.version} for {self.toolchain.target}")
+        self.output.SendInfoLogOnly(f"Compiler searches {os.pathsep.join(self.toolchain.systemIncludeDirectories)} for system headers")
+
+    def __SaveSharedCache(self, cache, filePath: Path):
+        # The caches are shared by every configuration, entries saved by another process since this one loaded are kept
+        with FileLock(self.config.GetStatePath(Configuration.State.Files.CACHE_LOCK, PathType.ABSOLUTE)):
+            cache.Load(filePath, True)
+            cache.Save(filePath)
+
+    def __LoadBuildState(self, build: _BuildConfiguration):
+        for dir in (build.config.GetTargetOutputDir(PathType.ABSOLUTE), build.config.GetObjectOutputDir(PathType.ABSOLUTE), build.config.GetDebugSymbolsOutputDir(PathType.ABSOLUTE)):
+            os.makedirs(dir / build.buildName, exist_ok = True)
+
+        manifestPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.MANIFEST, PathType.ABSOLUTE)
+        if not manifestPath.exists():
+            return
+
+        try:
+            with open(manifestPath, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+
+        if not data.get("version") == self.MANIFEST_FORMAT_VERSION:
+            self.output.SendWarning(f"Ignoring build manifest in '{manifestPath}' because it is not valid")
+            return
+
+        build.manifest = data["steps"]
+        self.__LoadArchiveMembers(build)
+
+    def __LoadArchiveMembers(self, build: _BuildConfiguration):
+        # Without a record of what an archive holds it is written from scratch, so an unreadable one is just dropped
+        archivesPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.ARCHIVE_MEMBERS, PathType.ABSOLUTE)
+        try:
+            with open(archivesPath, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if data.get("version") == self.ARCHIVE_FORMAT_VERSION:
+            build.archives = data["archives"]
+
+    def __LoadBuildGraph(self, build: _BuildConfiguration):
+        # Only needed once a step's tree hash changed, a no-op check never reads the graph
+        if build.isGraphLoaded:
+            return
+
+        build.isGraphLoaded = True
+        if build.buildName in self.cache.graphs:
+            build.graph = self.cache.graphs[build.buildName]
+            return
+
+        self.cache.graphs[build.buildName] = build.graph
+        graphPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.DEPENDENCY_GRAPH, PathType.ABSOLUTE)
+        if build.graph.Load(graphPath) == ResultCode.ERR_STATE_INVALID:
+            self.output.SendWarning(f"Ignoring dependency graph in '{graphPath}' because it is not valid")
+
+    def __IsStepUpToDate(self, build: _BuildConfiguration, step: _BuildStep):
+        entry = build.manifest.get(step.name)
+        if entry is None or not (self.projectRoot / step.targetPath).exists():
+            return False
+
+        step.digest = entry["digest"]
+        if entry["tree"] == step.treeHash:
+            return True
+
+        # Something under the step's directories changed, the recorded includes tell whether the step reads it
+        self.__LoadBuildGraph(build)
+        return self.__GetStepDigest(build, step) == step.digest
+
+    def __GetStaleSources(self, build: _BuildConfiguration, step: _BuildStep, sourceFiles: list[Path]):
+        # A unit is compiled again when its object is missing, its command changed or a file it read changed since it was
+        # compiled. One already being compiled for another step is joined, its object is about to change
+        entry = build.manifest.get(step.name)
+        if entry is None:
+            return sourceFiles
+
+        self.__LoadBuildGraph(build)
+        return [s for s in sourceFiles if step.objectFiles[s] in build.compileJobs or not self.__IsUnitUpToDate(build, step, s, entry["units"])]
+
+    def __IsUnitUpToDate(self, build: _BuildConfiguration, step: _BuildStep, sourceFile: Path, units: dict[str, str]):
+        sourcePath = Path(os.path.normpath(sourceFile))
+        objectFile = step.objectFiles[sourceFile]
+        if not units.get(str(sourcePath)) == self.commandHasher.Hash(step.compileCommands[sourceFile]) or not (self.projectRoot / objectFile).exists():
+            return False
+
+        graph = build.graph
+        sourceID = graph.FindNode(sourcePath)
+        objectID = graph.FindNode(objectFile)
+        if sourceID is None or objectID is None or not graph[objectID].HasChild(sourceID):
+            return False
+
+        for inputID in [sourceID] + [id for id, _ in graph.GetDependencies(sourceID)]:
+            fileHash = self.hasher.Hash(graph[inputID].filePath)
+            if fileHash is None or not graph[inputID].fileHash == fileHash:
+                return False
+            self.__RecordReadHash(build, graph[inputID].filePath, fileHash)
+
+        return True
+
+    def __RecordUnitInputs(self, build: _BuildConfiguration, sourceFile: Path, scanner: IncludeScanner):
+        # Taken before the compiler starts, an edit made while it runs then shows up as a change on the next build
+        pending = [Path(os.path.normpath(sourceFile))]
+        scanned = set()
+        while len(pending) > 0:
+            filePath = pending.pop()
+            if filePath in scanned:
+                continue
+
+            scanned.add(filePath)
+            self.__RecordReadHash(build, filePath, self.hasher.Hash(filePath))
+            pending.extend(scanner.Scan(filePath))
+
+    def __RecordReadHash(self, build: _BuildConfiguration, filePath: Path, fileHash: Optional[str]):
+        with build.readLock:
+            if not build.readHashes.setdefault(filePath, fileHash) == fileHash:
+                build.readHashes[filePath] = self.CHANGED_HASH
+
+    def __SaveManifest(self, build: _BuildConfiguration):
+        # Steps that failed or never ran are left out so the next update rebuilds them. The tree hash is the one taken
+        # before the build, an edit made while it ran then still shows up as a change next time
+        steps = {}
+        inputs = {}
+        for step in build.steps:
+            if step.linkJob is None:
+                if step.digest is not None:
+                    steps[step.name] = dict(build.manifest[step.name], tree = step.treeHash)
+            elif step.linkJob.resultCode == ResultCode.SUCCESS:
+                inputs[step.name] = self.__GetStepInputs(build, step)
+
+                # A file edited while the build ran was compiled in its old version, the step is then left to the next build
+                changedFiles = [f for f, fileHash in inputs[step.name]["files"].items() if not build.readHashes.get(Path(f)) == fileHash]
+                if len(changedFiles) > 0:
+                    self.output.SendWarning(f"'{changedFiles[0]}' changed while build step '{step.name}' of '{build.buildName}' was built, it is built again next time")
+                    continue
+
+                closureDirectories = self.__GetClosureDirectories(step, inputs[step.name]["files"].keys())
+                steps[step.name] = {
+                    "digest": self.__GetStepDigest(build, step, inputs[step.name]),
+                    "tree": step.treeHash,
+                    "dirs": closureDirectories,
+                    "units": inputs[step.name]["commands"]
+                }
+
+        if len(inputs) > 0:
+            self.__SaveStepInputs(build, inputs)
+
+        manifestPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.MANIFEST, PathType.ABSOLUTE)
+        os.makedirs(manifestPath.parent, exist_ok = True)
+        tempPath = Path(f"{manifestPath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.MANIFEST_FORMAT_VERSION, "steps": steps }, f, indent = 4)
+        os.replace(tempPath, manifestPath)
+
+    def __UpdateObjectMap(self, build: _BuildConfiguration):
+        # The map records which source every object was compiled from. Objects it lists that this build no longer
+        # produces are stale, without a usable map the whole object tree is swept for files that are not current objects
+        objects = { str(o): str(s) for step in build.steps for s, o in step.objectFiles.items() }
+        mapPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.OBJECT_MAP, PathType.ABSOLUTE)
+        previousObjects = None
+        try:
+            with open(mapPath, "r") as f:
+                data = json.load(f)
+            if data.get("version") == self.OBJECT_MAP_VERSION:
+                previousObjects = data["objects"]
+        except (OSError, ValueError):
+            pass
+
+        if previousObjects == objects:
+            return
+
+        objectDir = build.config.GetObjectOutputDir(PathType.ABSOLUTE) / build.buildName
+        if previousObjects is None:
+            current = { self.projectRoot / o for o in objects.keys() }
+            stalePaths = [Path(dir) / f for dir, _, files in os.walk(objectDir) for f in files if not Path(dir) / f in current]
+        else:
+            stalePaths = [self.projectRoot / o for o in previousObjects.keys() if not o in objects]
+
+        self.__RemoveStaleFiles(stalePaths, objectDir)
+        if len(stalePaths) > 0:
+            self.output.SendInfoLogOnly(f"Removed {len(stalePaths)} stale objects of '{build.buildName}'")
+
+        os.makedirs(mapPath.parent, exist_ok = True)
+        tempPath = Path(f"{mapPath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.OBJECT_MAP_VERSION, "objects": objects }, f)
+        os.replace(tempPath, mapPath)
+
+    def __RemoveStaleFiles(self, filePaths: list[Path], root: Path):
+        # Removals run in parallel, they mostly wait on the file system. Directories left empty are removed up to root
+        def Remove(filePath: Path):
+            try:
+                os.remove(filePath)
+            except FileNotFoundError:
+                pass
+
+        with ThreadPoolExecutor(max_workers = self.MAX_CLEANUP_WORKERS) as pool:
+            for _ in pool.map(Remove, filePaths):
+                pass
+
+        dirs = { d for p in filePaths for d in p.parents if root in d.parents }
+        for dir in sorted(dirs, key = lambda d: len(d.parts), reverse = True):
+            try:
+                os.rmdir(dir)
+            except OSError:
+                pass
+
+    def __SaveStepInputs(self, build: _BuildConfiguration, inputs: dict[str, dict]):
+        # Only read back to explain a rebuild, steps that did not build this time keep what was recorded for them before
+        previousInputs = self.__LoadStepInputs(build)
+        for step in build.steps:
+            if step.linkJob is None and step.name in previousInputs:
+                inputs[step.name] = previousInputs[step.name]
+
+        inputsPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.STEP_INPUTS, PathType.ABSOLUTE)
+        tempPath = Path(f"{inputsPath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump({ "version": self.INPUTS_FORMAT_VERSION, "steps": inputs }, f)
+        os.replace(tempPath, inputsPath)
+        build.stepInputs = inputs
+
+    def __LoadStepInputs(self, build: _BuildConfiguration):
+        if build.stepInputs is not None:
+            return build.stepInputs
+
+        build.stepInputs = {}
+        inputsPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.STEP_INPUTS, PathType.ABSOLUTE)
+        try:
+            with open(inputsPath, "r") as f:
+                data = json.load(f)
+            if data.get("version") == self.INPUTS_FORMAT_VERSION:
+                build.stepInputs = data["steps"]
+        except (OSError, ValueError):
+            pass
+
+        return build.stepInputs
+
+    def __ExplainMiss(self, build: _BuildConfiguration, step: _BuildStep):
+        # Compares the inputs of a stale step with the ones recorded when it last built, the difference is what changed its digest
+        entry = build.manifest.get(step.name)
+        previousInputs = self.__LoadStepInputs(build).get(step.name)
+        if entry is None:
+            reasons = ["it has not been built before"]
+        elif not (self.projectRoot / step.targetPath).exists():
+            reasons = [f"its target '{step.targetPath}' is missing"]
+        elif previousInputs is None:
+            reasons = ["no inputs were recorded when it last built"]
+        else:
+            self.__LoadBuildGraph(build)
+            reasons = self.__GetInputChanges(previousInputs, self.__GetStepInputs(build, step))
+
+        self.output.SendInfo(f"Build step '{step.name}' of '{build.buildName}' is rebuilt because:")
+        for reason in reasons:
+            self.output.SendInfo(f"    {reason}")
+
+    def __GetInputChanges(self, previousInputs: dict, currentInputs: dict):
+        changes = []
+        if not previousInputs["toolchain"] == currentInputs["toolchain"]:
+            changes.append("the compiler version, target or system include directories changed")
+        if not previousInputs["link"] == currentInputs["link"]:
+            changes.append("the link command changed")
+
+        previousCommands = previousInputs["commands"]
+        currentCommands = currentInputs["commands"]
+        addedSources = [s for s in currentCommands.keys() if not s in previousCommands]
+        removedSources = [s for s in previousCommands.keys() if not s in currentCommands]
+        changes.extend(f"source '{s}' was added" for s in addedSources)
+        changes.extend(f"source '{s}' was removed" for s in removedSources)
+        changes.extend(f"the compile command of '{s}' changed" for s, commandHash in currentCommands.items() if s in previousCommands and not previousCommands[s] == commandHash)
+
+        # An added or removed source already accounts for itself, a header is only listed once no source reads it any more
+        previousFiles = previousInputs["files"]
+        for filePath, fileHash in currentInputs["files"].items():
+            if not filePath in previousFiles:
+                if not filePath in addedSources:
+                    changes.append(f"'{filePath}' is read now")
+            elif not previousFiles[filePath] == fileHash:
+                changes.append(f"'{filePath}' is missing" if fileHash is None else f"'{filePath}' was modified")
+        changes.extend(f"'{f}' is no longer read" for f in previousFiles.keys() if not f in currentInputs["files"] and not f in removedSources)
+
+        if len(changes) == 0:
+            changes.append("none of its recorded inputs differ, they were recorded by another version of zbuild")
+        return changes
+
+    def __GetStepTreeHash(self, step: _BuildStep):
+        # Covers the resolved commands and every file under the directories the step reads from, at the cost of a stat per file
+        digest = hashlib.blake2b(digest_size = 16)
+        digest.update(f"{self.toolchainIdentity}\0".encode())
+        digest.update(self.commandHasher.Hash(step.linkCommand).encode())
+        for sourceFile in sorted(step.compileCommands.keys()):
+            digest.update(f"\0{sourceFile}\0".encode())
+            digest.update(self.commandHasher.Hash(step.compileCommands[sourceFile]).encode())
+
+        for dir in step.sourceDirectories + step.includeDirectories + step.closureDirectories:
+            digest.update(f"\0{dir}\0{self.tree.GetDirectoryHash(dir)}".encode())
+
+        return digest.hexdigest()
+
+    def __GetClosureDirectories(self, step: _BuildStep, filePaths: list[str]):
+        # Relative includes may reach headers outside the directories of the step, their directories are hashed as well.
+        # A directory under another one already listed adds nothing
+        roots = [Path(os.path.normpath(d)) for d in step.sourceDirectories + step.includeDirectories]
+        dirs = { Path(f).parent for f in filePaths }
+        dirs = { d for d in dirs if not any(r == d or r in d.parents for r in roots) }
+        return sorted(str(d) for d in dirs if not any(p in dirs for p in d.parents))
+
+    def __GetStepInputs(self, build: _BuildConfiguration, step: _BuildStep):
+        # Hashes of the commands of the step and the content of every input they read, headers come from the recorded graph.
+        # The files of a source the graph does not know yet are left out
+        inputs = { "toolchain": self.toolchainIdentity, "link": self.commandHasher.Hash(step.linkCommand), "commands": {}, "files": {} }
+        for sourceFile in sorted(step.compileCommands.keys()):
+            sourcePath = Path(os.path.normpath(sourceFile))
+            inputs["commands"][str(sourcePath)] = self.commandHasher.Hash(step.compileCommands[sourceFile])
+            sourceID = build.graph.FindNode(sourcePath)
+            if sourceID is None:
+                continue
+
+            for inputPath in [sourcePath] + [build.graph[id].filePath for id, _ in build.graph.GetDependencies(sourceID)]:
+                if not str(inputPath) in inputs["files"]:
+                    inputs["files"][str(inputPath)] = self.hasher.Hash(inputPath)
+
+        return inputs
+
+    def __GetStepDigest(self, build: _BuildConfiguration, step: _BuildStep, inputs: Optional[dict] = None):
+        # A header only enters the closure through an edit to a source or header already in it, which changes the digest as well.
+        # A source missing from the graph has no known closure, the step cannot be up to date
+        if any(build.graph.FindNode(Path(os.path.normpath(s))) is None for s in step.compileCommands.keys()):
+            return None
+
+        inputs = self.__GetStepInputs(build, step) if inputs is None else inputs
+        return hashlib.blake2b(json.dumps(inputs, sort_keys = True).encode(), digest_size = 16).hexdigest()
+
+    def __PrepareOutputDirs(self, build: _BuildConfiguration):
+        dir = build.config.GetTargetOutputDir(PathType.ABSOLUTE) / build.buildName
+        if dir.exists():
+            self.__ClearDirTree(dir)
+        else:
+            os.makedirs(dir)
+
+        os.makedirs(build.config.GetObjectOutputDir(PathType.ABSOLUTE) / build.buildName, exist_ok = True)
+        os.makedirs(build.config.GetDebugSymbolsOutputDir(PathType.ABSOLUTE) / build.buildName, exist_ok = True)
+        self.__ClearDirTree(build.config.GetObjectOutputDir(PathType.ABSOLUTE) / build.buildName)
+
+    def __SaveBuildState(self, build: _BuildConfiguration):
+        self.__LoadBuildGraph(build)
+        for step in build.steps:
+            if step.linkJob is not None and step.linkJob.resultCode == ResultCode.SUCCESS:
+                self.__RecordBuildStepDependencies(build, step)
+
+        build.graph.PruneOrphans()
+        self.__SaveManifest(build)
+
+        graphPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.DEPENDENCY_GRAPH, PathType.ABSOLUTE)
+        build.graph.SaveOrSerialize(graphPath)
+        self.output.SendInfoLogOnly(f"Saved dependency graph with {len(build.graph)} nodes to '{graphPath}'")
+
+        jobStatsPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.JOB_STATS, PathType.ABSOLUTE)
+        self.jobStats.Save(jobStatsPath, [job.key for job in self.jobs if job.buildName == build.buildName])
+
+        # Only archives still built by a step are kept
+        archives = { str(s.targetPath): build.archives[str(s.targetPath)] for s in build.steps if str(s.targetPath) in build.archives }
+        if len(archives) > 0 or len(build.archives) > 0:
+            archivesPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.ARCHIVE_MEMBERS, PathType.ABSOLUTE)
+            tempPath = Path(f"{archivesPath}.tmp")
+            with open(tempPath, "w") as f:
+                json.dump({ "version": self.ARCHIVE_FORMAT_VERSION, "archives": archives }, f)
+            os.replace(tempPath, archivesPath)
+
+        diagnosticsPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.DIAGNOSTICS, PathType.ABSOLUTE)
+        build.diagnostics.Save(diagnosticsPath)
+        self.output.SendInfo(f"Diagnostics for '{build.buildName}': {build.diagnostics.GetSummary()}")
+        self.output.SendInfoLogOnly(f"Saved diagnostics to '{diagnosticsPath}'")
+
+    def __RunJobs(self, batches):
+        for build in self.builds.values():
+            jobStatsPath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.JOB_STATS, PathType.ABSOLUTE)
+            if self.jobStats.Load(jobStatsPath) == ResultCode.ERR_STATE_INVALID:
+                self.output.SendWarning(f"Ignoring job statistics in '{jobStatsPath}' because they are not valid")
+
+        monitor = ResourceMonitor(self.maxLoad)
+        self.output.SendInfoLogOnly(f"Running jobs with up to {self.jobCount} at a time as they are planned")
+        self.output.SendInfoLogOnly(f"New jobs are held back above a load average of {monitor.maxLoad:.2f} or when memory would run short")
+        progress = self.__ShowProgress if self.output.isProgressEnabled else None
+        scheduler = JobScheduler(self.jobCount, self.jobStats, self.__ExecuteJob, monitor, progress, self.failureMode, self.__CancelJobs)
+        resultCode = scheduler.RunStreaming(batches)
+        self.output.ClearProgress()
+        self.__RemoveStagingDirs()
+        if len(self.jobs) == 0:
+            return resultCode
+
+        if self.isCancelled:
+            self.output.SendInfo(f"Stopped {sum(1 for j in self.jobs if j.resultCode == ResultCode.WRN_JOB_CANCELLED)} running jobs after the first failure")
+
+        if scheduler.skippedCount > 0:
+            self.output.SendInfo(f"Skipped {scheduler.skippedCount} jobs that depend on a failed one")
+
+        if scheduler.heldForLoadCount > 0 or scheduler.heldForMemoryCount > 0:
+            self.output.SendInfo(f"Jobs were held back {scheduler.heldForLoadCount} time(s) for system load and {scheduler.heldForMemoryCount} time(s) for memory")
+
+        lowerBound, criticalPath, totalWork = scheduler.GetLowerBound(self.jobs)
+        self.output.SendInfo(
+            f"{sum(1 for j in self.jobs if j.resultCode is not None)} of {len(self.jobs)} jobs finished in {scheduler.wallTime:.2f}s, estimated lower bound is {lowerBound:.2f}s "
+            f"(critical path {criticalPath:.2f}s, {totalWork:.2f}s of work over {scheduler.jobCount} slots)"
+        )
+
+        return resultCode
+
+    def __RemoveStagingDirs(self):
+        # Only once every job is done, a job starting meanwhile could otherwise lose the directory it is about to write to.
+        # One still holding the output of a job that failed to move into place is kept
+        for dir in { (self.projectRoot / j.stagingPath).parent for j in self.jobs if j.stagingPath is not None }:
+            try:
+                os.rmdir(dir)
+            except OSError:
+                pass
+
+    def __CancelJobs(self):
+        with self.processLock:
+            self.isCancelled = True
+            for p in self.processes:
+                self.__StopProcess(p)
+
+    def __StopProcess(self, p: subprocess.Popen):
+        # Children lead their own process group, the tools a compiler driver started such as cc1 are stopped with it
+        try:
+            if os.name == "nt":
+                p.terminate()
+            else:
+                os.killpg(p.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    def __ReportUsage(self, build: _BuildConfiguration):
+        # Totals always reach the console, the per step and per unit breakdown only when asked for, otherwise the log.
+        # A compile shared by several steps counts towards each of them
+        jobs = [j for j in self.jobs if j.buildName == build.buildName and j.usage is not None]
+        if len(jobs) == 0:
+            return
 
-        if targetType == ReservedValues.Configuration.Build.Target.Type.LIBRARY:
-            compileCommand.append("/LD")
+        total = ResourceUsage()
+        for job in jobs:
+            total.Add(job.usage)
 
-        # Append output paths
-        self.lastResultCode, targetName = self.config.GetBuildStepTargetName()
+        sendReport = self.output.SendInfo if self.isReportingUsage else self.output.SendInfoLogOnly
+        self.output.SendInfo(f"Child processes of '{build.buildName}' used {total.GetSummary()}")
+        for step in build.steps:
+            if step.linkJob is None:
+                continue
+
+            step.usage = ResourceUsage()
+            for job in step.compileJobs + [step.linkJob]:
+                if job.usage is not None:
+                    step.usage.Add(job.usage)
+            sendReport(f"Build step '{step.name}' used {step.usage.GetSummary()}")
+
+        sendReport(f"Most expensive units of '{build.buildName}' by CPU time:")
+        for job in sorted(jobs, key = lambda j: j.usage.cpuTime, reverse = True)[:self.USAGE_REPORT_SIZE]:
+            sendReport(f"    {job.usage.cpuTime:8.2f}s CPU {job.usage.peakMemory / (1024 * 1024):8.1f} MiB  {job.outputPath}")
+
+        if not self.isReportingUsage:
+            return
+
+        usagePath = build.config.GetBuildStatePath(build.buildName, Configuration.State.Files.RESOURCE_USAGE, PathType.ABSOLUTE)
+        data = {
+            "version": self.USAGE_FORMAT_VERSION,
+            "total": total.ToDict(),
+            "steps": { s.name: s.usage.ToDict() for s in build.steps if s.usage is not None },
+            "jobs": { j.key: j.usage.ToDict() for j in jobs }
+        }
+
+        os.makedirs(usagePath.parent, exist_ok = True)
+        tempPath = Path(f"{usagePath}.tmp")
+        with open(tempPath, "w") as f:
+            json.dump(data, f, indent = 4)
+        os.replace(tempPath, usagePath)
+        self.output.SendInfo(f"Saved resource usage to '{usagePath}'")
+
+    def __RecordHistory(self, startedAt: float):
+        # Every build is recorded, up to date ones included, so wall time trends show what a no-op build costs too
+        history = BuildHistory()
+        historyPath = self.config.GetStatePath(Configuration.State.Files.BUILD_HISTORY, PathType.ABSOLUTE)
+        if not history.Open(historyPath) == ResultCode.SUCCESS:
+            self.output.SendWarning(f"Not recording build history because '{historyPath}' is not valid")
+            return
+
+        threshold = self.config.GetRegressionThreshold() / 100
+        baselineSize = self.config.GetBaselineSize()
+        for build in self.builds.values():
+            record = BuildRecord(build.buildName, startedAt, self.wallTime, self.jobCount, self.lastResultCode)
+            record.unitCount = len({ o for step in build.steps for o in step.objectFiles.values() })
+            record.compiledCount = sum(1 for j in build.compileJobs.values() if j.resultCode is not None)
+            for step in build.steps:
+                record.AddStep(step.name, self.GetStepStatus(step), sum(j.duration for j in step.compileJobs if j.duration is not None), 0.0 if step.linkJob is None or step.linkJob.duration is None else step.linkJob.duration)
+
+            for job in self.jobs:
+                if job.buildName == build.buildName and job.duration is not None:
+                    record.AddUnit(job.stepName, job.jobType, job.outputPath, job.duration, None if job.usage is None else job.usage.cpuTime, job.peakMemory, job.resultCode)
+
+            if not history.Record(record) == ResultCode.SUCCESS:
+                self.output.SendWarning(f"Could not record build history of '{build.buildName}' in '{historyPath}'")
+                continue
+
+            # Only what this build compiled can have regressed, a no-op build finds nothing
+            regressions = history.FindRegressions(build.buildName, threshold, baselineSize)
+            if len(regressions) == 0:
+                continue
+
+            self.output.SendWarning(f"{len(regressions)} steps or units of '{build.buildName}' took over {threshold:.0%} longer than their baseline, see --history {build.buildName}")
+            for regression in regressions[:self.REGRESSION_REPORT_SIZE]:
+                self.output.SendWarning(f"    {regression.name} took {regression.duration:.2f}s against {regression.baseline:.2f}s (+{regression.increase:.0%})")
+
+        history.Close()
+
+    def __ShowProgress(self, finishedCount: int, totalCount: int, running: list[Job], remainingTime: float):
+        # The jobs running longest are named, they are the ones holding the build up
+        now = time.perf_counter()
+        slowest = sorted(running, key = lambda j: j.startTime)[:self.MAX_PROGRESS_JOBS]
+        text = f"[{finishedCount}/{totalCount}] {finishedCount * 100 // max(1, totalCount)}% ETA {remainingTime:.0f}s"
+        if len(slowest) > 0:
+            text += " | " + ", ".join(f"{Path(j.outputPath).name} {now - j.startTime:.1f}s" for j in slowest)
+
+        self.output.SetProgress(text)
+
+    def __PlanBuildStep(self, build: _BuildConfiguration):
+        self.lastResultCode, step = self.__ReadBuildStep(build)
         if not self.lastResultCode == ResultCode.SUCCESS:
             return self.lastResultCode
 
-        # pathlib strips trailing slash, but is needed for cl. Adding it back with os.path.join().
-        targetPath = self.config.GetTargetOutputDir(PathType.RELATIVE) / self.buildName
-        targetPath = os.path.join(targetPath, targetName)
+        for _ in self.__DiscoverStepSources(build, step):
+            pass
+
+        self.__FinishBuildStep(build, step)
+        return ResultCode.SUCCESS
+
+    def __ReadBuildStep(self, build: _BuildConfiguration):
+        step = _BuildStep(build.config.GetBuildStepName())
+
+        self.lastResultCode, step.defines = build.config.GetBuildStepDefines()
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return (self.lastResultCode, None)
 
-        objDir = self.config.GetObjectOutputDir(PathType.RELATIVE) / self.buildName
-        objDir = os.path.join(objDir, '')
+        self.lastResultCode, step.targetType = build.config.GetBuildStepTargetType()
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return (self.lastResultCode, None)
 
-        debugSymbolsDir = self.config.GetDebugSymbolsOutputDir(PathType.RELATIVE) / self.buildName
-        debugSymbolsDir = os.path.join(debugSymbolsDir, '')
+        self.lastResultCode, targetName = build.config.GetBuildStepTargetName()
+        if not self.lastResultCode == ResultCode.SUCCESS:
+            return (self.lastResultCode, None)
 
-        compileCommand.append(f"/Fe:{targetPath}")
-        compileCommand.append(f"/Fo:{objDir}")
-        compileCommand.append(f"/Fd:{debugSymbolsDir}")
+        step.targetPath = build.config.GetTargetOutputDir(PathType.RELATIVE) / build.buildName / targetName
+        step.objectDir = build.config.GetObjectOutputDir(PathType.RELATIVE) / build.buildName
+        step.debugSymbolsDir = build.config.GetDebugSymbolsOutputDir(PathType.RELATIVE) / build.buildName
 
-        # Append include directories
-        self.lastResultCode, includeDirectories = self.config.GetBuildStepIncludeDirectories()
+        self.lastResultCode, includeDirectories = build.config.GetBuildStepIncludeDirectories()
         if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
-            return self.lastResultCode
+            return (self.lastResultCode, None)
 
         if includeDirectories is not None:
             for dir in includeDirectories:
-                with Path(dir) as includePath:
-                    if not includePath.exists():
+                with self.__GetProjectPath(dir) as includePath:
+                    if not (self.projectRoot / includePath).exists():
                         self.output.SendWarning(f"Skipping include directory '{includePath}' because it could not be found")
                         continue
 
-                    compileCommand.append("/I")
-                    compileCommand.append(str(includePath))
+                    step.includeDirectories.append(includePath)
+
+        step.scanner = IncludeScanner(step.includeDirectories, self.includeDirectives, self.projectRoot)
 
-        # Append shared libraries
-        self.lastResultCode, dynamicLibraries = self.config.GetBuildStepDynamicSharedLibraries()
+        self.lastResultCode, dynamicLibraries = build.config.GetBuildStepDynamicSharedLibraries()
         if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
-            return self.lastResultCode
+            return (self.lastResultCode, None)
 
-        if dynamicLibraries is not None and len(dynamicLibraries) > 0:
-            compileCommand.append("/MD")
-            for lib in dynamicLibraries:
-                compileCommand.append(lib)
+        if dynamicLibraries is not None:
+            step.dynamicLibraries = [str(self.__GetProjectPath(l)) if os.path.isabs(l) else l for l in dynamicLibraries]
 
-        self.lastResultCode, staticLibraries = self.config.GetBuildStepStaticSharedLibraries()
+        self.lastResultCode, staticLibraries = build.config.GetBuildStepStaticSharedLibraries()
         if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
-            return self.lastResultCode
+            return (self.lastResultCode, None)
 
-        if staticLibraries is not None and len(staticLibraries) > 0:
-            compileCommand.append("/MT")
-            for lib in staticLibraries:
-                compileCommand.append(lib)
+        if staticLibraries is not None:
+            step.staticLibraries = [str(self.__GetProjectPath(l)) if os.path.isabs(l) else l for l in staticLibraries]
 
-        with self.config.GetObjectOutputDir(PathType.ABSOLUTE) / self.buildName as objFileRootPath:
-            self.__ClearDirTree(objFileRootPath)
+        self.lastResultCode, additionalArgs = build.config.GetBuildStepAdditionalArguments()
+        if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
+            return (self.lastResultCode, None)
+
+        if additionalArgs is not None:
+            step.additionalArgs = additionalArgs
 
-        self.lastResultCode, sourceExtension = self.config.GetBuildStepSourceExtension()
+        self.lastResultCode, isLto = build.config.GetBuildStepLinkTimeOptimization()
+        if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
+            return (self.lastResultCode, None)
+
+        if isLto is not None and type(isLto) is not bool:
+            self.output.SendError(f"Link time optimization of build step '{step.name}' must be true or false")
+            return (ResultCode.ERR_CONFIG_INVALID, None)
+
+        step.isLto = isLto is True
+        if step.isLto and self.compilerName == "cl":
+            self.output.SendWarning(f"Link time optimization of build step '{step.name}' is ignored by the msvc toolchain")
+            step.isLto = False
+
+        self.lastResultCode, isThinArchive = build.config.GetBuildStepThinArchive()
+        if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
+            return (self.lastResultCode, None)
+
+        if isThinArchive is not None and type(isThinArchive) is not bool:
+            self.output.SendError(f"Thin archive setting of build step '{step.name}' must be true or false")
+            return (ResultCode.ERR_CONFIG_INVALID, None)
+
+        # A thin archive only references its objects, it is meant for libraries consumed within the same build
+        step.isThinArchive = isThinArchive is True
+        if step.isThinArchive and not step.targetType == ReservedValues.Configuration.Build.Target.Type.ARCHIVE:
+            self.output.SendWarning(f"Build step '{step.name}' is not an archive, its thin archive setting is ignored")
+            step.isThinArchive = False
+        elif step.isThinArchive and self.compilerName == "cl":
+            self.output.SendWarning(f"Thin archive setting of build step '{step.name}' is ignored by the msvc toolchain")
+            step.isThinArchive = False
+
+        self.lastResultCode, sourceExtension = build.config.GetBuildStepSourceExtension()
         if not self.lastResultCode == ResultCode.SUCCESS:
-            return self.lastResultCode
+            return (self.lastResultCode, None)
 
-        self.lastResultCode, sourceDirectories = self.config.GetBuildStepSourceDirectories()
+        self.lastResultCode, sourceDirectories = build.config.GetBuildStepSourceDirectories()
         if not self.lastResultCode == ResultCode.SUCCESS:
-            return self.lastResultCode
+            return (self.lastResultCode, None)
+
+        # Without patterns only the top level of each source directory is searched, matching by extension
+        self.lastResultCode, sourcePatterns = build.config.GetBuildStepSourcePatterns()
+        if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
+            return (self.lastResultCode, None)
+
+        step.sourcePatterns = [f"*{sourceExtension}"] if sourcePatterns is None else sourcePatterns
+
+        self.lastResultCode, excludePatterns = build.config.GetBuildStepExcludePatterns()
+        if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
+            return (self.lastResultCode, None)
+
+        step.excludePatterns = [] if excludePatterns is None else excludePatterns
 
-        # Append source file to compile command if modified time is more recent than object modified time
         for dir in sourceDirectories:
-            with Path(dir) as sourcePath:
-                if not sourcePath.exists() or not sourcePath.is_dir():
+            with self.__GetProjectPath(dir) as sourcePath:
+                if not (self.projectRoot / sourcePath).is_dir():
                     self.output.SendWarning(f"Skipping source directory '{sourcePath}' because it could not be found")
                     continue
 
-                for item in sourcePath.iterdir():
-                    if not item.is_file():
-                        continue
+                step.sourceDirectories.append(sourcePath)
 
-                    fileName = item.parts[-1]
-                    if not fileName.endswith(sourceExtension):
-                        continue
+        return (ResultCode.SUCCESS, step)
 
-                    compileCommand.append(str(item))
+    def __GetProjectPath(self, path: str):
+        # Paths under the project root are made relative to it, commands then read the same wherever the project is checked out
+        path = Path(path)
+        if path.is_absolute():
+            try:
+                return Path(os.path.normpath(path)).relative_to(self.projectRoot)
+            except ValueError:
+                pass
 
-        # Append additional arguments
-        self.lastResultCode, additionalArgs = self.config.GetBuildStepAdditionalArguments()
-        if not self.lastResultCode in (ResultCode.SUCCESS, ResultCode.WRN_NO_VALUE):
-            return self.lastResultCode
+        return path
 
-        if additionalArgs is not None:
-            for arg in additionalArgs:
-                compileCommand.append(arg)
+    def __DiscoverStepSources(self, build: _BuildConfiguration, step: _BuildStep):
+        # Yields the sources of each directory level as it is listed, with their objects and commands already planned
+        for sourcePath in step.sourceDirectories:
+            for sourceFiles in self.discovery.IterDiscover(sourcePath, step.sourcePatterns, step.excludePatterns):
+                self.__PlanSources(build, step, sourceFiles)
+                yield sourceFiles
+
+    def __PlanSources(self, build: _BuildConfiguration, step: _BuildStep, sourceFiles: list[Path]):
+        step.sourceFiles.extend(sourceFiles)
+        for sourceFile in sourceFiles:
+            objectName = f"{sourceFile.stem}.{self.objectExtension}"
+            objectFile = step.objectDir / self.__GetMirrorDir(sourceFile) / objectName
+            step.objectFiles[sourceFile] = objectFile
+            compileCommand = self.__GetCompileCommand(step, sourceFile, objectFile)
+
+            # Objects go to one directory per build, so steps sharing a source also share its object. With the same
+            # command it is compiled once. Another command gets an object of its own under a directory named after the
+            # command, steps sharing that command then share the object again
+            plannedCommand = build.objectCommands.setdefault(objectFile, compileCommand)
+            if not plannedCommand == compileCommand:
+                variantDir = f"{self.VARIANT_DIR_PREFIX}{self.commandHasher.Hash(compileCommand)[:self.VARIANT_HASH_LENGTH]}"
+                objectFile = step.objectDir / variantDir / self.__GetMirrorDir(sourceFile) / objectName
+                step.objectFiles[sourceFile] = objectFile
+                compileCommand = self.__GetCompileCommand(step, sourceFile, objectFile)
+                build.objectCommands.setdefault(objectFile, compileCommand)
+                self.output.SendInfoLogOnly(f"Build step '{step.name}' of '{build.buildName}' compiles '{sourceFile}' with other arguments than an earlier step, its object is '{objectFile}'")
+
+            step.compileCommands[sourceFile] = compileCommand
+
+    def __GetMirrorDir(self, sourceFile: Path):
+        # Objects mirror the source tree, so sources sharing a name in different directories never share an object.
+        # Sources outside the project root keep their path below the drive or root, parent references are renamed
+        sourcePath = Path(os.path.normpath(sourceFile))
+        parts = [p.replace(':', '') for p in sourcePath.parts[1:-1]] if sourcePath.is_absolute() else list(sourcePath.parts[:-1])
+        return Path(*["__" if p == ".." else p for p in parts])
+
+    def __FinishBuildStep(self, build: _BuildConfiguration, step: _BuildStep):
+        step.linkCommand = self.__GetLinkCommand(step)
+        build.steps.append(step)
+
+    def __AddCompileJobs(self, build: _BuildConfiguration, step: _BuildStep, sourceFiles: list[Path]):
+        # Every source is its own compile job so units can run in parallel and across steps. Jobs write to a staging
+        # path so an interrupted or failed job never leaves a partial output under the final name. The staged file keeps
+        # its name, names the compiler derives from it such as .dwo files stay the same
+        newJobs = []
+        for sourceFile in sourceFiles:
+            objectFile = step.objectFiles[sourceFile]
+            job = build.compileJobs.get(objectFile)
+            if job is not None and build.objectCommands[objectFile] == step.compileCommands[sourceFile]:
+                self.sharedCompileCount += 1
+                step.compileJobs.append(job)
+                continue
+
+            stagingPath = self.__GetStagingPath(objectFile)
+            job = Job(JobType.COMPILE, self.__GetCompileCommand(step, sourceFile, stagingPath), str(objectFile), step.name, buildName = build.buildName)
+            job.stagingPath = str(stagingPath)
+            debugSymbolsDir = self.__GetSplitDebugInfoDir(step, sourceFile)
+            if debugSymbolsDir is not None:
+                job.outputDirs.append(str(debugSymbolsDir))
+
+            build.compileJobs.setdefault(objectFile, job)
+            build.compileUnits[job.outputPath] = (sourceFile, step.scanner)
+            step.compileJobs.append(job)
+            newJobs.append(job)
+
+        self.jobs.extend(newJobs)
+        return newJobs
+
+    def __AddLinkJob(self, build: _BuildConfiguration, step: _BuildStep):
+        # Links keep the original step order since later steps may consume earlier targets
+        linkDependencies = step.compileJobs.copy()
+        previousLinkJobs = [s.linkJob for s in build.steps[:build.steps.index(step)] if s.linkJob is not None]
+        if len(previousLinkJobs) > 0:
+            linkDependencies.append(previousLinkJobs[-1])
+
+        # Archives are updated in place, ar replaces the file in one rename of its own. cl names the import library and
+        # exports file of a DLL after its output, those would be left behind in staging
+        if step.targetType == ReservedValues.Configuration.Build.Target.Type.ARCHIVE:
+            step.linkJob = Job(JobType.ARCHIVE, step.linkCommand, str(step.targetPath), step.name, linkDependencies, build.buildName)
+        elif self.compilerName == "cl":
+            step.linkJob = Job(JobType.LINK, step.linkCommand, str(step.targetPath), step.name, linkDependencies, build.buildName)
+        else:
+            # An LTO link runs code generation on every slot, the scheduler holds them all for it rather than oversubscribe.
+            # The count only goes into the job's command, the step's command and with it the manifest stay the same for any -j
+            ltoJobs = self.jobCount if step.isLto else None
+            stagingPath = self.__GetStagingPath(step.targetPath)
+            step.linkJob = Job(JobType.LINK, self.__GetLinkCommand(step, stagingPath, ltoJobs), str(step.targetPath), step.name, linkDependencies, build.buildName)
+            step.linkJob.stagingPath = str(stagingPath)
+            if step.isLto:
+                step.linkJob.slots = self.jobCount
+
+        self.jobs.append(step.linkJob)
+        return step.linkJob
+
+    def __GetStagingPath(self, outputPath: Path):
+        return outputPath.parent / self.STAGING_DIR_NAME / outputPath.name
+
+    def __GetCompileCommand(self, step: _BuildStep, sourceFile: Path, objectFile: Path):
+        if self.compilerName == "cl":
+            return self.__GetMSVCCompileCommand(step, sourceFile, objectFile)
+        return self.__GetGNUCompileCommand(step, sourceFile, objectFile)
+
+    def __GetLinkCommand(self, step: _BuildStep, targetPath: Optional[Path] = None, ltoJobs: Optional[int] = None):
+        objectFiles = list(step.objectFiles.values())
+        targetPath = step.targetPath if targetPath is None else targetPath
+        if step.targetType == ReservedValues.Configuration.Build.Target.Type.ARCHIVE:
+            return self.__GetArchiveCommand(step, objectFiles, targetPath)
+        if self.compilerName == "cl":
+            return self.__GetMSVCLinkCommand(step, objectFiles, targetPath)
+        return self.__GetGNULinkCommand(step, objectFiles, targetPath, ltoJobs)
+
+    def __GetMSVCCompileCommand(self, step: _BuildStep, sourceFile: Path, objectFile: Path):
+        # /FS serializes writes to the shared PDB now that several cl instances run at once
+        compileCommand = ["cl", "/nologo", "/c", "/FS"]
+        compileCommand.extend(self.__GetDefineArgs(step, "/D"))
+        compileCommand.extend(self.__GetRuntimeArgs(step))
+
+        for includePath in step.includeDirectories:
+            compileCommand.append("/I")
+            compileCommand.append(str(includePath))
+
+        # pathlib strips trailing slash, but is needed for cl. Adding it back with os.path.join().
+        compileCommand.append(f"/Fo:{objectFile}")
+        compileCommand.append(f"/Fd:{os.path.join(step.debugSymbolsDir, '')}")
+        compileCommand.extend(step.additionalArgs)
+        compileCommand.append(str(sourceFile))
+        return compileCommand
+
+    def __GetMSVCLinkCommand(self, step: _BuildStep, objectFiles: list[Path], targetPath: Path):
+        linkCommand = ["cl", "/nologo"]
+        if step.targetType == ReservedValues.Configuration.Build.Target.Type.LIBRARY:
+            linkCommand.append("/LD")
+
+        linkCommand.append(f"/Fe:{targetPath}")
+        linkCommand.append(f"/Fd:{os.path.join(step.debugSymbolsDir, '')}")
+        linkCommand.extend(str(o) for o in objectFiles)
+        linkCommand.extend(self.__GetRuntimeArgs(step))
+        linkCommand.extend(step.dynamicLibraries)
+        linkCommand.extend(step.staticLibraries)
+        linkCommand.extend(step.additionalArgs)
+
+        # Debug info stays in the objects and is referenced from the PDB instead of being merged into it. Everything after
+        # /link goes to the linker, so the switch joins a /link the additional arguments already opened
+        if self.isSplitDebugInfo:
+            if not any(arg.lower() in ("/link", "-link") for arg in linkCommand):
+                linkCommand.append("/link")
+            linkCommand.append("/DEBUG:FASTLINK")
+
+        return linkCommand
+
+    def __GetGNUCompileCommand(self, step: _BuildStep, sourceFile: Path, objectFile: Path):
+        compileCommand = [self.compilerName, "-c"]
 
-        return self.__Execute(compileCommand)
+        # Debug info, __FILE__ and the like name files relative to the project root, objects built from the same sources
+        # then come out the same in any checkout. Implies -fdebug-prefix-map and -fmacro-prefix-map
+        compileCommand.append(f"-ffile-prefix-map={self.projectRoot}=.")
+        compileCommand.extend(self.__GetDefineArgs(step, "-D"))
+        if step.targetType == ReservedValues.Configuration.Build.Target.Type.LIBRARY:
+            compileCommand.append("-fPIC")
 
-    def __Execute(self, cmd: list[str]):
+        # Debug info goes to a .dwo file in the debug symbols directory, the linker never has to copy it. -dumpdir takes
+        # a prefix rather than a directory, so the trailing separator is needed
+        debugSymbolsDir = self.__GetSplitDebugInfoDir(step, sourceFile)
+        if debugSymbolsDir is not None:
+            compileCommand.extend(["-gsplit-dwarf", "-dumpdir", os.path.join(debugSymbolsDir, '')])
+
+        # Objects carry intermediate code for the link to optimize across units, clang's ThinLTO keeps them small
+        if step.isLto:
+            compileCommand.append("-flto=thin" if self.compilerName == "clang" else "-flto")
+
+        for includePath in step.includeDirectories:
+            compileCommand.append("-I")
+            compileCommand.append(str(includePath))
+
+        compileCommand.extend(["-o", str(objectFile)])
+        compileCommand.extend(step.additionalArgs)
+        compileCommand.append(str(sourceFile))
+        return compileCommand
+
+    def __GetSplitDebugInfoDir(self, step: _BuildStep, sourceFile: Path):
+        # Mirrors the object directory. The compiler does not create it, the job running the command does. GCC drops split
+        # debug info under LTO anyway
+        if not self.isSplitDebugInfo or self.compilerName == "cl" or (step.isLto and self.compilerName == "gcc"):
+            return None
+        return step.debugSymbolsDir / step.objectFiles[sourceFile].parent.relative_to(step.objectDir)
+
+    def __GetGNULinkCommand(self, step: _BuildStep, objectFiles: list[Path], targetPath: Path, ltoJobs: Optional[int] = None):
+        linkCommand = [self.compilerName]
+        if step.targetType == ReservedValues.Configuration.Build.Target.Type.LIBRARY:
+            linkCommand.append("-shared")
+
+        if self.linker is not None:
+            linkCommand.append(f"-fuse-ld={self.linker}")
+        linkCommand.extend(self.__GetLinkerThreadArgs())
+        if step.isLto:
+            linkCommand.extend(self.__GetLtoLinkArgs(ltoJobs))
+
+        linkCommand.extend(["-o", str(targetPath)])
+        linkCommand.extend(str(o) for o in objectFiles)
+        linkCommand.extend(step.additionalArgs)
+
+        # Libraries go last so the linker sees the objects that reference them first
+        linkCommand.extend(step.dynamicLibraries)
+        linkCommand.extend(step.staticLibraries)
+        return linkCommand
+
+    def __GetArchiveCommand(self, step: _BuildStep, objectFiles: list[Path], targetPath: Path, operation: str = "rcs"):
+        if self.compilerName == "cl":
+            return ["lib", "/nologo", f"/OUT:{targetPath}"] + [str(o) for o in objectFiles]
+
+        # Members are stored and matched by their full path, mirrored objects may share a name. Archives of LTO objects
+        # go through the wrapper that loads the compiler's plugin, so the index lists the symbols in their intermediate code
+        archiver = "ar"
+        if step.isLto:
+            archiver = "llvm-ar" if self.compilerName == "clang" else "gcc-ar"
+
+        # A thin archive records its members relative to itself and only matches them when given the same way
+        if step.isThinArchive:
+            objectFiles = [Path(targetPath).parent / os.path.relpath(o, Path(targetPath).parent) for o in objectFiles]
+
+        modifiers = "P" + ("T" if step.isThinArchive else "")
+        return [archiver, operation + modifiers, str(targetPath)] + [str(o) for o in objectFiles]
+
+    def __GetLtoLinkArgs(self, ltoJobs: Optional[int]):
+        # Without a job count the toolchain decides, as in the commands recorded for the manifest and for ninja
+        if self.compilerName == "gcc":
+            return [f"-flto={'auto' if ltoJobs is None else ltoJobs}"]
+
+        # Unchanged modules are taken from the cache instead of being optimized again, each linker spells it differently
+        cacheDir = self.config.GetObjectOutputDir(PathType.RELATIVE) / self.LTO_CACHE_DIR_NAME
+        cachePolicy = f"cache_size_bytes={self.config.GetLtoCacheSize()}m"
+        ltoArgs = ["-flto=thin"]
+        if self.config.GetTargetPlatform() == ReservedValues.Configuration.Build.Target.Platform.OSX:
+            ltoArgs.append(f"-Wl,-cache_path_lto,{cacheDir}")
+        elif self.linker == ReservedValues.Configuration.Root.Linker.LLD:
+            ltoArgs.extend([f"-Wl,--thinlto-cache-dir={cacheDir}", f"-Wl,--thinlto-cache-policy={cachePolicy}"])
+            if ltoJobs is not None:
+                ltoArgs.append(f"-Wl,--thinlto-jobs={ltoJobs}")
+        else:
+            ltoArgs.extend([f"-Wl,-plugin-opt,cache-dir={cacheDir}", f"-Wl,-plugin-opt,cache-policy={cachePolicy}"])
+            if ltoJobs is not None:
+                ltoArgs.append(f"-Wl,-plugin-opt,jobs={ltoJobs}")
+
+        return ltoArgs
+
+    def __GetLinkerThreadArgs(self):
+        if self.linkerThreads is None:
+            return []
+
+        # Each linker spells it differently, lld and mold are threaded by default, gold is not and bfd has no threading at all
+        if self.linkerThreads is False:
+            if self.linker == ReservedValues.Configuration.Root.Linker.LLD:
+                return ["-Wl,--threads=1"]
+            elif self.linker in (ReservedValues.Configuration.Root.Linker.GOLD, ReservedValues.Configuration.Root.Linker.MOLD):
+                return ["-Wl,--no-threads"]
+        elif self.linkerThreads is True:
+            if self.linker == ReservedValues.Configuration.Root.Linker.GOLD:
+                return ["-Wl,--threads"]
+        else:
+            if self.linker == ReservedValues.Configuration.Root.Linker.LLD:
+                return [f"-Wl,--threads={self.linkerThreads}"]
+            elif self.linker == ReservedValues.Configuration.Root.Linker.GOLD:
+                return ["-Wl,--threads", f"-Wl,--thread-count={self.linkerThreads}"]
+            elif self.linker == ReservedValues.Configuration.Root.Linker.MOLD:
+                return [f"-Wl,--thread-count={self.linkerThreads}"]
+
+        return []
+
+    def __GetDefineArgs(self, step: _BuildStep, prefix: str):
+        defineArgs = []
+        for name, value in step.defines.items():
+            defineArg = name
+            if value is not None:
+                if type(value) is str:
+                    defineArg += f"=\"{value}\""
+                else:
+                    defineArg += f"={value}"
+
+            defineArgs.append(f"{prefix}{defineArg}")
+
+        return defineArgs
+
+    def __GetRuntimeArgs(self, step: _BuildStep):
+        runtimeArgs = []
+        if len(step.dynamicLibraries) > 0:
+            runtimeArgs.append("/MD")
+        if len(step.staticLibraries) > 0:
+            runtimeArgs.append("/MT")
+
+        return runtimeArgs
+
+    def __ExecuteJob(self, job: Job):
+        if job.jobType == JobType.COMPILE:
+            self.__RecordUnitInputs(self.builds[job.buildName], *self.builds[job.buildName].compileUnits[job.outputPath])
+
+        for dir in job.outputDirs:
+            os.makedirs(self.projectRoot / dir, exist_ok = True)
+
+        if job.jobType == JobType.ARCHIVE and not self.compilerName == "cl":
+            return self.__UpdateArchive(job)
+
+        if job.stagingPath is None:
+            return self.__Execute(job.command, job.outputPath, self.builds[job.buildName].diagnostics, job)
+
+        stagingPath = self.projectRoot / job.stagingPath
+        os.makedirs(stagingPath.parent, exist_ok = True)
+        resultCode = self.__Execute(job.command, job.outputPath, self.builds[job.buildName].diagnostics, job)
+
+        # A failed job may still have written part of its output, it is dropped so no later run mistakes it for a result
+        try:
+            if resultCode == ResultCode.SUCCESS:
+                os.replace(stagingPath, self.projectRoot / job.outputPath)
+            elif stagingPath.exists():
+                os.remove(stagingPath)
+        except OSError as e:
+            self.output.SendError(f"Could not move '{job.stagingPath}' into place: {e}")
+            return ResultCode.ERR_GENERIC
+
+        return resultCode
+
+    def __UpdateArchive(self, job: Job):
+        # Objects of a stale step are all compiled again, but most come out the same. Only members whose content
+        # changed are replaced and only those of removed sources deleted, an archive nothing changed in is left alone.
+        # ar writes the index whenever it writes the archive, so it is only rewritten along with a member
+        build = self.builds[job.buildName]
+        step = next(s for s in build.steps if s.name == job.stepName)
+        targetPath = self.projectRoot / step.targetPath
+        members = { str(o): self.__HashObject(o) for o in step.objectFiles.values() }
+        previous = build.archives.pop(str(step.targetPath), None)
+
+        if previous is None or not previous["thin"] == step.isThinArchive or not targetPath.exists():
+            if targetPath.exists():
+                os.remove(targetPath)
+            resultCode = self.__Execute(job.command, job.outputPath, build.diagnostics, job)
+        else:
+            removed = [Path(m) for m in previous["members"].keys() if not m in members]
+            changed = [Path(m) for m, memberHash in members.items() if not previous["members"].get(m) == memberHash]
+            self.output.SendInfoLogOnly(f"Archive '{step.targetPath}' has {len(changed)} changed and {len(removed)} removed of {len(members)} members")
+            if len(removed) == 0 and len(changed) == 0:
+                build.archives[str(step.targetPath)] = previous
+                return ResultCode.SUCCESS
+
+            resultCode = ResultCode.SUCCESS
+            if len(removed) > 0:
+                deleteCommand = self.__GetArchiveCommand(step, removed, step.targetPath, "dS" if len(changed) > 0 else "ds")
+                resultCode = self.__Execute(deleteCommand, job.outputPath, build.diagnostics, job)
+            if resultCode == ResultCode.SUCCESS and len(changed) > 0:
+                resultCode = self.__Execute(self.__GetArchiveCommand(step, changed, step.targetPath), job.outputPath, build.diagnostics, job)
+
+        # A failed update leaves no record, the next build then writes the archive from scratch
+        if resultCode == ResultCode.SUCCESS:
+            build.archives[str(step.targetPath)] = { "thin": step.isThinArchive, "members": members }
+
+        return resultCode
+
+    def __HashObject(self, objectFile: Path):
+        # Objects change with every build that touches them, caching their hashes would only grow the shared cache
+        digest = hashlib.blake2b(digest_size = 16)
+        try:
+            with open(self.projectRoot / objectFile, "rb") as f:
+                for block in iter(lambda: f.read(FileHasher.BLOCK_SIZE), b""):
+                    digest.update(block)
+        except OSError:
+            return None
+
+        return digest.hexdigest()
+
+    def __Execute(self, cmd: list[str], outputPath: str, diagnostics: DiagnosticParser, job: Optional[Job] = None):
         executableName = cmd[0]
 
-        self.output.SendInfoPrintOnly(f"Starting child process {executableName}")
+        if not self.output.isProgressEnabled:
+            self.output.SendInfoPrintOnly(f"Starting child process {executableName} for '{outputPath}'")
         self.output.SendInfoLogOnly(f"Starting child process '{executableName}' with arguments {' '.join(cmd[1:])}")
-        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        for line in p.stdout:
-            line = line.decode().strip()
-            if not line == "":
-                line = f"({executableName}) {line}"
-                if self.errorIndicator in line:
-                    self.output.SendError(line)
-                elif self.warningIndicator in line:
-                    self.output.SendWarning(line)
-                else:
-                    self.output.SendInfo(line)
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=self.projectRoot, start_new_session = not os.name == "nt")
+        except OSError as e:
+            self.output.SendError(f"Could not start child process {executableName}: {e}")
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        with self.processLock:
+            self.processes.add(p)
+            if self.isCancelled:
+                self.__StopProcess(p)
+
+        # Output is kept per job and sent in one batch so parallel jobs do not interleave,
+        # lines are read with a length limit so a flood of template errors never has to fit in memory at once
+        messages: list[tuple[MessageType, str]] = []
+        omittedLineCount = 0
+        unit = diagnostics.BeginUnit()
+        isTruncating = False
+        while True:
+            chunk = p.stdout.readline(self.MAX_OUTPUT_LINE_LENGTH)
+            if not chunk:
+                break
+
+            wasTruncating = isTruncating
+            isTruncating = not chunk.endswith(b"\n")
+            if wasTruncating:
+                continue
+
+            line = chunk.decode(errors = "replace").strip()
+            if line == "":
+                continue
+
+            diagnostic, isVisible = unit.Feed(line)
+            if not isVisible:
+                continue
+
+            if len(messages) >= self.MAX_BUFFERED_LINES:
+                omittedLineCount += 1
+                continue
+
+            line = f"({executableName}) {line}"
+            if diagnostic is not None and diagnostic.severity == Severity.ERROR:
+                messages.append((MessageType.ERROR, line))
+            elif diagnostic is not None and diagnostic.severity == Severity.WARNING:
+                messages.append((MessageType.WARNING, line))
+            else:
+                messages.append((MessageType.INFO, line))
+
+        returnCode, usage = self.__WaitForChild(p)
+        with self.processLock:
+            self.processes.discard(p)
+            isCancelled = self.isCancelled
 
-        p.communicate()
-        msg = f"Child process {executableName} exited with code {p.returncode}"
-        if not p.returncode == 0:
-            self.output.SendWarning(msg)
+        if job is not None and usage is not None:
+            job.usage = usage
+            job.peakMemory = usage.peakMemory
+
+        if omittedLineCount > 0:
+            messages.append((MessageType.WARNING, f"({executableName}) {omittedLineCount} more lines of output omitted"))
+
+        # A stopped job reports nothing of its own, the failure that stopped it has already been shown
+        if isCancelled and not returnCode == 0:
+            self.output.SendInfoLogOnly(f"Child process {executableName} for '{outputPath}' was stopped after another job failed")
+            return ResultCode.WRN_JOB_CANCELLED
+
+        msg = f"Child process {executableName} exited with code {returnCode}"
+        if not returnCode == 0:
+            messages.append((MessageType.WARNING, msg))
+            self.output.SendMany(messages)
             return ResultCode.WRN_PROC_NONZERO_EXIT
+
+        # With a status line only failing units are printed in full, the output of the others goes to the log in one batch
+        messages.append((MessageType.INFO, msg))
+        if self.output.isProgressEnabled:
+            self.output.SendManyLogOnly(messages)
         else:
-            self.output.SendInfo(msg)
-            return ResultCode.SUCCESS
+            self.output.SendMany(messages)
+
+        return ResultCode.SUCCESS
+
+    def __WaitForChild(self, p: subprocess.Popen):
+        p.stdout.close()
+        if not hasattr(os, "wait4"):
+            return (p.wait(), None)
+
+        # wait4 reports what the child and the tools it ran used, e.g. cc1 under gcc
+        _, status, usage = os.wait4(p.pid, 0)
+        p.returncode = os.waitstatus_to_exitcode(status)
+        return (p.returncode, ResourceUsage.FromRusage(usage))
+
+    def __RecordBuildStepDependencies(self, build: _BuildConfiguration, step: _BuildStep):
+        # Graph edges point from a node to what it is built from: target -> object -> source -> header
+        # Edges recorded by an earlier build are replaced, nodes left without parents are pruned afterwards
+        graph = build.graph
+        targetID = self.__GetOrAddGraphNode(graph, step.targetPath, NodeType.TARGET, step.name)
+        graph.RemoveChildren(targetID)
+        scanner = step.scanner
+
+        for sourceFile, objectFile in step.objectFiles.items():
+            sourcePath = Path(os.path.normpath(sourceFile))
+            objectID = self.__GetOrAddGraphNode(graph, objectFile, NodeType.OBJECT)
+            graph.RemoveChildren(objectID)
+            graph.LinkChild(targetID, objectID)
+
+            sourceID = self.__GetOrAddGraphNode(graph, sourcePath, NodeType.SOURCE)
+            graph.LinkChild(objectID, sourceID)
+
+            pending = [(sourceID, sourcePath)]
+            scanned = set()
+            while len(pending) > 0:
+                parentID, parentPath = pending.pop()
+                if parentPath in scanned:
+                    continue
+
+                # The hash a unit read, a file it never read before is left without one and compiled again next time
+                scanned.add(parentPath)
+                graph[parentID].fileHash = build.readHashes.get(parentPath)
+                graph.RemoveChildren(parentID)
+                for headerPath in scanner.Scan(parentPath):
+                    headerID = self.__GetOrAddGraphNode(graph, headerPath, NodeType.HEADER)
+                    graph.LinkChild(parentID, headerID)
+                    pending.append((headerID, headerPath))
+
+    def __GetOrAddGraphNode(self, graph: DependencyGraph, filePath: Path, nodeType: int, label: str = None):
+        nodeID = graph.FindNode(filePath)
+        if nodeID is None:
+            fileHash = None
+            if nodeType in (NodeType.SOURCE, NodeType.HEADER):
+                fileHash = self.hasher.Hash(filePath)
+            nodeID = graph.AddNode(fileHash, filePath, nodeType, label)
+
+        return nodeID
 
     def __ClearDirTree(self, root: str):
-        with Path(root) as treeRoot:
-            if not treeRoot.exists():
-                return
+        # With mirrored objects every source directory is a subtree of its own, they are removed in parallel
+        treeRoot = Path(root)
+        if not treeRoot.exists():
+            return
 
-            for p in treeRoot.iterdir():
-                if not p.is_dir():
-                    os.remove(p)
-                else:
-                    self.__ClearDirTree(p)
-                    os.rmdir(p)
+        with ThreadPoolExecutor(max_workers = self.MAX_CLEANUP_WORKERS) as pool:
+            for _ in pool.map(self.__RemovePath, list(treeRoot.iterdir())):
+                pass
+
+    def __RemovePath(self, path: Path):
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
@@ -7,16 +7,17 @@ See LICENSE file in the project root for full license information.
 import json
 import os
 from pathlib import Path
+from typing import Optional
 
-from constants import Configuration, KeyNames, ReservedValues, ResultCode
+from ..constants import Configuration, KeyNames, ReservedValues, ResultCode
 
 class PathType():
     ABSOLUTE = 0
     RELATIVE = 1
 
 class ConfigurationService:
-    def __init__(self):
-        self.configRoot = Path(os.getcwd()).resolve()
+    def __init__(self, configRoot: Optional[Path] = None):
+        self.configRoot = Path(os.getcwd() if configRoot is None else configRoot).resolve()
         self.projectRoot = None
         self.rootData = None
 
@@ -75,6 +76,20 @@ class ConfigurationService:
             return Path(relativePath)
         return Path(self.projectRoot / relativePath)
 
+    def GetStateOutputDir(self, pathType: PathType):
+        outputDirs = self.rootData[KeyNames.Root.OutputDirectories.ROOT]
+        relativePath = outputDirs.get(KeyNames.Root.OutputDirectories.STATE, Configuration.State.DIR_NAME)
+
+        if pathType == PathType.RELATIVE:
+            return Path(relativePath)
+        return Path(self.projectRoot / relativePath)
+
+    def GetStatePath(self, fileName: str, pathType: PathType):
+        return self.GetStateOutputDir(pathType) / fileName
+
+    def GetBuildStatePath(self, buildName: str, fileName: str, pathType: PathType):
+        return self.GetStateOutputDir(pathType) / buildName / fileName
+
     def GetCompilerOutputDirs(self, pathType: PathType):
         return [
             self.GetTargetOutputDir(pathType),
@@ -95,6 +110,38 @@ class ConfigurationService:
             ReservedValues.Configuration.Root.Toolchain.MSVC
         ]
 
+    def GetLinker(self):
+        # Returns None when the toolchain should use its default linker
+        linker = self.rootData.get(KeyNames.Root.Linker.ROOT, {}).get(KeyNames.Root.Linker.TYPE)
+        return None if linker is None else str(linker)
+
+    def GetKnownLinkers(self):
+        return [
+            ReservedValues.Configuration.Root.Linker.BFD,
+            ReservedValues.Configuration.Root.Linker.GOLD,
+            ReservedValues.Configuration.Root.Linker.LLD,
+            ReservedValues.Configuration.Root.Linker.MOLD
+        ]
+
+    def GetLinkerThreads(self):
+        # Returns a thread count, True to use every processor, False to link on one thread, or None to leave it to the linker
+        return self.rootData.get(KeyNames.Root.Linker.ROOT, {}).get(KeyNames.Root.Linker.THREADS)
+
+    def IsSplitDebugInfoEnabled(self):
+        return self.rootData.get(KeyNames.Root.DebugInfo.ROOT, {}).get(KeyNames.Root.DebugInfo.SPLIT) is True
+
+    def GetLtoCacheSize(self):
+        # In MiB, the linker prunes least recently used entries of the ThinLTO cache above this size
+        return self.rootData.get(KeyNames.Root.LinkTimeOptimization.ROOT, {}).get(KeyNames.Root.LinkTimeOptimization.CACHE_SIZE, 1024)
+
+    def GetRegressionThreshold(self):
+        # In percent, a step or unit taking this much longer than its baseline is reported as a regression
+        return self.rootData.get(KeyNames.Root.History.ROOT, {}).get(KeyNames.Root.History.REGRESSION_THRESHOLD, 20)
+
+    def GetBaselineSize(self):
+        # Number of earlier successful runs a step or unit is compared against
+        return self.rootData.get(KeyNames.Root.History.ROOT, {}).get(KeyNames.Root.History.BASELINE_SIZE, 10)
+
     def CheckConfigDir(self):
         with self.GetConfigDir() as configDirPath:
             if configDirPath.exists():
@@ -103,7 +150,7 @@ class ConfigurationService:
         return ResultCode.ERR_DIR_NOT_FOUND
 
     def LoadRootConfig(self):
-        rootConfigPath = Path(Configuration.Files.DIR_NAME) / Path(Configuration.Root.FILE_NAME)
+        rootConfigPath = self.GetConfigDir() / Configuration.Root.FILE_NAME
         if rootConfigPath.exists():
             with open(rootConfigPath, "r") as f:
                 self.rootData = json.load(f)
@@ -121,10 +168,38 @@ class ConfigurationService:
         if not self.GetToolchain() in self.GetKnownToolchains():
             return ResultCode.ERR_CONFIG_INVALID
 
+        linker = self.GetLinker()
+        if linker is not None and not linker in self.GetKnownLinkers():
+            return ResultCode.ERR_CONFIG_INVALID
+
+        threads = self.GetLinkerThreads()
+        if threads is not None and type(threads) is not bool and (type(threads) is not int or threads < 1):
+            return ResultCode.ERR_CONFIG_INVALID
+
+        cacheSize = self.GetLtoCacheSize()
+        if type(cacheSize) is not int or cacheSize < 1:
+            return ResultCode.ERR_CONFIG_INVALID
+
+        threshold = self.GetRegressionThreshold()
+        if type(threshold) not in (int, float) or threshold <= 0:
+            return ResultCode.ERR_CONFIG_INVALID
+
+        baselineSize = self.GetBaselineSize()
+        if type(baselineSize) is not int or baselineSize < 1:
+            return ResultCode.ERR_CONFIG_INVALID
+
+        return ResultCode.SUCCESS
+
+    def SetProjectRoot(self, projectRoot: Path):
+        projectRoot = Path(projectRoot).resolve()
+        if not (projectRoot / Configuration.App.RootLocator.NAME).is_file():
+            return ResultCode.ERR_FILE_NOT_FOUND
+
+        self.projectRoot = projectRoot
         return ResultCode.SUCCESS
 
     def FindProjectRoot(self):
-        dir = Path(os.getcwd())
+        dir = self.configRoot
         isRootFound = False
 
         # Search ancestor directories for root locator
@@ -149,8 +224,11 @@ class ConfigurationService:
     def GetBuildFileExt(self):
         return Configuration.Build.Files.EXTENSION
 
+    def GetBuildConfigPath(self, buildName: str):
+        return self.GetConfigDir() / f"{buildName}.{Configuration.Build.Files.EXTENSION}"
+
     def LoadBuildConfig(self, buildName: str):
-        buildFilePath = self.GetConfigDir() / f"{buildName}.{Configuration.Build.Files.EXTENSION}"
+        buildFilePath = self.GetBuildConfigPath(buildName)
         if buildFilePath.exists():
             with open(buildFilePath, "r") as f:
                 self.buildData = json.load(f)
@@ -195,6 +273,12 @@ class ConfigurationService:
     def GetBuildStepSourceDirectories(self):
         return self.__GetBuildStepValue(KeyNames.Build.Steps.Detail.SOURCE_DIRECTORIES)
 
+    def GetBuildStepSourcePatterns(self):
+        return self.__GetBuildStepValue(KeyNames.Build.Steps.Detail.SOURCE_PATTERNS)
+
+    def GetBuildStepExcludePatterns(self):
+        return self.__GetBuildStepValue(KeyNames.Build.Steps.Detail.EXCLUDE_PATTERNS)
+
     def GetBuildStepSourceExtension(self):
         return self.__GetBuildStepValue(KeyNames.Build.Steps.Detail.SOURCE_FILE_EXTENSTION)
 
@@ -207,6 +291,12 @@ class ConfigurationService:
     def GetBuildStepTargetType(self):
         return self.__GetBuildStepValue(KeyNames.Build.Steps.Detail.TARGET_TYPE)
 
+    def GetBuildStepLinkTimeOptimization(self):
+        return self.__GetBuildStepValue(KeyNames.Build.Steps.Detail.LINK_TIME_OPTIMIZATION)
+
+    def GetBuildStepThinArchive(self):
+        return self.__GetBuildStepValue(KeyNames.Build.Steps.Detail.THIN_ARCHIVE)
+
     def GetBuildStepAdditionalArguments(self):
         return self.__GetBuildStepAdditionalArgs(KeyNames.Build.Steps.Detail.ADDITIONAL_ARGUMENTS)
 
@@ -217,7 +307,8 @@ class ConfigurationService:
         return self.__GetBuildStepSharedLibraries(KeyNames.Build.Steps.Detail.SharedLibraries.STATIC)
 
     def __GetBuildStepValue(self, keyName: str):
-        if not keyName in self.buildStepData and not keyName in self.buildSharedResources:
+        # Shared resources only apply to steps that ask for them with a lookup
+        if not keyName in self.buildStepData:
             return (ResultCode.WRN_NO_VALUE, None)
 
         dataValue = self.buildStepData[keyName]
@@ -231,8 +322,8 @@ class ConfigurationService:
 
             if sharedResourceAppliesTo == ReservedValues.Configuration.Build.SharedResource.APPLIES_TO_ALL or self.buildStepName in sharedResourceAppliesTo:
                 return (ResultCode.SUCCESS, sharedResource[KeyNames.Build.SharedRecources.VALUE])
-            else:
-                return (ResultCode.WRN_NO_VALUE, None)
+
+        return (ResultCode.WRN_NO_VALUE, None)
 
     def __GetBuildStepSharedLibraries(self, libType: str):
         resultCode, libData = self.__GetBuildStepValue(KeyNames.Build.Steps.Detail.SharedLibraries.ROOT)
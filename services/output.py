@@ -6,8 +6,13 @@ See LICENSE file in the project root for full license information.
 
 from datetime import datetime
 from enum import Enum
+import itertools
 import os
 from pathlib import Path
+import shutil
+import sys
+import threading
+from typing import Optional
 
 class MessageType(Enum):
     ERROR   = 0
@@ -15,7 +20,10 @@ class MessageType(Enum):
     WARNING = 2
 
 class OutputService:
-    def __init__(self, logPath: str):
+    # Counts services within this process, an embedding program may open several over its lifetime
+    __invocationCounter = itertools.count(1)
+
+    def __init__(self, logPath: str, isPrinting: bool = True, isResultOnly: bool = False):
         with Path(logPath) as logFilePath:
             logDirpath = logFilePath.parent
             if not logDirpath.exists():
@@ -23,7 +31,24 @@ class OutputService:
         
             self.logFile = open(logFilePath, "a")
 
+        # Compile jobs report from worker threads, re-entrant so a batch can hold it across sends
+        self.lock = threading.RLock()
+        self.isPrinting = isPrinting
+
+        # With results only, every other message is printed to stderr so stdout can be consumed by scripts as it is
+        self.isResultOnly = isResultOnly
+
+        # A redrawn status line only works on a terminal, piped output and dumb terminals keep every line
+        self.isProgressEnabled = isPrinting and not isResultOnly and sys.stdout.isatty() and not os.environ.get("TERM") == "dumb"
+        self.progressText: Optional[str] = None
+
+        # Several zbuild processes may append to the same log at once. Every line carries the invocation it came from,
+        # so one run can be pulled out with a grep for its ID
+        self.invocationID = f"{os.getpid()}.{next(OutputService.__invocationCounter)}"
+        self.__SendLogOnly(self.__FormatMessage(MessageType.INFO, f"Invocation {self.invocationID} started"))
+
     def Close(self):
+        self.__SendLogOnly(self.__FormatMessage(MessageType.INFO, f"Invocation {self.invocationID} finished"))
         self.logFile.close()
 
     def SendError(self, msg: str):
@@ -35,6 +60,40 @@ class OutputService:
     def SendWarning(self, msg: str):
         self.__Send(MessageType.WARNING, msg)
 
+    def SendMany(self, messages: list[tuple[MessageType, str]]):
+        # Keeps a group of messages together when several threads are sending
+        with self.lock:
+            for msgType, msg in messages:
+                self.__Send(msgType, msg)
+
+    def SendManyLogOnly(self, messages: list[tuple[MessageType, str]]):
+        with self.lock:
+            for msgType, msg in messages:
+                self.__SendLogOnly(self.__FormatMessage(msgType, msg))
+
+    def SetProgress(self, text: str):
+        # Messages sent while a status line is shown are printed above it, the line is then drawn again
+        if not self.isProgressEnabled:
+            return
+
+        with self.lock:
+            self.progressText = text
+            self.__DrawProgress()
+
+    def ClearProgress(self):
+        if self.progressText is None:
+            return
+
+        with self.lock:
+            self.progressText = None
+            sys.stdout.write("\r\033[K")
+            sys.stdout.flush()
+
+    def SendResult(self, msg: str):
+        # Query results are printed bare so they can be consumed by scripts
+        self.__SendPrintOnly(msg, True)
+        self.__SendLogOnly(self.__FormatMessage(MessageType.INFO, msg))
+
     def SendErrorPrintOnly(self, msg: str):
         self.__SendPrintOnly(self.__FormatMessage(MessageType.ERROR, msg))
 
@@ -65,13 +124,35 @@ class OutputService:
         return f"[ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ][ {msgIcon} ] {msg}"
 
     def __SendLogOnly(self, msg: str):
-        self.logFile.write(f"{msg}\n")
-        self.logFile.flush()
-
-    def __SendPrintOnly(self, msg: str):
-        print(msg)
-
-    def __Send(self, msgType: str, msg: str):
+        # Each line goes out in a single write to a file opened for appending, lines from other processes never split it
+        with self.lock:
+            self.logFile.write(f"[ {self.invocationID} ]{msg}\n")
+            self.logFile.flush()
+
+    def __SendPrintOnly(self, msg: str, isResult: bool = False):
+        if not self.isPrinting:
+            return
+
+        with self.lock:
+            if self.isResultOnly and not isResult:
+                print(msg, file = sys.stderr)
+                return
+
+            if self.progressText is None:
+                print(msg)
+                return
+
+            sys.stdout.write(f"\r\033[K{msg}\n")
+            self.__DrawProgress()
+
+    def __DrawProgress(self):
+        # Cut to the terminal width, a wrapped line could not be erased with a carriage return
+        width = shutil.get_terminal_size().columns
+        sys.stdout.write(f"\r\033[K{self.progressText[:width - 1]}")
+        sys.stdout.flush()
+
+    def __Send(self, msgType: MessageType, msg: str):
         msgComplete = self.__FormatMessage(msgType, msg)
-        self.__SendPrintOnly(msgComplete)
-        self.__SendLogOnly(msgComplete)
+        with self.lock:
+            self.__SendPrintOnly(msgComplete)
+            self.__SendLogOnly(msgComplete)
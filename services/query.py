@@ -0,0 +1,176 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+from datetime import datetime
+import os
+from pathlib import Path
+from typing import Optional
+
+from ..constants import Configuration, ResultCode
+from ..core.depgraph import DependencyGraph, DependencyGraphNode, NodeType
+from ..core.hashing import FileHasher
+from ..core.history import BuildHistory
+from .configuration import ConfigurationService, PathType
+from .output import OutputService
+
+class QueryService:
+    DEFAULT_HISTORY_SIZE = 20
+
+    def __init__(self, config: ConfigurationService, output: OutputService, invocationDir: Path):
+        self.config = config
+        self.output = output
+        self.invocationDir = Path(invocationDir)
+        self.graph = DependencyGraph()
+        self.hasher = FileHasher()
+
+    def Load(self, buildName: str):
+        graphPath = self.config.GetBuildStatePath(buildName, Configuration.State.Files.DEPENDENCY_GRAPH, PathType.ABSOLUTE)
+        resultCode = self.graph.Load(graphPath)
+        if resultCode == ResultCode.ERR_FILE_NOT_FOUND:
+            self.output.SendError(f"No dependency graph recorded for '{buildName}', build it at least once first")
+        elif not resultCode == ResultCode.SUCCESS:
+            self.output.SendError(f"The dependency graph '{graphPath}' is not valid, rebuild '{buildName}' to regenerate it")
+
+        return resultCode
+
+    def Affected(self, filePath: str):
+        resultCode, nodeID = self.__FindNode(filePath)
+        if not resultCode == ResultCode.SUCCESS:
+            return resultCode
+
+        if nodeID is None:
+            return ResultCode.SUCCESS
+
+        affected = [self.graph[nodeID]] + [self.graph[id] for id, _ in self.graph.GetDependents(nodeID)]
+        for nodeType, title in ((NodeType.SOURCE, "Translation units"), (NodeType.TARGET, "Targets")):
+            self.output.SendResult(f"{title}:")
+            for node in affected:
+                if node.nodeType == nodeType:
+                    self.output.SendResult(f"    {node.filePath}")
+
+        self.output.SendResult("Steps:")
+        for node in affected:
+            if node.nodeType == NodeType.TARGET:
+                self.output.SendResult(f"    {node.label}")
+
+        return ResultCode.SUCCESS
+
+    def Why(self, filePath: str):
+        resultCode, nodeID = self.__FindNode(filePath)
+        if not resultCode == ResultCode.SUCCESS:
+            return resultCode
+
+        if nodeID is None:
+            return ResultCode.SUCCESS
+
+        node = self.graph[nodeID]
+        isMissing = node.nodeType in (NodeType.TARGET, NodeType.OBJECT) and not (self.config.GetProjectRoot() / node.filePath).exists()
+        if isMissing:
+            self.output.SendResult(f"{node.filePath} is stale because it does not exist")
+
+        # Only the files this node depends on are hashed, the rest of the tree is never touched
+        chains = self.graph.FindChainsTo(nodeID, self.__IsModified)
+        if len(chains) == 0 and not isMissing:
+            self.output.SendResult(f"{node.filePath} is up to date with its recorded inputs")
+
+        for chain in chains:
+            changedNode = self.graph[chain[-1]]
+            state = "missing" if self.hasher.Hash(self.config.GetProjectRoot() / changedNode.filePath) is None else "modified"
+            self.output.SendResult(" -> ".join(str(self.graph[id].filePath) for id in chain) + f" ({state})")
+
+        return ResultCode.SUCCESS
+
+    def History(self, buildName: str, count: Optional[int]):
+        # Reads the history every build records, no dependency graph is needed
+        history = BuildHistory()
+        historyPath = self.config.GetStatePath(Configuration.State.Files.BUILD_HISTORY, PathType.ABSOLUTE)
+        resultCode = history.Open(historyPath, False)
+        if resultCode == ResultCode.ERR_FILE_NOT_FOUND:
+            self.output.SendError(f"No build history recorded yet, build '{buildName}' at least once first")
+            return resultCode
+        elif not resultCode == ResultCode.SUCCESS:
+            self.output.SendError(f"The build history '{historyPath}' is not valid")
+            return resultCode
+
+        builds = history.GetBuilds(buildName, self.DEFAULT_HISTORY_SIZE if count is None else count)
+        if len(builds) == 0:
+            self.output.SendInfo(f"No builds of '{buildName}' recorded yet")
+            history.Close()
+            return ResultCode.SUCCESS
+
+        # Reuse counts the units that needed no compile job, because their step was up to date or another step built them
+        self.output.SendResult(f"Builds of '{buildName}', newest first:")
+        for _, startTime, wallTime, jobCount, resultCode, unitCount, compiledCount in builds:
+            state = "ok" if resultCode == ResultCode.SUCCESS else "failed"
+            reuse = 1.0 if unitCount == 0 else (unitCount - compiledCount) / unitCount
+            self.output.SendResult(
+                f"    {datetime.fromtimestamp(startTime):%Y-%m-%d %H:%M:%S}  {state:6}  {wallTime:8.2f}s  -j{jobCount:<3}  "
+                f"{compiledCount} of {unitCount} units compiled, {reuse:.0%} reused"
+            )
+
+        threshold = self.config.GetRegressionThreshold() / 100
+        baselineSize = self.config.GetBaselineSize()
+        trends = history.GetStepTrends(buildName, baselineSize)
+        if len(trends) > 0:
+            self.output.SendResult(f"Compile time of the steps rebuilt last, against the median of up to {baselineSize} earlier rebuilds:")
+            for name, compileTime, baseline in trends:
+                change = "no baseline yet" if baseline is None or baseline == 0 else f"baseline {baseline:.2f}s ({(compileTime - baseline) / baseline:+.0%})"
+                self.output.SendResult(f"    {name}: {compileTime:.2f}s, {change}")
+
+        regressions = history.FindRegressions(buildName, threshold, baselineSize)
+        history.Close()
+        if len(regressions) == 0:
+            self.output.SendResult(f"Nothing in the latest build took over {threshold:.0%} longer than its baseline")
+            return ResultCode.SUCCESS
+
+        self.output.SendResult(f"Took over {threshold:.0%} longer than their baseline in the latest build:")
+        for regression in regressions:
+            self.output.SendResult(f"    {regression.kind:4} {regression.name}: {regression.duration:.2f}s against {regression.baseline:.2f}s (+{regression.increase:.0%})")
+
+        return ResultCode.SUCCESS
+
+    def Dependencies(self, filePath: str, maxDepth: Optional[int]):
+        resultCode, nodeID = self.__FindNode(filePath)
+        if resultCode == ResultCode.SUCCESS and nodeID is not None:
+            self.__SendWalk(self.graph.GetDependencies(nodeID, maxDepth))
+
+        return resultCode
+
+    def Dependents(self, filePath: str, maxDepth: Optional[int]):
+        resultCode, nodeID = self.__FindNode(filePath)
+        if resultCode == ResultCode.SUCCESS and nodeID is not None:
+            self.__SendWalk(self.graph.GetDependents(nodeID, maxDepth))
+
+        return resultCode
+
+    def __SendWalk(self, visited: list[tuple[int, int]]):
+        # The walk is breadth first, each file is listed once under the shortest distance it is found at
+        lastDepth = 0
+        for nodeID, depth in visited:
+            if not depth == lastDepth:
+                self.output.SendResult(f"Depth {depth}:")
+                lastDepth = depth
+            self.output.SendResult(f"    {self.graph[nodeID].filePath}")
+
+    def __IsModified(self, node: DependencyGraphNode):
+        if node.fileHash is None:
+            return False
+        return not self.hasher.Hash(self.config.GetProjectRoot() / node.filePath) == node.fileHash
+
+    def __FindNode(self, filePath: str):
+        # Paths are given relative to where zbuild was invoked, but recorded relative to the project root
+        absolutePath = Path(os.path.normpath(self.invocationDir / filePath))
+        try:
+            relativePath = absolutePath.relative_to(self.config.GetProjectRoot())
+        except ValueError:
+            self.output.SendError(f"'{filePath}' is outside of the project root '{self.config.GetProjectRoot()}'")
+            return (ResultCode.ERR_ARG_INVALID, None)
+
+        nodeID = self.graph.FindNode(relativePath)
+        if nodeID is None:
+            self.output.SendInfo(f"'{relativePath}' is not part of the dependency graph")
+
+        return (ResultCode.SUCCESS, nodeID)
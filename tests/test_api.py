@@ -0,0 +1,77 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+
+from ..api import GetProject, Project
+from ..services.compiler import StepStatus
+
+@unittest.skipIf(shutil.which("gcc") is None, "gcc is not installed")
+class ProjectTests(unittest.TestCase):
+    def setUp(self):
+        self.projectRoot = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.projectRoot, True)
+        (self.projectRoot / "zbuild.root").touch()
+        (self.projectRoot / "config").mkdir()
+        self.__WriteRootConfig()
+        (self.projectRoot / "config/debug.b.json").write_text(json.dumps({ "shared": {}, "steps": {
+            "app": { "targetName": "app", "targetType": "standalone", "sourceExtension": "c", "defines": {}, "sourceDirectories": ["src"] }
+        }}))
+        (self.projectRoot / "src").mkdir()
+        (self.projectRoot / "src/main.c").write_text("int main(void) { return 1 / 0; }\n")
+
+        self.project = Project(self.projectRoot, self.projectRoot)
+        self.addCleanup(self.project.Close)
+
+    def __WriteRootConfig(self):
+        (self.projectRoot / "config/root.json").write_text(json.dumps({
+            "outputDirectories": { "target": "out/bin", "object": "out/obj", "debugSymbols": "out/pdb", "log": "out/log" },
+            "platform": "linux",
+            "toolchain": "gcc"
+        }))
+
+    def test_BuildResultDescribesSteps(self):
+        result = self.project.Build("debug", jobCount = 1)
+        self.assertTrue(result.isSuccess)
+        self.assertEqual([(s.name, s.status) for s in result.steps], [("app", StepStatus.BUILT)])
+        self.assertEqual(result.steps[0].targetPath, self.projectRoot / "out/bin/debug/app")
+        self.assertTrue(result.steps[0].targetPath.exists())
+        self.assertGreater(result.steps[0].compileTime, 0.0)
+
+        # gcc warns about the division by zero without any warning options
+        self.assertEqual((result.errorCount, result.warningCount), (0, 1))
+        self.assertEqual(result.diagnostics[0]["file"], "src/main.c")
+
+    def test_WarmCacheIsKeptUntilRootConfigChanges(self):
+        self.project.Build("debug", jobCount = 1)
+        cache = self.project.cache
+        result = self.project.Build("debug", jobCount = 1)
+        self.assertIs(self.project.cache, cache)
+        self.assertEqual([s.status for s in result.steps], [StepStatus.UP_TO_DATE])
+
+        # The root configuration is read again along with fresh caches, which still find the step up to date
+        (self.projectRoot / "config/root.json").write_text((self.projectRoot / "config/root.json").read_text() + "\n")
+        result = self.project.Build("debug", jobCount = 1)
+        self.assertIsNot(self.project.cache, cache)
+        self.assertEqual([s.status for s in result.steps], [StepStatus.UP_TO_DATE])
+
+    def test_ProjectIsKeptPerRoot(self):
+        project = GetProject(self.projectRoot, self.projectRoot)
+        self.assertIs(GetProject(self.projectRoot / "src" / "..", self.projectRoot), project)
+        self.assertIsNot(GetProject(self.projectRoot), project)
+
+    @unittest.skipIf(not hasattr(os, "wait4"), "child resource usage needs wait4")
+    def test_StepUsageCoversCompileAndLink(self):
+        result = self.project.Build("debug", jobCount = 1)
+        usage = result.steps[0].usage
+        self.assertEqual(usage.processCount, 2)
+        self.assertGreater(usage.cpuTime, 0.0)
+        self.assertGreater(usage.peakMemory, 0)
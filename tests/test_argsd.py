@@ -0,0 +1,37 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import sys
+import unittest
+from unittest import mock
+
+from ..argsd import ArgHelper
+from ..constants import ResultCode
+
+class ParseArgsTests(unittest.TestCase):
+    def setUp(self):
+        self.argHelper = ArgHelper()
+        self.argHelper.AddArg("j", "jobs", "job count", varName = "count", isOption = True, action = "jobs")
+        self.argHelper.AddArg("b", "build", "build", group = 1, isMulti = True, action = "build")
+        self.argHelper.AddArg("r", "run", "run", group = 1, isRemainder = True, action = "run")
+
+    def __Parse(self, *args: str):
+        with mock.patch.object(sys, "argv", ["zbuild"] + list(args)):
+            return self.argHelper.ParseArgs()
+
+    def test_RunPassesUnknownArgumentsThrough(self):
+        self.assertEqual(self.__Parse("--run", "app", "--verbose"), (ResultCode.SUCCESS, [("run", ["app", "--verbose"])]))
+
+    def test_RunPassesKnownArgumentsThrough(self):
+        # -j after the build name belongs to the program, the one before it is still taken by zbuild
+        self.assertEqual(self.__Parse("--run", "app", "-j", "2"), (ResultCode.SUCCESS, [("run", ["app", "-j", "2"])]))
+        self.assertEqual(self.__Parse("-j", "4", "-r", "app", "-j", "2", "-h"), (ResultCode.SUCCESS, [("jobs", "4"), ("run", ["app", "-j", "2", "-h"])]))
+
+    def test_RunDropsSeparator(self):
+        self.assertEqual(self.__Parse("--run", "app", "--", "--", "-b"), (ResultCode.SUCCESS, [("run", ["app", "--", "-b"])]))
+
+    def test_RunWithoutBuildName(self):
+        self.assertEqual(self.__Parse("--run"), (ResultCode.SUCCESS, [("run", [])]))
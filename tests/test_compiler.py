@@ -0,0 +1,211 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import copy
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from ..api import Project
+from ..constants import ResultCode
+from ..services.compiler import CompilerService, StepStatus
+
+@unittest.skipIf(shutil.which("gcc") is None, "gcc is not installed")
+class IncrementalBuildTests(unittest.TestCase):
+    def setUp(self):
+        self.projectRoot = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.projectRoot, True)
+        (self.projectRoot / "zbuild.root").touch()
+        self.__Write("config/root.json", json.dumps({
+            "outputDirectories": { "target": "out/bin", "object": "out/obj", "debugSymbols": "out/pdb", "log": "out/log" },
+            "platform": "linux",
+            "toolchain": "gcc"
+        }))
+        self.__WriteSteps({ "app": self.__GetStep("app", "standalone", "src") })
+
+    def __GetStep(self, targetName: str, targetType: str, *sourceDirectories: str):
+        return { "targetName": targetName, "targetType": targetType, "sourceExtension": "c", "defines": {}, "sourceDirectories": list(sourceDirectories) }
+
+    def __WriteSteps(self, steps: dict, buildName: str = "debug"):
+        self.__Write(f"config/{buildName}.b.json", json.dumps({ "shared": {}, "steps": steps }))
+
+    def __Write(self, filePath: str, content: str):
+        (self.projectRoot / filePath).parent.mkdir(parents = True, exist_ok = True)
+        (self.projectRoot / filePath).write_text(content)
+
+    def __BuildSteps(self, jobCount: int = 1):
+        project = Project(self.projectRoot, self.projectRoot)
+        self.addCleanup(project.Close)
+        result = project.Build("debug", jobCount = jobCount)
+        self.assertTrue(result.isSuccess)
+        return [s.status for s in result.steps]
+
+    def __Build(self):
+        return self.__BuildSteps()[0]
+
+    def __GetCompiler(self, *buildNames: str):
+        project = Project(self.projectRoot, self.projectRoot)
+        self.addCleanup(project.Close)
+        self.assertEqual(project.Load(), ResultCode.SUCCESS)
+
+        configs = []
+        for buildName in buildNames:
+            configs.append(copy.copy(project.config))
+            self.assertEqual(configs[-1].LoadBuildConfig(buildName), ResultCode.SUCCESS)
+
+        return CompilerService(configs, project.output, 1, cache = project.cache)
+
+    def __GetModifiedTime(self, filePath: str):
+        return (self.projectRoot / filePath).stat().st_mtime_ns
+
+    def test_ConfigurationsBuildTogether(self):
+        # Both configurations are planned by one compiler service, the source directory is listed once for both
+        self.__WriteSteps({ "app": self.__GetStep("app", "standalone", "src") }, "release")
+        self.__Write("src/main.c", "int main(void) { return 0; }\n")
+        compiler = self.__GetCompiler("debug", "release")
+        self.assertEqual(compiler.Compile(), ResultCode.SUCCESS)
+        self.assertEqual([compiler.GetStepStatus(s) for b in ("debug", "release") for s in compiler.GetBuildSteps(b)], [StepStatus.BUILT, StepStatus.BUILT])
+        self.assertTrue((self.projectRoot / "out/obj/debug/src/main.o").exists())
+        self.assertTrue((self.projectRoot / "out/obj/release/src/main.o").exists())
+        self.assertEqual(compiler.discovery.listedCount, 1)
+
+    def test_NinjaFileForArchiveAndProgram(self):
+        self.__WriteSteps({ "lib": self.__GetStep("libu.a", "archive", "lib"), "app": self.__GetStep("app", "standalone", "app") })
+        self.__Write("lib/util.c", "int Util(void) { return 1; }\n")
+        self.__Write("app/main.c", "int main(void) { return 0; }\n")
+        self.assertEqual(self.__GetCompiler("debug").GenerateNinja(["zbuild", "-g", "ninja"]), ResultCode.SUCCESS)
+
+        ninjaPath = self.projectRoot / ".zbuild/debug/build.ninja"
+        content = ninjaPath.read_text()
+        self.assertIn("build out/obj/debug/lib/util.o: compile lib/util.c\n", content)
+        self.assertIn("build out/bin/debug/libu.a: archive out/obj/debug/lib/util.o\n", content)
+        self.assertIn("build out/bin/debug/app: link out/obj/debug/app/main.o | out/bin/debug/libu.a\n", content)
+        self.assertIn("  command = zbuild -g ninja debug\n", content)
+        self.assertIn("default all\n", content)
+
+        # Generating again from the same configuration writes the same file
+        self.assertEqual(self.__GetCompiler("debug").GenerateNinja(["zbuild", "-g", "ninja"]), ResultCode.SUCCESS)
+        self.assertEqual(ninjaPath.read_text(), content)
+
+    def test_LtoStepIsNotStaleForOtherJobCount(self):
+        # The link is given the job count, the command recorded for the step is not
+        self.__WriteSteps({ "app": dict(self.__GetStep("app", "standalone", "src"), lto = True) })
+        self.__Write("src/main.c", "int main(void) { return 0; }\n")
+        self.assertEqual(self.__GetCompiler("debug").GenerateNinja(["zbuild", "-g", "ninja"]), ResultCode.SUCCESS)
+        content = (self.projectRoot / ".zbuild/debug/build.ninja").read_text()
+        self.assertIn(" -flto -o out/obj/debug/src/main.o src/main.c\n", content)
+        self.assertIn("  cmd = gcc -flto=auto -o out/bin/debug/app out/obj/debug/src/main.o\n", content)
+
+        self.assertEqual(self.__BuildSteps(2), [StepStatus.BUILT])
+        self.assertEqual(self.__BuildSteps(1), [StepStatus.UP_TO_DATE])
+
+    def test_ObjectsMirrorSourceTree(self):
+        # Both units are named util.c, each keeps its own object. Once one is gone so are its object and directory
+        self.__WriteSteps({ "app": self.__GetStep("app", "standalone", "src", "src/a", "src/b") })
+        self.__Write("src/a/util.c", "int A(void) { return 1; }\n")
+        self.__Write("src/b/util.c", "int B(void) { return 2; }\n")
+        self.__Write("src/main.c", "int A(void);\nint B(void);\nint main(void) { return A() + B() - 3; }\n")
+        self.assertEqual(self.__Build(), StepStatus.BUILT)
+        self.assertTrue((self.projectRoot / "out/obj/debug/src/a/util.o").exists())
+        self.assertTrue((self.projectRoot / "out/obj/debug/src/b/util.o").exists())
+
+        (self.projectRoot / "src/b/util.c").unlink()
+        self.__Write("src/main.c", "int A(void);\nint main(void) { return A() - 1; }\n")
+        self.assertEqual(self.__Build(), StepStatus.BUILT)
+        self.assertTrue((self.projectRoot / "out/obj/debug/src/a/util.o").exists())
+        self.assertFalse((self.projectRoot / "out/obj/debug/src/b").exists())
+
+    @unittest.skipIf(shutil.which("ar") is None, "ar is not installed")
+    def test_ArchiveReplacesChangedMembersOnly(self):
+        # The wrapper logs every archiver run, members are then read back from the archive itself
+        self.__WriteSteps({ "lib": self.__GetStep("libu.a", "archive", "lib") })
+        self.__Write("lib/a.c", "int A(void) { return 1; }\n")
+        self.__Write("lib/b.c", "int B(void) { return 2; }\n")
+        arPath = shutil.which("ar")
+        self.__Write("wrapper/ar", f"#!/bin/sh\necho \"$*\" >> '{self.projectRoot / 'ar.log'}'\nexec {arPath} \"$@\"\n")
+        os.chmod(self.projectRoot / "wrapper/ar", 0o755)
+        archivePath = self.projectRoot / "out/bin/debug/libu.a"
+
+        def Build():
+            (self.projectRoot / "ar.log").write_text("")
+            status = self.__Build()
+            members = subprocess.run([arPath, "t", archivePath], stdout = subprocess.PIPE, text = True, check = True).stdout.split()
+            return (status, (self.projectRoot / "ar.log").read_text().splitlines(), sorted(Path(m).name for m in members))
+
+        with mock.patch.dict(os.environ, { "PATH": f"{self.projectRoot / 'wrapper'}{os.pathsep}{os.environ['PATH']}" }):
+            self.assertEqual(Build()[2], ["a.o", "b.o"])
+
+            self.__Write("lib/a.c", "int A(void) { return 11; }\n")
+            status, runs, members = Build()
+            self.assertEqual((status, members), (StepStatus.BUILT, ["a.o", "b.o"]))
+            self.assertEqual(runs, ["rcsP out/bin/debug/libu.a out/obj/debug/lib/a.o"])
+
+            (self.projectRoot / "lib/b.c").unlink()
+            status, runs, members = Build()
+            self.assertEqual((status, members), (StepStatus.BUILT, ["a.o"]))
+            self.assertEqual(runs, ["dsP out/bin/debug/libu.a out/obj/debug/lib/b.o"])
+
+            self.assertEqual(Build()[:2], (StepStatus.UP_TO_DATE, []))
+
+    def test_HeaderOutsideStepDirectoriesIsTracked(self):
+        # shared/ is neither a source nor an include directory of the step, main.c only reaches it through a relative include
+        self.__Write("shared/val.h", "#define VALUE 1\n")
+        self.__Write("src/main.c", "#include \"../shared/val.h\"\nint main(void) { return VALUE - 1; }\n")
+        self.assertEqual(self.__Build(), StepStatus.BUILT)
+        self.assertEqual(self.__Build(), StepStatus.UP_TO_DATE)
+
+        self.__Write("shared/val.h", "#define VALUE 12\n")
+        self.assertEqual(self.__Build(), StepStatus.BUILT)
+        self.assertEqual(self.__Build(), StepStatus.UP_TO_DATE)
+
+    def test_LaterStepIsOnlyLinkedAgain(self):
+        # The app step follows the stale library step, its own unit did not change and keeps its object
+        self.__WriteSteps({ "lib": self.__GetStep("libu.a", "archive", "lib"), "app": self.__GetStep("app", "standalone", "app") })
+        self.__Write("lib/util.c", "int Util(void) { return 1; }\n")
+        self.__Write("app/main.c", "int main(void) { return 0; }\n")
+        self.assertEqual(self.__BuildSteps(), [StepStatus.BUILT, StepStatus.BUILT])
+        mainTime = self.__GetModifiedTime("out/obj/debug/app/main.o")
+        utilTime = self.__GetModifiedTime("out/obj/debug/lib/util.o")
+
+        self.__Write("lib/util.c", "int Util(void) { return 2; }\n")
+        self.assertEqual(self.__BuildSteps(), [StepStatus.BUILT, StepStatus.BUILT])
+        self.assertEqual(self.__GetModifiedTime("out/obj/debug/app/main.o"), mainTime)
+        self.assertNotEqual(self.__GetModifiedTime("out/obj/debug/lib/util.o"), utilTime)
+        self.assertEqual(self.__BuildSteps(), [StepStatus.UP_TO_DATE, StepStatus.UP_TO_DATE])
+
+    def test_OnlyChangedUnitsOfStaleStepAreCompiled(self):
+        self.__Write("src/a.c", "int A(void) { return 1; }\n")
+        self.__Write("src/main.c", "int main(void) { return 0; }\n")
+        self.assertEqual(self.__Build(), StepStatus.BUILT)
+        mainTime = self.__GetModifiedTime("out/obj/debug/src/main.o")
+
+        self.__Write("src/a.c", "int A(void) { return 22; }\n")
+        self.assertEqual(self.__Build(), StepStatus.BUILT)
+        self.assertEqual(self.__GetModifiedTime("out/obj/debug/src/main.o"), mainTime)
+
+    def test_HeaderEditedDuringBuildIsBuiltAgain(self):
+        # The compiler reads the old header, the wrapper edits it once the first compile finished
+        self.__Write("src/val.h", "#define VALUE 1\n")
+        self.__Write("src/main.c", "#include \"val.h\"\nint main(void) { return VALUE - 1; }\n")
+        self.__Write("wrapper/edit", "#define VALUE 123\n")
+        self.__Write("wrapper/gcc", "\n".join([
+            "#!/bin/sh",
+            f"{shutil.which('gcc')} \"$@\" || exit",
+            "case \" $* \" in *\" -c \"*) ;; *) exit ;; esac",
+            f"if [ -f '{self.projectRoot / 'wrapper/edit'}' ]; then mv '{self.projectRoot / 'wrapper/edit'}' '{self.projectRoot / 'src/val.h'}'; fi",
+            ""
+        ]))
+        os.chmod(self.projectRoot / "wrapper/gcc", 0o755)
+        with mock.patch.dict(os.environ, { "PATH": f"{self.projectRoot / 'wrapper'}{os.pathsep}{os.environ['PATH']}" }):
+            self.assertEqual(self.__Build(), StepStatus.BUILT)
+            self.assertEqual((self.projectRoot / "src/val.h").read_text(), "#define VALUE 123\n")
+            self.assertEqual(self.__Build(), StepStatus.BUILT)
+            self.assertEqual(self.__Build(), StepStatus.UP_TO_DATE)
@@ -0,0 +1,45 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import unittest
+
+from ..constants import ReservedValues
+from ..core.diagnostics import DiagnosticParser, Severity
+
+Toolchain = ReservedValues.Configuration.Root.Toolchain
+
+class DiagnosticParserTests(unittest.TestCase):
+    def __Match(self, toolchain: str, line: str):
+        diagnostic = DiagnosticParser(toolchain).Match(line)
+        self.assertIsNotNone(diagnostic)
+        return diagnostic.GetKey()
+
+    def test_GnuDiagnostics(self):
+        for toolchain in (Toolchain.GCC, Toolchain.CLANG):
+            self.assertEqual(self.__Match(toolchain, "src/main.c:12:5: warning: unused variable 'x' [-Wunused-variable]"),
+                ("src/main.c", 12, 5, Severity.WARNING, "-Wunused-variable", "unused variable 'x'"))
+            self.assertEqual(self.__Match(toolchain, "src/main.c:3: fatal error: val.h: No such file or directory"),
+                ("src/main.c", 3, None, Severity.ERROR, None, "val.h: No such file or directory"))
+            self.assertEqual(self.__Match(toolchain, "collect2: error: ld returned 1 exit status"),
+                ("collect2", None, None, Severity.ERROR, None, "ld returned 1 exit status"))
+
+    def test_MsvcDiagnostics(self):
+        self.assertEqual(self.__Match(Toolchain.MSVC, "src\\main.c(12,5): warning C4996: 'strcpy': This function or variable may be unsafe"),
+            ("src\\main.c", 12, 5, Severity.WARNING, "C4996", "'strcpy': This function or variable may be unsafe"))
+        self.assertEqual(self.__Match(Toolchain.MSVC, "LINK : fatal error LNK1104: cannot open file 'foo.lib'"),
+            ("LINK", None, None, Severity.ERROR, "LNK1104", "cannot open file 'foo.lib'"))
+
+    def test_OtherLinesAreNotDiagnostics(self):
+        self.assertIsNone(DiagnosticParser(Toolchain.GCC).Match("   12 |     int x;"))
+        self.assertIsNone(DiagnosticParser(Toolchain.MSVC).Match("src/main.c:12:5: warning: unused variable 'x'"))
+
+    def test_RepeatedDiagnosticIsSuppressedWithItsContext(self):
+        # A header included by two units warns in both, the second unit only counts it
+        parser = DiagnosticParser(Toolchain.GCC)
+        lines = ["src/val.h:2:5: warning: unused variable 'x' [-Wunused-variable]", "    2 |     int x;", "src/val.h:1:1: note: declared here"]
+        self.assertEqual([isShown for _, isShown in map(parser.BeginUnit().Feed, lines)], [True, True, True])
+        self.assertEqual([isShown for _, isShown in map(parser.BeginUnit().Feed, lines)], [False, False, False])
+        self.assertEqual(parser.GetSummary(), "0 error(s), 1 warning(s), 1 repeated diagnostic(s) suppressed")
@@ -0,0 +1,69 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+
+from ..core.discovery import GlobPattern, SourceDiscovery
+
+class GlobPatternTests(unittest.TestCase):
+    def test_StarStopsAtSeparator(self):
+        self.assertTrue(GlobPattern("*.c").Match("main.c"))
+        self.assertFalse(GlobPattern("*.c").Match("util/util.c"))
+        self.assertFalse(GlobPattern("*.c").isRecursive)
+
+    def test_DoubleStarCrossesSeparators(self):
+        pattern = GlobPattern("**/*.c")
+        self.assertTrue(pattern.isRecursive)
+        for path in ("main.c", "util/util.c", "a/b/c.c"):
+            self.assertTrue(pattern.Match(path))
+        self.assertFalse(pattern.Match("util/util.h"))
+
+    def test_CharacterClasses(self):
+        self.assertTrue(GlobPattern("[!t]*.c").Match("main.c"))
+        self.assertFalse(GlobPattern("[!t]*.c").Match("test.c"))
+        self.assertTrue(GlobPattern("file?.c").Match("file1.c"))
+
+class SourceDiscoveryTests(unittest.TestCase):
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.baseDir, True)
+        self.cachePath = self.baseDir / "state/dircache.json"
+        for filePath in ("src/main.c", "src/util/util.c", "src/util/util.h", "src/tests/test.c"):
+            self.__Touch(filePath)
+
+    def __Touch(self, filePath: str):
+        (self.baseDir / filePath).parent.mkdir(parents = True, exist_ok = True)
+        (self.baseDir / filePath).touch()
+
+    def __Discover(self, includePatterns: list[str], excludePatterns: list[str]):
+        discovery = SourceDiscovery(self.baseDir)
+        discovery.Load(self.cachePath)
+        sourceFiles = discovery.Discover(Path("src"), includePatterns, excludePatterns)
+        discovery.Save(self.cachePath)
+        return (sorted(f.as_posix() for f in sourceFiles), discovery)
+
+    def test_ExcludedDirectoryIsNotEntered(self):
+        sourceFiles, discovery = self.__Discover(["**/*.c"], ["tests"])
+        self.assertEqual(sourceFiles, ["src/main.c", "src/util/util.c"])
+        self.assertNotIn(os.path.join("src", "tests"), discovery.GetVisitedDirectories())
+
+    def test_ListingIsReusedUntilDirectoryChanges(self):
+        self.__Discover(["**/*.c"], [])
+        sourceFiles, discovery = self.__Discover(["**/*.c"], [])
+        self.assertEqual((discovery.listedCount, discovery.cachedCount), (0, 3))
+
+        # Adding a file changes the mtime of its directory, only that directory is listed again
+        self.__Touch("src/util/extra.c")
+        utilDir = self.baseDir / "src/util"
+        dirTime = utilDir.stat().st_mtime_ns + 1000000000
+        os.utime(utilDir, ns = (dirTime, dirTime))
+        sourceFiles, discovery = self.__Discover(["**/*.c"], [])
+        self.assertEqual(sourceFiles, ["src/main.c", "src/tests/test.c", "src/util/extra.c", "src/util/util.c"])
+        self.assertEqual((discovery.listedCount, discovery.cachedCount), (1, 2))
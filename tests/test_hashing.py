@@ -0,0 +1,23 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import unittest
+
+from ..core.hashing import CommandHasher
+
+class CommandHasherTests(unittest.TestCase):
+    def test_ProjectRootIsIndependentOfCheckout(self):
+        command = ["gcc", "-c", "-ffile-prefix-map=/src/app=.", "-I/src/app/include", "-o", "out/a.o", "/src/app"]
+        otherCommand = ["gcc", "-c", "-ffile-prefix-map=/home/ci/app=.", "-I/home/ci/app/include", "-o", "out/a.o", "/home/ci/app"]
+        self.assertEqual(CommandHasher("/src/app").Hash(command), CommandHasher("/home/ci/app").Hash(otherCommand))
+
+    def test_SiblingSharingPrefixIsKept(self):
+        # /src/app2 and /src/application are other directories, replacing the root in them would make them hash the same
+        # as /home/ci/app2 and /home/ci/application in another checkout
+        for sibling in ("app2/include", "application"):
+            command = ["gcc", f"-I/src/{sibling}"]
+            otherCommand = ["gcc", f"-I/home/ci/{sibling}"]
+            self.assertNotEqual(CommandHasher("/src/app").Hash(command), CommandHasher("/home/ci/app").Hash(otherCommand))
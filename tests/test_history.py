@@ -0,0 +1,65 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..constants import ResultCode
+from ..core.history import BuildHistory, BuildRecord
+
+class BuildHistoryTests(unittest.TestCase):
+    THRESHOLD     = 0.2
+    BASELINE_SIZE = 10
+
+    def setUp(self):
+        stateDir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, stateDir, True)
+        self.history = BuildHistory()
+        self.assertEqual(self.history.Open(stateDir / "history.db"), ResultCode.SUCCESS)
+        self.addCleanup(self.history.Close)
+
+    def __Record(self, duration: float, buildName: str = "debug"):
+        record = BuildRecord(buildName, 0.0, duration, 1, ResultCode.SUCCESS)
+        record.AddStep("app", "built", duration, 0.1)
+        record.AddUnit("app", "compile", "out/obj/debug/src/main.o", duration, duration, None, ResultCode.SUCCESS)
+        self.assertEqual(self.history.Record(record), ResultCode.SUCCESS)
+
+    def __FindRegressions(self):
+        return [(r.kind, r.name) for r in self.history.FindRegressions("debug", self.THRESHOLD, self.BASELINE_SIZE)]
+
+    def test_SlowerThanThresholdIsRegression(self):
+        for duration in (1.0, 0.9, 1.1, 1.3):
+            self.__Record(duration)
+        self.assertEqual(self.__FindRegressions(), [("step", "app"), ("unit", "out/obj/debug/src/main.o")])
+
+        self.__Record(1.15)
+        self.assertEqual(self.__FindRegressions(), [])
+
+    def test_BaselineNeedsEnoughRuns(self):
+        for duration in (1.0, 1.0, 2.0):
+            self.__Record(duration)
+        self.assertEqual(self.__FindRegressions(), [])
+
+    def test_SmallAbsoluteIncreaseIsNoise(self):
+        # 40% slower, but only by 4ms
+        for duration in (0.01, 0.01, 0.01, 0.014):
+            self.__Record(duration)
+        self.assertEqual(self.__FindRegressions(), [])
+
+    def test_OtherConfigurationIsNotBaseline(self):
+        for duration in (1.0, 1.0, 1.0):
+            self.__Record(duration, "release")
+        self.__Record(2.0)
+        self.assertEqual(self.__FindRegressions(), [])
+
+    def test_OldestBuildsAreDropped(self):
+        with mock.patch.object(BuildHistory, "MAX_BUILDS", 2):
+            for duration in (1.0, 2.0, 3.0):
+                self.__Record(duration)
+        self.assertEqual([row[2] for row in self.history.GetBuilds("debug", 10)], [3.0, 2.0])
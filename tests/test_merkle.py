@@ -0,0 +1,61 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..core.discovery import SourceDiscovery
+from ..core.hashing import FileHasher
+from ..core.merkle import MerkleTree
+
+class MerkleTreeTests(unittest.TestCase):
+    def setUp(self):
+        self.baseDir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.baseDir, True)
+        self.cachePath = self.baseDir / "state/treecache.json"
+        self.__Write("src/main.c", "int main(void) { return 0; }\n")
+        self.__Write("src/util/util.c", "int Util(void) { return 1; }\n")
+
+    def __Write(self, filePath: str, content: str):
+        (self.baseDir / filePath).parent.mkdir(parents = True, exist_ok = True)
+        (self.baseDir / filePath).write_text(content)
+
+    def __GetTree(self):
+        hasher = mock.Mock(wraps = FileHasher(self.baseDir))
+        tree = MerkleTree(SourceDiscovery(self.baseDir), hasher, ["state"])
+        tree.Load(self.cachePath)
+        return tree, hasher
+
+    def __Hash(self, dir: str):
+        tree, hasher = self.__GetTree()
+        dirHash = tree.GetDirectoryHash(dir)
+        tree.Save(self.cachePath)
+        return dirHash, tree, hasher
+
+    def test_UnchangedTreeReusesSavedHashes(self):
+        dirHash, _, _ = self.__Hash("src")
+        reusedHash, tree, hasher = self.__Hash("src")
+        self.assertEqual(reusedHash, dirHash)
+        self.assertEqual(tree.reusedCount, 2)
+        hasher.Hash.assert_not_called()
+
+    def test_FileEditedInPlaceChangesHash(self):
+        # Rewriting a file leaves the directory mtime alone, the file's own stat still shows the change
+        dirHash, _, _ = self.__Hash("src")
+        utilDir = self.baseDir / "src/util"
+        dirTime = utilDir.stat().st_mtime_ns
+        self.__Write("src/util/util.c", "int Util(void) { return 22; }\n")
+        os.utime(utilDir, ns = (dirTime, dirTime))
+
+        changedHash, tree, hasher = self.__Hash("src")
+        self.assertNotEqual(changedHash, dirHash)
+        self.assertEqual(tree.reusedCount, 0)
+        hasher.Hash.assert_called_once_with(os.path.join("src", "util", "util.c"))
+        self.assertEqual(self.__Hash("src")[0], changedHash)
@@ -0,0 +1,15 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import unittest
+
+from ..core.ninja import NinjaWriter
+
+class NinjaWriterTests(unittest.TestCase):
+    def test_ImplicitOutputsAreListedAfterOutputs(self):
+        writer = NinjaWriter()
+        writer.Build(["out/a.o"], "compile", ["src/a.c"], variables = { "cmd": "gcc" }, implicitOutputs = ["out/pdb/a.dwo"])
+        self.assertEqual(writer.GetContent(), "build out/a.o | out/pdb/a.dwo: compile src/a.c\n  cmd = gcc\n\n")
@@ -0,0 +1,74 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import contextlib
+import io
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..services.output import OutputService
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+class OutputServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.logDir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.logDir, True)
+
+    def __Send(self, isResultOnly: bool):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            output = OutputService(self.logDir / "zbuild.log", isResultOnly = isResultOnly)
+            output.SendInfo("Running on Python")
+            output.SendInfoPrintOnly("Logging to file")
+            output.SendResult("Translation units:")
+            output.Close()
+
+        return (stdout.getvalue(), stderr.getvalue())
+
+    def test_ResultOnlyKeepsMessagesOffStdout(self):
+        stdout, stderr = self.__Send(True)
+        self.assertEqual(stdout, "Translation units:\n")
+        self.assertIn("Running on Python", stderr)
+        self.assertIn("Logging to file", stderr)
+        self.assertIn("Running on Python", (self.logDir / "zbuild.log").read_text())
+
+    def test_MessagesGoToStdoutByDefault(self):
+        stdout, stderr = self.__Send(False)
+        self.assertIn("Running on Python", stdout)
+        self.assertIn("Translation units:", stdout)
+        self.assertEqual(stderr, "")
+
+    def test_MessagesArePrintedAboveProgress(self):
+        stdout = Terminal()
+        with contextlib.redirect_stdout(stdout), mock.patch.dict(os.environ, { "TERM": "xterm" }):
+            output = OutputService(self.logDir / "zbuild.log")
+            output.SetProgress("[1/2] 50%")
+            output.SendInfoPrintOnly("Linking")
+            output.ClearProgress()
+            output.Close()
+
+        self.assertTrue(output.isProgressEnabled)
+        lines = stdout.getvalue().split("\r\033[K")
+        self.assertEqual(lines[:2] + lines[3:], ["", "[1/2] 50%", "[1/2] 50%", ""])
+        self.assertTrue(lines[2].endswith("] Linking\n"))
+
+    def test_ProgressNeedsCapableTerminal(self):
+        for stdout, term in ((io.StringIO(), "xterm"), (Terminal(), "dumb")):
+            with contextlib.redirect_stdout(stdout), mock.patch.dict(os.environ, { "TERM": term }):
+                output = OutputService(self.logDir / "zbuild.log")
+                output.SetProgress("[1/2] 50%")
+                output.Close()
+
+            self.assertFalse(output.isProgressEnabled)
+            self.assertEqual(stdout.getvalue(), "")
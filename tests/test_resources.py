@@ -0,0 +1,63 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+from ..core.resources import ResourceMonitor, ResourceUsage
+
+class ResourceMonitorTests(unittest.TestCase):
+    MEGABYTE = 1000 * 1000
+
+    def setUp(self):
+        fd, meminfoPath = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, meminfoPath)
+        Path(meminfoPath).write_text("MemTotal:        1000000 kB\nMemAvailable:     600000 kB\n")
+        patcher = mock.patch.object(ResourceMonitor, "MEMINFO_PATH", Path(meminfoPath))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_MemoryKeepsReserveFree(self):
+        # 614 MB are available and 268 MB of them are reserved
+        monitor = ResourceMonitor()
+        self.assertEqual(monitor.reservedMemory, ResourceMonitor.MIN_RESERVED_MEMORY)
+        self.assertTrue(monitor.HasMemoryFor(300 * self.MEGABYTE, []))
+        self.assertFalse(monitor.HasMemoryFor(400 * self.MEGABYTE, []))
+
+    def test_RunningJobsClaimTheirRemainingGrowth(self):
+        monitor = ResourceMonitor()
+        now = time.perf_counter()
+        self.assertFalse(monitor.HasMemoryFor(300 * self.MEGABYTE, [(now, 10.0, 100 * self.MEGABYTE)]))
+        self.assertTrue(monitor.HasMemoryFor(300 * self.MEGABYTE, [(now - 10.0, 10.0, 100 * self.MEGABYTE)]))
+
+    def test_LoadAboveLimitIsOverloaded(self):
+        monitor = ResourceMonitor(4.0)
+        with mock.patch.object(os, "getloadavg", return_value = (5.0, 1.0, 1.0)):
+            self.assertTrue(monitor.IsOverloaded())
+        with mock.patch.object(os, "getloadavg", return_value = (3.0, 8.0, 8.0)):
+            self.assertFalse(monitor.IsOverloaded())
+
+class ResourceUsageTests(unittest.TestCase):
+    def __GetUsage(self, userTime: float, maxRss: int):
+        return ResourceUsage.FromRusage(types.SimpleNamespace(
+            ru_utime = userTime, ru_stime = 0.5, ru_maxrss = maxRss, ru_inblock = 8, ru_oublock = 16, ru_nvcsw = 3, ru_nivcsw = 1
+        ))
+
+    @unittest.skipIf(sys.platform == "darwin", "ru_maxrss is in bytes on macOS")
+    def test_PeakIsLargestAndTimesAreSummed(self):
+        total = ResourceUsage()
+        total.Add(self.__GetUsage(1.0, 2048))
+        total.Add(self.__GetUsage(2.0, 1024))
+        self.assertEqual((total.processCount, total.cpuTime, total.peakMemory), (2, 4.0, 2048 * 1024))
+        self.assertEqual((total.blockInputs, total.blockOutputs, total.voluntarySwitches, total.involuntarySwitches), (16, 32, 6, 2))
+        self.assertEqual(total.GetSummary(), "3.00s user, 1.00s system, peak RSS 2.0 MiB, 16/32 blocks in/out, 6/2 voluntary/involuntary switches")
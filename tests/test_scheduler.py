@@ -0,0 +1,164 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import threading
+import unittest
+
+from ..constants import ResultCode
+from ..core.jobstats import JobStat, JobStatsDatabase
+from ..core.scheduler import FailureMode, Job, JobScheduler, JobType
+
+class MemoryMonitor:
+    # Admits jobs estimated below the limit, or any job while nothing else runs
+    LIMIT = 100.0
+
+    def IsOverloaded(self):
+        return False
+
+    def HasMemoryFor(self, estimatedPeakMemory: float, running: list[tuple[float, float, float]]):
+        return estimatedPeakMemory < self.LIMIT
+
+class JobSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.executed: list[str] = []
+        self.lock = threading.Lock()
+
+    def Execute(self, job: Job):
+        # Slow jobs finish after the jobs planned behind them have been taken in
+        if job.outputPath.startswith("slow"):
+            threading.Event().wait(0.6)
+        with self.lock:
+            self.executed.append(job.outputPath)
+        return ResultCode.WRN_PROC_NONZERO_EXIT if job.outputPath.startswith("bad") else ResultCode.SUCCESS
+
+    def test_KeepGoingSkipsDependentsOfFailedCompile(self):
+        bad = Job(JobType.COMPILE, [], "bad.o", "core")
+        good = Job(JobType.COMPILE, [], "good.o", "core")
+        archive = Job(JobType.ARCHIVE, [], "libcore.a", "core", [bad, good])
+        other = Job(JobType.COMPILE, [], "main.o", "app")
+        link = Job(JobType.LINK, [], "app", "app", [other, archive])
+
+        scheduler = JobScheduler(2, JobStatsDatabase(), self.Execute, failureMode = FailureMode.KEEP_GOING)
+        resultCode = scheduler.Run([bad, good, archive, other, link])
+
+        self.assertEqual(resultCode, ResultCode.WRN_PROC_NONZERO_EXIT)
+        self.assertCountEqual(self.executed, ["bad.o", "good.o", "main.o"])
+        self.assertTrue(archive.isSkipped and link.isSkipped)
+        self.assertIsNone(archive.resultCode)
+        self.assertEqual(scheduler.skippedCount, 2)
+
+    def test_KeepGoingSkipsDependentsArrivingAfterFailure(self):
+        # The archive and link are only planned once the failed compile has finished, the other compile finishes after that
+        bad = Job(JobType.COMPILE, [], "bad.o", "core")
+        slow = Job(JobType.COMPILE, [], "slow.o", "core")
+        archive = Job(JobType.ARCHIVE, [], "libcore.a", "core", [bad, slow])
+        link = Job(JobType.LINK, [], "app", "app", [archive])
+
+        def Batches():
+            yield [bad, slow]
+            while bad.resultCode is None:
+                threading.Event().wait(0.01)
+            yield [archive]
+            yield [link]
+
+        scheduler = JobScheduler(2, JobStatsDatabase(), self.Execute, failureMode = FailureMode.KEEP_GOING)
+        resultCode = scheduler.RunStreaming(Batches())
+
+        self.assertEqual(resultCode, ResultCode.WRN_PROC_NONZERO_EXIT)
+        self.assertCountEqual(self.executed, ["bad.o", "slow.o"])
+        self.assertTrue(archive.isSkipped and link.isSkipped)
+
+    def test_CompileFeedingLongChainGoesFirst(self):
+        # The chain is planned while both compiles are queued behind a running job, only then is it known that
+        # the shorter compile starts the longer path
+        stats = JobStatsDatabase()
+        for key, duration in (("compile:blocker.o", 5.0), ("compile:a.o", 1.0), ("compile:b.o", 2.0), ("link:lib1", 10.0), ("link:lib2", 10.0)):
+            stats.Record(key, JobStat.DURATION, duration)
+
+        started = threading.Event()
+        release = threading.Event()
+        def Execute(job: Job):
+            if job.outputPath == "blocker.o":
+                started.set()
+                release.wait()
+            with self.lock:
+                self.executed.append(job.outputPath)
+            return ResultCode.SUCCESS
+
+        blocker = Job(JobType.COMPILE, [], "blocker.o", "core")
+        a = Job(JobType.COMPILE, [], "a.o", "core")
+        b = Job(JobType.COMPILE, [], "b.o", "core")
+        def Batches():
+            yield [blocker, a, b]
+            started.wait()
+            lib1 = Job(JobType.LINK, [], "lib1", "core", [a])
+            yield [lib1, Job(JobType.LINK, [], "lib2", "core", [lib1])]
+            release.set()
+
+        resultCode = JobScheduler(1, stats, Execute).RunStreaming(Batches())
+
+        self.assertEqual(resultCode, ResultCode.SUCCESS)
+        self.assertEqual(self.executed, ["blocker.o", "a.o", "lib1", "lib2", "b.o"])
+        self.assertEqual(a.priority, 21.0)
+
+    def test_HeavyJobWaitsWhileLighterOneStarts(self):
+        # The heavy compile is first in the queue but only fits once the blocker finished
+        stats = JobStatsDatabase()
+        for name, duration, peakMemory in (("blocker.o", 3.0, 1.0), ("heavy.o", 2.0, 1000.0), ("light.o", 1.0, 1.0)):
+            stats.Record(f"compile:{name}", JobStat.DURATION, duration)
+            stats.Record(f"compile:{name}", JobStat.PEAK_MEMORY, peakMemory)
+
+        started = []
+        def Execute(job: Job):
+            with self.lock:
+                started.append(job.outputPath)
+            if job.outputPath == "blocker.o":
+                threading.Event().wait(0.3)
+            return ResultCode.SUCCESS
+
+        scheduler = JobScheduler(3, stats, Execute, MemoryMonitor())
+        resultCode = scheduler.Run([Job(JobType.COMPILE, [], f"{name}.o", "core") for name in ("blocker", "heavy", "light")])
+
+        self.assertEqual(resultCode, ResultCode.SUCCESS)
+        self.assertEqual(started, ["blocker.o", "light.o", "heavy.o"])
+        self.assertGreater(scheduler.heldForMemoryCount, 0)
+
+    def test_ProgressCountsFinishedJobs(self):
+        reports = []
+        def Progress(finishedCount: int, totalCount: int, running: list[Job], remainingTime: float):
+            reports.append((finishedCount, totalCount, remainingTime))
+
+        compile = Job(JobType.COMPILE, [], "a.o", "core")
+        link = Job(JobType.LINK, [], "app", "core", [compile])
+        resultCode = JobScheduler(1, JobStatsDatabase(), self.Execute, progress = Progress).Run([compile, link])
+
+        self.assertEqual(resultCode, ResultCode.SUCCESS)
+        self.assertEqual([r[0] for r in reports], sorted(r[0] for r in reports))
+        self.assertEqual(reports[-1], (2, 2, 0.0))
+
+    def test_JobHoldingEverySlotRunsAlone(self):
+        # The LTO link is next in the queue once the slow compile started, the compile behind it waits with it
+        stats = JobStatsDatabase()
+        for key, duration in (("compile:slow.o", 3.0), ("link:app", 2.0), ("compile:c.o", 1.0)):
+            stats.Record(key, JobStat.DURATION, duration)
+
+        active = []
+        overlaps = {}
+        def Execute(job: Job):
+            with self.lock:
+                overlaps[job.outputPath] = list(active)
+                active.append(job.outputPath)
+            threading.Event().wait(0.3 if job.outputPath == "slow.o" else 0.05)
+            with self.lock:
+                active.remove(job.outputPath)
+            return ResultCode.SUCCESS
+
+        link = Job(JobType.LINK, [], "app", "app")
+        link.slots = 2
+        resultCode = JobScheduler(2, stats, Execute).Run([Job(JobType.COMPILE, [], "slow.o", "core"), link, Job(JobType.COMPILE, [], "c.o", "core")])
+
+        self.assertEqual(resultCode, ResultCode.SUCCESS)
+        self.assertEqual(overlaps, { "slow.o": [], "app": [], "c.o": [] })
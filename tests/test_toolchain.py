@@ -0,0 +1,84 @@
+'''
+Copyright (C) 2021 Tayler Mauk and contributors. All rights reserved.
+Licensed under the MIT license.
+See LICENSE file in the project root for full license information.
+'''
+
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..core.toolchain import ToolchainInfo, ToolchainProbe
+
+class ToolchainInfoTests(unittest.TestCase):
+    VERSION = "gcc version 12.2.0 (GCC)"
+    TARGET  = "x86_64-linux-gnu"
+
+    def __GetInfo(self, prefix: str):
+        return ToolchainInfo(f"{prefix}/bin/gcc-12", self.VERSION, self.TARGET, [
+            f"{prefix}/lib/gcc/x86_64-linux-gnu/12/include",
+            f"{prefix}/lib/gcc/x86_64-linux-gnu/12/include-fixed",
+            "/usr/include"
+        ])
+
+    def test_IdentityIgnoresInstallPrefix(self):
+        self.assertEqual(self.__GetInfo("/opt/gcc-12").GetIdentity(), self.__GetInfo("/home/ci/toolchains/gcc-12").GetIdentity())
+
+    def test_IdentityKeepsDirectoriesOutsidePrefix(self):
+        info = self.__GetInfo("/opt/gcc-12")
+        otherInfo = self.__GetInfo("/opt/gcc-12")
+        otherInfo.systemIncludeDirectories[-1] = "/usr/local/include"
+        self.assertNotEqual(info.GetIdentity(), otherInfo.GetIdentity())
+
+    def test_InstallPrefix(self):
+        self.assertEqual(str(ToolchainInfo("/usr/bin/gcc-12", "", "", []).GetInstallPrefix()), "/usr")
+        self.assertEqual(str(ToolchainInfo("/opt/cc/gcc", "", "", []).GetInstallPrefix()), "/opt/cc")
+
+@unittest.skipIf(shutil.which("sh") is None, "sh is not installed")
+class ToolchainProbeTests(unittest.TestCase):
+    def setUp(self):
+        self.binDir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.binDir, True)
+        self.cachePath = self.binDir / "toolchain.json"
+        compilerPath = self.binDir / "fakecc"
+        compilerPath.write_text("\n".join([
+            "#!/bin/sh",
+            "echo 'Target: x86_64-linux-gnu' >&2",
+            "echo 'gcc version 12.2.0 (GCC)' >&2",
+            "echo '#include <...> search starts here:' >&2",
+            "echo ' /usr/include' >&2",
+            "echo 'End of search list.' >&2",
+            ""
+        ]))
+        os.chmod(compilerPath, 0o755)
+        patcher = mock.patch.dict(os.environ, { "PATH": f"{self.binDir}{os.pathsep}{os.environ['PATH']}" })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop("CPATH", None)
+
+    def __Probe(self):
+        probe = ToolchainProbe()
+        probe.Load(self.cachePath)
+        info = probe.Probe("fakecc")
+        probe.Save(self.cachePath)
+        return (info, probe.probedCount)
+
+    def test_ProbeIsParsedAndCached(self):
+        info, probedCount = self.__Probe()
+        self.assertEqual((info.version, info.target, info.systemIncludeDirectories), ("gcc version 12.2.0 (GCC)", "x86_64-linux-gnu", ["/usr/include"]))
+        self.assertEqual(probedCount, 1)
+        self.assertEqual(self.__Probe()[1], 0)
+
+    def test_EnvironmentAndBinaryAreInKey(self):
+        self.__Probe()
+        os.environ["CPATH"] = "/opt/include"
+        self.assertEqual(self.__Probe()[1], 1)
+        self.assertEqual(self.__Probe()[1], 0)
+
+        # An upgrade replaces the binary, its size or mtime changes with it
+        with open(self.binDir / "fakecc", "a") as f:
+            f.write("exit 0\n")
+        self.assertEqual(self.__Probe()[1], 1)